@@ -0,0 +1,169 @@
+import argparse
+import json
+import platform
+import re
+import statistics
+import sys
+import time
+
+
+def measure(function, min_time=0.2, repeat=5):
+    """Time a function, calling it in loops long enough to measure accurately
+
+    :param function: the function to time, called with no arguments
+    :type function: function() -> object
+    :param min_time: the least time for each timed loop, in seconds
+    :type min_time: float
+    :param repeat: the number of timed loops
+    :type repeat: int
+    :return: the number of calls per loop and the seconds per call of each loop
+    :rtype: tuple(int, list(float))
+    """
+    perf_counter = time.perf_counter
+    # Find a loop length that takes at least min_time
+    iterations = 1
+    while True:
+        start_time = perf_counter()
+        for _ in range(iterations):
+            function()
+        elapsed = perf_counter() - start_time
+        if elapsed >= min_time:
+            break
+        iterations *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed * 1.2)))
+    timings = []
+    for _ in range(repeat):
+        start_time = perf_counter()
+        for _ in range(iterations):
+            function()
+        timings.append((perf_counter() - start_time) / iterations)
+    return iterations, timings
+
+
+class BenchmarkResults:
+    """Timings of named benchmarks, with the environment they were run in"""
+
+    def __init__(self, suite):
+        self.suite = suite
+        self.results = {}
+        self.metadata = {
+            "suite": suite,
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")
+        }
+
+    def add_timing(self, name, iterations, timings):
+        self.results[name] = {
+            "iterations": iterations,
+            "min_seconds": min(timings),
+            "median_seconds": statistics.median(timings),
+            "mean_seconds": statistics.mean(timings),
+            "stdev_seconds": statistics.stdev(timings) if len(timings) > 1 else 0.0
+        }
+
+    def add_value(self, name, value, unit, higher_is_better=True):
+        self.results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+    def to_dict(self):
+        return {"metadata": self.metadata, "results": self.results}
+
+    def write_json(self, filename):
+        with open(filename, "w") as output_file:
+            json.dump(self.to_dict(), output_file, indent=2, sort_keys=True)
+
+
+def _get_score(result):
+    # A number where lower is better, so that every benchmark compares the same way. The fastest loop is the least
+    # affected by other processes, so timings are compared by their minimum.
+    if "min_seconds" in result:
+        return result["min_seconds"]
+    if result.get("higher_is_better", True):
+        return 1 / result["value"] if result["value"] else float("inf")
+    return result["value"]
+
+
+def compare_results(results, baseline, threshold=0.1):
+    """Compare results against a baseline, as produced by BenchmarkResults.to_dict
+
+    :param results: the new results
+    :type results: dict
+    :param baseline: the baseline results
+    :type baseline: dict
+    :param threshold: the fractional change which counts as a regression or an improvement
+    :type threshold: float
+    :return: for each benchmark in both, its name, the ratio of new to baseline cost, and "regression",
+        "improvement" or "unchanged"
+    :rtype: list(tuple(str, float, str))
+    """
+    comparisons = []
+    for name, result in sorted(results["results"].items()):
+        baseline_result = baseline["results"].get(name)
+        if baseline_result is None:
+            continue
+        baseline_score = _get_score(baseline_result)
+        ratio = _get_score(result) / baseline_score if baseline_score else float("inf")
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "improvement"
+        else:
+            status = "unchanged"
+        comparisons.append((name, ratio, status))
+    return comparisons
+
+
+def format_result(name, result):
+    if "median_seconds" in result:
+        seconds = result["median_seconds"]
+        if seconds < 1e-3:
+            return "{:<60} {:>10.2f} us".format(name, seconds * 1e6)
+        return "{:<60} {:>10.2f} ms".format(name, seconds * 1e3)
+    return "{:<60} {:>10.4g} {}".format(name, result["value"], result["unit"])
+
+
+def run_main(suite, run_benchmarks, description, add_arguments=None):
+    """Run a benchmark suite from the command line
+
+    :param suite: the name of the suite
+    :type suite: str
+    :param run_benchmarks: runs the benchmarks whose names match the filter, adding them to the results
+    :type run_benchmarks: function(results: BenchmarkResults, args: argparse.Namespace, selected: function(str) -> bool) -> None
+    :param description: the description for --help
+    :type description: str
+    :param add_arguments: adds suite specific arguments to the parser
+    :type add_arguments: function(parser: argparse.ArgumentParser) -> None
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file, and exit with an error on regressions")
+    parser.add_argument("--threshold", type=float, default=0.1, help="the fractional slowdown which counts as a regression")
+    parser.add_argument("--filter", help="only run benchmarks whose names match this regular expression")
+    if add_arguments is not None:
+        add_arguments(parser)
+    args = parser.parse_args()
+
+    pattern = re.compile(args.filter) if args.filter is not None else None
+
+    def selected(name):
+        return pattern is None or pattern.search(name) is not None
+
+    results = BenchmarkResults(suite)
+    run_benchmarks(results, args, selected)
+    for name, result in sorted(results.results.items()):
+        print(format_result(name, result))
+    if args.output is not None:
+        results.write_json(args.output)
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        comparisons = compare_results(results.to_dict(), baseline, args.threshold)
+        regressions = 0
+        for name, ratio, status in comparisons:
+            if status != "unchanged":
+                print("{}: {} ({:.2f}x the baseline cost)".format(status.upper(), name, ratio))
+            if status == "regression":
+                regressions += 1
+        if regressions > 0:
+            raise SystemExit(1)
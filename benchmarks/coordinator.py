@@ -0,0 +1,176 @@
+"""End-to-end throughput of Coordinator.play_one_game with SimpleAgent, against a scripted game over OS pipes
+
+The scripted game runs in a thread of this process and replies to every command with the next of a fixed cycle of
+pre-generated synthetic messages, so its own cost stays small and constant. Run from the repository root:
+    python -m benchmarks.coordinator --output results.json
+    python -m benchmarks.coordinator --deck-size 150 --monsters 5 --powers 10 --baseline results.json
+"""
+import json
+import os
+import threading
+import time
+
+from benchmarks.common import run_main
+from spirecomm.ai.agent import SimpleAgent
+from spirecomm.communication.coordinator import Coordinator, DeadlineStatistics
+from spirecomm.spire.character import PlayerClass
+from spirecomm.spire.screen import ScreenType
+from spirecomm.synthetic import StateGenerator
+
+
+DEFAULT_SCREENS = "NONE,NONE,NONE,NONE,NONE,NONE,NONE,NONE,COMBAT_REWARD,CARD_REWARD,MAP,EVENT,REST"
+
+
+def percentile(values, fraction):
+    if len(values) == 0:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ScriptedGame:
+    """A stand-in for Slay the Spire with Communication Mod, which replays messages regardless of the commands sent
+
+    Each game starts on "start", takes decisions_per_game commands, then shows the game over screen until "proceed".
+    The time from writing each in-game message to reading the command in response is recorded as an action latency.
+    """
+
+    def __init__(self, messages, decisions_per_game, game_over_message, menu_message):
+        self.messages = messages
+        self.decisions_per_game = decisions_per_game
+        self.game_over_message = game_over_message
+        self.menu_message = menu_message
+        self.latencies = []
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.cpu_seconds = 0.0
+
+    def reset_statistics(self):
+        self.latencies = []
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.cpu_seconds = 0.0
+
+    def serve(self, command_file, message_file):
+        decision = 0
+        game_over = False
+        sent_time = None
+        for line in command_file:
+            received_time = time.perf_counter()
+            cpu_start = time.thread_time()
+            command = line.rstrip("\n")
+            if sent_time is not None:
+                self.latencies.append(received_time - sent_time)
+            in_game = True
+            if command == "ready" or (game_over and command == "proceed"):
+                message = self.menu_message
+                game_over = False
+                in_game = False
+            elif command.startswith("start"):
+                decision = 0
+                message = self.messages[0]
+            else:
+                decision += 1
+                if decision >= self.decisions_per_game:
+                    message = self.game_over_message
+                    game_over = True
+                else:
+                    message = self.messages[decision % len(self.messages)]
+            message_file.write(message)
+            message_file.write("\n")
+            message_file.flush()
+            self.messages_sent += 1
+            self.bytes_sent += len(message) + 1
+            sent_time = time.perf_counter() if in_game else None
+            self.cpu_seconds += time.thread_time() - cpu_start
+
+
+def make_scripted_game(args):
+    generator = StateGenerator(args.seed, deck_size=args.deck_size, hand_size=args.hand_size, monsters=args.monsters,
+                               powers=args.powers, relics=args.relics, choices=args.choices)
+    screen_types = [ScreenType[name.strip()] for name in args.screens.split(",")]
+    messages = [json.dumps(generator.make_message(screen_type)) for screen_type in screen_types]
+    game_over_message = json.dumps(generator.make_message(ScreenType.GAME_OVER))
+    menu_message = json.dumps({"available_commands": ["start"], "ready_for_command": True, "in_game": False})
+    return ScriptedGame(messages, args.decisions, game_over_message, menu_message)
+
+
+def start_session(scripted_game, use_threads=True, time_limit=None):
+    """Connect a new Coordinator and SimpleAgent to the scripted game over a pair of OS pipes
+
+    :param scripted_game: the game to connect to
+    :type scripted_game: ScriptedGame
+    :param use_threads: set to False to use the Coordinator's single-threaded selector mode
+    :type use_threads: bool
+    :param time_limit: if given, the agent plans turns as an anytime callback with this time limit, in seconds
+    :type time_limit: float
+    :return: the coordinator
+    :rtype: Coordinator
+    """
+    message_read, message_write = os.pipe()
+    command_read, command_write = os.pipe()
+    game_thread = threading.Thread(target=scripted_game.serve, args=(os.fdopen(command_read), os.fdopen(message_write, "w")))
+    game_thread.daemon = True
+    game_thread.start()
+    coordinator = Coordinator(os.fdopen(message_read), os.fdopen(command_write, "w"), use_threads)
+    agent = SimpleAgent(plan_turns=time_limit is not None)
+    coordinator.signal_ready()
+    coordinator.register_command_error_callback(agent.handle_error)
+    if time_limit is None:
+        coordinator.register_state_change_callback(agent.get_next_action_in_game)
+    else:
+        coordinator.register_anytime_state_change_callback(agent.get_next_action_in_game_anytime, time_limit)
+    coordinator.register_out_of_game_callback(agent.get_next_action_out_of_game)
+    return coordinator
+
+
+def run_benchmarks(results, args, selected):
+    if not selected("coordinator"):
+        return
+    scripted_game = make_scripted_game(args)
+    coordinator = start_session(scripted_game, not args.no_threads, args.anytime)
+    for _ in range(args.warmup_games):
+        coordinator.play_one_game(PlayerClass.IRONCLAD)
+    scripted_game.reset_statistics()
+    coordinator.deadline_statistics = DeadlineStatistics()
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(args.games):
+        coordinator.play_one_game(PlayerClass.IRONCLAD)
+    wall_seconds = time.perf_counter() - wall_start
+    # The scripted game's own CPU time is not part of the cost being measured
+    cpu_seconds = time.process_time() - cpu_start - scripted_game.cpu_seconds
+
+    latencies = scripted_game.latencies
+    results.add_value("coordinator.games_per_hour", args.games / wall_seconds * 3600, "games/hour")
+    results.add_value("coordinator.decisions_per_second", len(latencies) / wall_seconds, "decisions/second")
+    results.add_value("coordinator.latency_p50_ms", percentile(latencies, 0.5) * 1e3, "ms", higher_is_better=False)
+    results.add_value("coordinator.latency_p99_ms", percentile(latencies, 0.99) * 1e3, "ms", higher_is_better=False)
+    results.add_value("coordinator.cpu_seconds_per_game", cpu_seconds / args.games, "s", higher_is_better=False)
+    settings = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    settings["mean_message_bytes"] = scripted_game.bytes_sent / max(scripted_game.messages_sent, 1)
+    if args.anytime is not None:
+        settings["deadlines"] = coordinator.deadline_statistics.to_dict()
+    results.metadata["coordinator"] = settings
+
+
+def add_arguments(parser):
+    parser.add_argument("--games", type=int, default=20, help="the number of games to time")
+    parser.add_argument("--warmup-games", type=int, default=2, help="the number of games to play before timing")
+    parser.add_argument("--decisions", type=int, default=200, help="the number of commands in each game")
+    parser.add_argument("--screens", default=DEFAULT_SCREENS, help="the comma separated screen types to cycle through")
+    parser.add_argument("--seed", type=int, default=0, help="the seed for the synthetic game states")
+    parser.add_argument("--deck-size", type=int, default=30, help="the number of cards in the deck")
+    parser.add_argument("--hand-size", type=int, default=7, help="the number of cards in hand")
+    parser.add_argument("--monsters", type=int, default=3, help="the number of monsters in combat")
+    parser.add_argument("--powers", type=int, default=3, help="the number of powers on each character")
+    parser.add_argument("--relics", type=int, default=10, help="the number of relics")
+    parser.add_argument("--choices", type=int, default=3, help="the number of options on choice screens")
+    parser.add_argument("--no-threads", action="store_true", help="run the Coordinator without helper threads")
+    parser.add_argument("--anytime", type=float, default=None, metavar="SECONDS",
+                        help="plan turns with an anytime callback, with this time limit for each decision")
+
+
+if __name__ == "__main__":
+    run_main("coordinator", run_benchmarks, "Benchmark Coordinator.play_one_game end to end over OS pipes", add_arguments)
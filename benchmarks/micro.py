@@ -0,0 +1,144 @@
+"""Micro-benchmarks of parsing and decision hot paths, over synthetic game states
+
+Run from the repository root:
+    python -m benchmarks.micro --output results.json
+    python -m benchmarks.micro --baseline results.json
+"""
+from benchmarks.common import measure, run_main
+from spirecomm.ai.agent import SimpleAgent
+from spirecomm.ai.priorities import SilentPriority, IroncladPriority, DefectPowerPriority
+from spirecomm.communication.action import CardSelectAction
+from spirecomm.spire.character import PlayerClass
+from spirecomm.spire.game import Game
+from spirecomm.spire.map import Map, MapIndex
+from spirecomm.spire.screen import ScreenType, SCREEN_CLASSES, screen_from_json
+from spirecomm.synthetic import StateGenerator
+
+
+STATE_SIZES = {
+    "small": {},
+    "large": {"deck_size": 150, "hand_size": 10, "monsters": 5, "powers": 10, "relics": 40, "potions": 5, "choices": 60,
+              "orbs": 5}
+}
+
+PRIORITY_CLASSES = [SilentPriority, IroncladPriority, DefectPowerPriority]
+
+
+def benchmark_parsing(results, measure_function, selected, size, generator):
+    for screen_type in SCREEN_CLASSES:
+        message = generator.make_message(screen_type)
+        game_state = message["game_state"]
+        available_commands = message["available_commands"]
+        name = "game.from_json/{}/{}".format(size, screen_type.name)
+        if selected(name):
+            results.add_timing(name, *measure_function(lambda: Game.from_json(game_state, available_commands)))
+        name = "screen_from_json/{}/{}".format(size, screen_type.name)
+        if selected(name):
+            screen_state = game_state["screen_state"]
+            results.add_timing(name, *measure_function(lambda: screen_from_json(screen_type, screen_state)))
+    name = "map.from_json/{}".format(size)
+    if selected(name):
+        results.add_timing(name, *measure_function(lambda: Map.from_json(generator.map)))
+
+
+def benchmark_agent(results, measure_function, selected, size, generator):
+    for screen_type in SCREEN_CLASSES:
+        name = "agent.get_next_action_in_game/{}/{}".format(size, screen_type.name)
+        if not selected(name):
+            continue
+        message = generator.make_message(screen_type)
+        game = Game.from_json(message["game_state"], message["available_commands"])
+        # Without the decision cache, every call makes the decision from scratch
+        agent = SimpleAgent(PlayerClass.THE_SILENT, decision_cache_size=0)
+
+        def decide():
+            agent.visited_shop = False
+            return agent.get_next_action_in_game(game)
+
+        results.add_timing(name, *measure_function(decide))
+
+    name = "agent.generate_map_route/{}".format(size)
+    if selected(name):
+        message = generator.make_message(ScreenType.MAP)
+        agent = SimpleAgent(PlayerClass.THE_SILENT, decision_cache_size=0)
+        agent.game = Game.from_json(message["game_state"], message["available_commands"])
+        agent.map_index = MapIndex(agent.game.map)
+        results.add_timing(name, *measure_function(agent.generate_map_route))
+
+    name = "action.card_select/{}".format(size)
+    if selected(name):
+        message = generator.make_message(ScreenType.GRID)
+        game = Game.from_json(message["game_state"], message["available_commands"])
+        cards = game.screen.cards[-game.screen.num_cards:]
+        coordinator = _CommandSink(game)
+
+        def select():
+            CardSelectAction(cards).execute(coordinator)
+            coordinator.action_queue.clear()
+
+        results.add_timing(name, *measure_function(select))
+
+
+class _CommandSink:
+    # Just enough of a Coordinator for actions to execute against
+    def __init__(self, game):
+        self.last_game_state = game
+        self.action_queue = []
+        self.game_is_ready = True
+
+    def add_action_to_queue(self, action):
+        self.action_queue.append(action)
+
+    def send_message(self, message):
+        pass
+
+
+def benchmark_priorities(results, measure_function, selected, size, generator):
+    message = generator.make_message(ScreenType.BOSS_REWARD)
+    game = Game.from_json(message["game_state"], message["available_commands"])
+    cards = game.deck
+    relics = game.screen.relics
+    k = max(1, len(cards) // 10)
+    for priority_class in PRIORITY_CLASSES:
+        priority = priority_class()
+        benchmarks = {
+            "get_best_card": lambda: priority.get_best_card(cards),
+            "get_worst_card": lambda: priority.get_worst_card(cards),
+            "get_sorted_cards": lambda: priority.get_sorted_cards(cards),
+            "get_top_k": lambda: priority.get_top_k(cards, k),
+            "get_sorted_cards_to_play": lambda: priority.get_sorted_cards_to_play(cards),
+            "get_best_card_to_play": lambda: priority.get_best_card_to_play(cards),
+            "get_worst_card_to_play": lambda: priority.get_worst_card_to_play(cards),
+            "should_skip": lambda: [priority.should_skip(card) for card in cards],
+            "get_shop_card_value": lambda: [priority.get_shop_card_value(card) for card in cards],
+            "needs_more_copies": lambda: [priority.needs_more_copies(card, 1) for card in cards],
+            "get_best_boss_relic": lambda: priority.get_best_boss_relic(relics),
+            "is_card_aoe": lambda: [priority.is_card_aoe(card) for card in cards],
+            "is_card_defensive": lambda: [priority.is_card_defensive(card) for card in cards],
+            "get_cards_for_action": lambda: priority.get_cards_for_action("DiscardAction", cards, k),
+        }
+        for method, function in benchmarks.items():
+            name = "priority.{}/{}/{}".format(method, priority_class.__name__, size)
+            if selected(name):
+                results.add_timing(name, *measure_function(function))
+
+
+def run_benchmarks(results, args, selected):
+    def measure_function(function):
+        return measure(function, args.min_time, args.repeat)
+
+    for size, parameters in STATE_SIZES.items():
+        generator = StateGenerator(args.seed, **parameters)
+        benchmark_parsing(results, measure_function, selected, size, generator)
+        benchmark_agent(results, measure_function, selected, size, generator)
+        benchmark_priorities(results, measure_function, selected, size, generator)
+
+
+def add_arguments(parser):
+    parser.add_argument("--seed", type=int, default=0, help="the seed for the synthetic game states")
+    parser.add_argument("--min-time", type=float, default=0.2, help="the least time for each timed loop, in seconds")
+    parser.add_argument("--repeat", type=int, default=5, help="the number of timed loops per benchmark")
+
+
+if __name__ == "__main__":
+    run_main("micro", run_benchmarks, "Benchmark parsing and decision hot paths", add_arguments)
@@ -0,0 +1,78 @@
+"""Cold start time: importing the package and creating an agent, each in a fresh interpreter
+
+Every sample starts a new Python process, so nothing is cached in memory between samples. Run from the repository
+root:
+    python -m benchmarks.startup --output results.json
+    python -m benchmarks.startup --baseline results.json
+"""
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import run_main
+
+
+# The statements timed in each fresh interpreter, by benchmark name
+STARTUP_STATEMENTS = {
+    "import/spirecomm.spire.game": "import spirecomm.spire.game",
+    "import/spirecomm.communication.coordinator": "import spirecomm.communication.coordinator",
+    "import/spirecomm.ai.agent": "import spirecomm.ai.agent",
+    "import/bot": "import spirecomm.communication.coordinator, spirecomm.ai.agent",
+    "startup/simple_agent": "import spirecomm.ai.agent\n"
+                            "from spirecomm.spire.character import PlayerClass\n"
+                            "agent = spirecomm.ai.agent.SimpleAgent()\n"
+                            "for player_class in PlayerClass:\n"
+                            "    agent.change_class(player_class)"
+}
+
+TIMING_SCRIPT = """import time
+start_time = time.perf_counter()
+exec(compile({statements!r}, "<startup>", "exec"))
+print(time.perf_counter() - start_time)
+"""
+
+
+def time_in_fresh_interpreter(statements, environment):
+    """Run statements in a new Python process
+
+    :param statements: the statements to time
+    :type statements: str
+    :param environment: the environment variables of the process
+    :type environment: dict
+    :return: the time taken by the statements, and by the whole process including interpreter startup, in seconds
+    :rtype: tuple(float, float)
+    """
+    start_time = time.perf_counter()
+    output = subprocess.check_output([sys.executable, "-c", TIMING_SCRIPT.format(statements=statements)],
+                                     env=environment, universal_newlines=True)
+    process_seconds = time.perf_counter() - start_time
+    return float(output.strip()), process_seconds
+
+
+def run_benchmarks(results, args, selected):
+    repository_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join([repository_root] + [path for path in [environment.get("PYTHONPATH")] if path])
+    for name, statements in STARTUP_STATEMENTS.items():
+        if not selected(name):
+            continue
+        # A first run writes any missing bytecode, so that the timed runs are comparable
+        time_in_fresh_interpreter(statements, environment)
+        statement_timings = []
+        process_timings = []
+        for _ in range(args.repeat):
+            statement_seconds, process_seconds = time_in_fresh_interpreter(statements, environment)
+            statement_timings.append(statement_seconds)
+            process_timings.append(process_seconds)
+        results.add_timing(name, 1, statement_timings)
+        results.add_timing(name + "/process", 1, process_timings)
+    results.metadata["startup"] = {"repeat": args.repeat}
+
+
+def add_arguments(parser):
+    parser.add_argument("--repeat", type=int, default=20, help="the number of fresh interpreters for each benchmark")
+
+
+if __name__ == "__main__":
+    run_main("startup", run_benchmarks, "Benchmark import and agent creation time in fresh interpreters", add_arguments)
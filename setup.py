@@ -14,6 +14,7 @@ setup(
     description='A package for interfacing with Slay the Spire through Communication Mod',
     long_description=long_description,
     long_description_content_type='text/markdown',
+    python_requires='>=3.8',
     classifiers=[
         'Programming Language :: Python :: 3',
         'License :: OSI Approved :: MIT License',
@@ -3,25 +3,77 @@ import random
 
 from spirecomm.spire.game import Game
 from spirecomm.spire.character import Intent, PlayerClass
+from spirecomm.spire.map import MapIndex
 import spirecomm.spire.card
 from spirecomm.spire.screen import RestOption
 from spirecomm.communication.action import *
 from spirecomm.ai.priorities import *
+from spirecomm.ai.cache import DecisionCache
+from spirecomm.ai.profiling import DecisionProfiler
+from spirecomm.ai.shop import plan_shop_purchases
+from spirecomm.ai.damage import DamageEngine
 
 
 class SimpleAgent:
 
-    def __init__(self, chosen_class=PlayerClass.THE_SILENT):
+    # Decision methods which are timed when profiling is enabled
+    PROFILED_METHODS = [
+        "get_next_action_in_game",
+        "get_play_card_action",
+        "plan_turn",
+        "use_next_potion",
+        "choose_card_reward",
+        "generate_map_route",
+        "choose_rest_option"
+    ]
+
+    def __init__(self, chosen_class=PlayerClass.THE_SILENT, plan_turns=False, decision_cache_size=0,
+                 cached_screen_types=None):
+        """
+        :param chosen_class: the class to play
+        :type chosen_class: PlayerClass
+        :param plan_turns: set to True to plan whole turns of card plays at once
+        :type plan_turns: bool
+        :param decision_cache_size: the most screen decisions to cache, or 0 to leave the decision cache off
+        :type decision_cache_size: int
+        :param cached_screen_types: if given, the only screen types to cache decisions for. By default, the event, chest,
+            rest, card reward and boss reward screens are all cached.
+        :type cached_screen_types: iterable(ScreenType)
+        """
         self.game = Game()
+        self.plan_turns = plan_turns
+        self.decision_cache = DecisionCache(decision_cache_size, screen_types=cached_screen_types)
+        self.profiler = None
+        self.damage_engine = None
         self.errors = 0
         self.choose_good_card = False
         self.skipped_cards = False
         self.visited_shop = False
         self.map_route = []
+        self.map_index = None
         self.chosen_class = chosen_class
         self.priorities = Priority()
         self.change_class(chosen_class)
 
+    def enable_profiling(self, profiler=None):
+        # Timing wrappers are only installed on this instance while profiling, so there is no cost otherwise.
+        # Callbacks registered with a Coordinator before this is called will not be timed.
+        if profiler is None:
+            profiler = DecisionProfiler()
+        self.disable_profiling()
+        self.profiler = profiler
+        for method_name in self.PROFILED_METHODS:
+            setattr(self, method_name, profiler.wrap(method_name, getattr(self, method_name)))
+        self.handle_screen = profiler.wrap("handle_screen", self.handle_screen, lambda: self.game.screen_type.name)
+        return profiler
+
+    def disable_profiling(self):
+        if self.profiler is None:
+            return
+        for method_name in self.PROFILED_METHODS + ["handle_screen"]:
+            del self.__dict__[method_name]
+        self.profiler = None
+
     def change_class(self, new_class):
         self.chosen_class = new_class
         if self.chosen_class == PlayerClass.THE_SILENT:
@@ -48,12 +100,29 @@ class SimpleAgent:
                 potion_action = self.use_next_potion()
                 if potion_action is not None:
                     return potion_action
+            if self.plan_turns:
+                return self.get_planned_turn_action()
             return self.get_play_card_action()
         if self.game.end_available:
             return EndTurnAction()
         if self.game.cancel_available:
             return CancelAction()
 
+    def get_next_action_in_game_anytime(self, game_state, deadline):
+        # For Coordinator.register_anytime_state_change_callback: the card by card decision is quick, so it is offered
+        # first, and when turn planning is on and there is time left, the whole-turn plan replaces it
+        plan_turns = self.plan_turns
+        try:
+            self.plan_turns = False
+            yield self.get_next_action_in_game(game_state)
+            # Only combat decisions differ with planning, and screen decisions have side effects, so they are made once
+            in_combat_turn = game_state.play_available and not game_state.choice_available and not game_state.proceed_available
+            if plan_turns and in_combat_turn and time.perf_counter() < deadline:
+                self.plan_turns = True
+                yield self.get_next_action_in_game(game_state)
+        finally:
+            self.plan_turns = plan_turns
+
     def get_next_action_out_of_game(self):
         return StartGameAction(self.chosen_class)
 
@@ -63,15 +132,14 @@ class SimpleAgent:
                 return True
         return False
 
+    def get_damage_engine(self):
+        # One engine per game state, shared by every query made while deciding in that state
+        if self.damage_engine is None or self.damage_engine.game is not self.game:
+            self.damage_engine = DamageEngine(self.game)
+        return self.damage_engine
+
     def get_incoming_damage(self):
-        incoming_damage = 0
-        for monster in self.game.monsters:
-            if not monster.is_gone and not monster.half_dead:
-                if monster.move_adjusted_damage is not None:
-                    incoming_damage += monster.move_adjusted_damage * monster.move_hits
-                elif monster.intent == Intent.NONE:
-                    incoming_damage += 5 * self.game.act
-        return incoming_damage
+        return self.get_damage_engine().incoming_damage()
 
     def get_low_hp_target(self):
         available_monsters = [monster for monster in self.game.monsters if monster.current_hp > 0 and not monster.half_dead and not monster.is_gone]
@@ -89,19 +157,33 @@ class SimpleAgent:
 
     def get_play_card_action(self):
         playable_cards = [card for card in self.game.hand if card.is_playable]
+        if len(playable_cards) == 0:
+            return EndTurnAction()
+        damage_engine = self.get_damage_engine()
+        card_to_play = self.choose_card_to_play(playable_cards, damage_engine.end_of_turn_block(), damage_engine.incoming_damage())
+        if card_to_play is None:
+            # This shouldn't happen!
+            return EndTurnAction()
+        if card_to_play.has_target:
+            target = self.choose_target(card_to_play)
+            if target is None:
+                return EndTurnAction()
+            return PlayCardAction(card=card_to_play, target_monster=target)
+        else:
+            return PlayCardAction(card=card_to_play)
+
+    def choose_card_to_play(self, playable_cards, block, incoming_damage):
         zero_cost_cards = [card for card in playable_cards if card.cost == 0]
         zero_cost_attacks = [card for card in zero_cost_cards if card.type == spirecomm.spire.card.CardType.ATTACK]
         zero_cost_non_attacks = [card for card in zero_cost_cards if card.type != spirecomm.spire.card.CardType.ATTACK]
         nonzero_cost_cards = [card for card in playable_cards if card.cost != 0]
         aoe_cards = [card for card in playable_cards if self.priorities.is_card_aoe(card)]
-        if self.game.player.block > self.get_incoming_damage() - (self.game.act + 4):
+        if block > incoming_damage - (self.game.act + 4):
             offensive_cards = [card for card in nonzero_cost_cards if not self.priorities.is_card_defensive(card)]
             if len(offensive_cards) > 0:
                 nonzero_cost_cards = offensive_cards
             else:
                 nonzero_cost_cards = [card for card in nonzero_cost_cards if not card.exhausts]
-        if len(playable_cards) == 0:
-            return EndTurnAction()
         if len(zero_cost_non_attacks) > 0:
             card_to_play = self.priorities.get_best_card_to_play(zero_cost_non_attacks)
         elif len(nonzero_cost_cards) > 0:
@@ -111,19 +193,58 @@ class SimpleAgent:
         elif len(zero_cost_attacks) > 0:
             card_to_play = self.priorities.get_best_card_to_play(zero_cost_attacks)
         else:
-            # This shouldn't happen!
-            return EndTurnAction()
-        if card_to_play.has_target:
-            available_monsters = [monster for monster in self.game.monsters if monster.current_hp > 0 and not monster.half_dead and not monster.is_gone]
-            if len(available_monsters) == 0:
-                return EndTurnAction()
-            if card_to_play.type == spirecomm.spire.card.CardType.ATTACK:
-                target = self.get_low_hp_target()
-            else:
-                target = self.get_high_hp_target()
-            return PlayCardAction(card=card_to_play, target_monster=target)
+            card_to_play = None
+        return card_to_play
+
+    def choose_target(self, card):
+        available_monsters = [monster for monster in self.game.monsters if monster.current_hp > 0 and not monster.half_dead and not monster.is_gone]
+        if len(available_monsters) == 0:
+            return None
+        if card.type == spirecomm.spire.card.CardType.ATTACK:
+            damage_engine = self.get_damage_engine()
+            lethal_targets = damage_engine.lethal_targets(card)
+            if len(lethal_targets) > 0:
+                return self.game.monsters[max(lethal_targets, key=lambda i: damage_engine.intent_damage[i] * damage_engine.intent_hits[i])]
+            return self.get_low_hp_target()
         else:
-            return PlayCardAction(card=card_to_play)
+            return self.get_high_hp_target()
+
+    def plan_turn(self):
+        # Assumes that playing a card only changes the hand and energy. The plan stops after a defensive card,
+        # since the block it grants is not known in advance. Each planned play checks these assumptions.
+        hand = list(self.game.hand)
+        energy = self.game.player.energy
+        damage_engine = self.get_damage_engine()
+        block = damage_engine.end_of_turn_block()
+        incoming_damage = damage_engine.incoming_damage()
+        plan = []
+        while True:
+            playable_cards = [card for card in hand if card.is_playable and card.cost <= energy]
+            if len(playable_cards) == 0:
+                break
+            card_to_play = self.choose_card_to_play(playable_cards, block, incoming_damage)
+            if card_to_play is None:
+                break
+            target = None
+            if card_to_play.has_target:
+                target = self.choose_target(card_to_play)
+                if target is None:
+                    break
+            plan.append(PlannedPlayCardAction(card=card_to_play, target_monster=target, expected_hand=hand, expected_energy=energy))
+            hand = [card for card in hand if card != card_to_play]
+            if card_to_play.cost == -1:
+                energy = 0
+            else:
+                energy -= card_to_play.cost
+            if self.priorities.is_card_defensive(card_to_play):
+                break
+        return plan
+
+    def get_planned_turn_action(self):
+        plan = self.plan_turn()
+        if len(plan) == 0:
+            return EndTurnAction()
+        return ActionSequence(plan)
 
     def use_next_potion(self):
         for potion in self.game.get_real_potions():
@@ -134,6 +255,42 @@ class SimpleAgent:
                     return PotionAction(True, potion=potion)
 
     def handle_screen(self):
+        fingerprint = None
+        if self.decision_cache.is_enabled_for(self.game.screen_type):
+            fingerprint = self.get_decision_fingerprint()
+        if fingerprint is None:
+            return self.choose_screen_action()
+        action = self.decision_cache.get(fingerprint)
+        if action is None:
+            action = self.choose_screen_action()
+            self.decision_cache.put(fingerprint, action)
+        elif self.game.screen_type == ScreenType.CARD_REWARD and isinstance(action, CancelAction):
+            # Skipping a card reward has to be remembered for the combat reward screen, even when cached
+            self.skipped_cards = True
+        return action
+
+    def get_decision_fingerprint(self):
+        # Only screens whose decision depends on nothing but the fingerprint, and not on agent state, are cached
+        screen = self.game.screen
+        screen_type = self.game.screen_type
+        if screen_type == ScreenType.EVENT:
+            details = (screen.event_id, len(screen.options))
+        elif screen_type == ScreenType.CHEST:
+            details = ()
+        elif screen_type == ScreenType.REST:
+            details = (tuple(screen.rest_options), screen.has_rested, self.game.current_hp, self.game.max_hp,
+                       self.game.act, self.game.floor % 17 == 15)
+        elif screen_type == ScreenType.CARD_REWARD:
+            deck_summary = self.game.get_deck_summary()
+            cards = tuple((card.card_id, card.name, card.upgrades, deck_summary.count(card.card_id)) for card in screen.cards)
+            details = (cards, screen.can_skip, screen.can_bowl, self.game.in_combat)
+        elif screen_type == ScreenType.BOSS_REWARD:
+            details = tuple((relic.relic_id, relic.name) for relic in screen.relics)
+        else:
+            return None
+        return screen_type, self.chosen_class, details
+
+    def choose_screen_action(self):
         if self.game.screen_type == ScreenType.EVENT:
             if self.game.screen.event_id in ["Vampires", "Masked Bandits", "Knowing Skull", "Ghosts", "Liars Game", "Golden Idol", "Drug Dealer", "The Library"]:
                 return ChooseAction(len(self.game.screen.options) - 1)
@@ -169,24 +326,19 @@ class SimpleAgent:
             best_boss_relic = self.priorities.get_best_boss_relic(relics)
             return BossRewardAction(best_boss_relic)
         elif self.game.screen_type == ScreenType.SHOP_SCREEN:
-            if self.game.screen.purge_available and self.game.gold >= self.game.screen.purge_cost:
-                return ChooseAction(name="purge")
-            for card in self.game.screen.cards:
-                if self.game.gold >= card.price and not self.priorities.should_skip(card):
-                    return BuyCardAction(card)
-            for relic in self.game.screen.relics:
-                if self.game.gold >= relic.price:
-                    return BuyRelicAction(relic)
-            return CancelAction()
+            purchases = plan_shop_purchases(self.game, self.priorities)
+            if len(purchases) == 0:
+                return CancelAction()
+            return ActionSequence(purchases)
         elif self.game.screen_type == ScreenType.GRID:
             if not self.game.choice_available:
                 return ProceedAction()
+            num_cards = self.game.screen.num_cards
             if self.game.screen.for_upgrade or self.choose_good_card:
-                available_cards = self.priorities.get_sorted_cards(self.game.screen.cards)
+                available_cards = self.priorities.get_top_k(self.game.screen.cards, num_cards)
             else:
-                available_cards = self.priorities.get_sorted_cards(self.game.screen.cards, reverse=True)
-            num_cards = self.game.screen.num_cards
-            return CardSelectAction(available_cards[:num_cards])
+                available_cards = self.priorities.get_top_k(self.game.screen.cards, num_cards, reverse=True)
+            return CardSelectAction(available_cards)
         elif self.game.screen_type == ScreenType.HAND_SELECT:
             if not self.game.choice_available:
                 return ProceedAction()
@@ -217,16 +369,13 @@ class SimpleAgent:
             return ProceedAction()
 
     def count_copies_in_deck(self, card):
-        count = 0
-        for deck_card in self.game.deck:
-            if deck_card.card_id == card.card_id:
-                count += 1
-        return count
+        return self.game.get_deck_summary().count(card.card_id)
 
     def choose_card_reward(self):
         reward_cards = self.game.screen.cards
         if self.game.screen.can_skip and not self.game.in_combat:
-            pickable_cards = [card for card in reward_cards if self.priorities.needs_more_copies(card, self.count_copies_in_deck(card))]
+            deck_summary = self.game.get_deck_summary()
+            pickable_cards = [card for card in reward_cards if self.priorities.needs_more_copies(card, deck_summary.count(card.card_id))]
         else:
             pickable_cards = reward_cards
         if len(pickable_cards) > 0:
@@ -238,33 +387,26 @@ class SimpleAgent:
             self.skipped_cards = True
             return CancelAction()
 
-    def generate_map_route(self):
+    def generate_map_route(self, current_node=None):
+        if self.map_index is None:
+            self.map_index = MapIndex(self.game.map)
         node_rewards = self.priorities.MAP_NODE_PRIORITIES.get(self.game.act)
-        best_rewards = {0: {node.x: node_rewards[node.symbol] for node in self.game.map.nodes[0].values()}}
-        best_parents = {0: {node.x: 0 for node in self.game.map.nodes[0].values()}}
-        min_reward = min(node_rewards.values())
-        map_height = max(self.game.map.nodes.keys())
-        for y in range(0, map_height):
-            best_rewards[y+1] = {node.x: min_reward * 20 for node in self.game.map.nodes[y+1].values()}
-            best_parents[y+1] = {node.x: -1 for node in self.game.map.nodes[y+1].values()}
-            for x in best_rewards[y]:
-                node = self.game.map.get_node(x, y)
-                best_node_reward = best_rewards[y][x]
-                for child in node.children:
-                    test_child_reward = best_node_reward + node_rewards[child.symbol]
-                    if test_child_reward > best_rewards[y+1][child.x]:
-                        best_rewards[y+1][child.x] = test_child_reward
-                        best_parents[y+1][child.x] = node.x
-        best_path = [0] * (map_height + 1)
-        best_path[map_height] = max(best_rewards[map_height].keys(), key=lambda x: best_rewards[map_height][x])
-        for y in range(map_height, 0, -1):
-            best_path[y - 1] = best_parents[y][best_path[y]]
-        self.map_route = best_path
+        best_path = self.map_index.get_best_path(node_rewards, start=current_node)
+        if best_path is None:
+            return
+        if len(self.map_route) != self.map_index.height:
+            self.map_route = [0] * self.map_index.height
+        for node in best_path:
+            self.map_route[node.y] = node.x
 
     def make_map_choice(self):
         if len(self.game.screen.next_nodes) > 0 and self.game.screen.next_nodes[0].y == 0:
+            self.map_index = MapIndex(self.game.map)
             self.generate_map_route()
             self.game.screen.current_node.y = -1
+        elif self.game.screen.current_node is not None and not self.game.screen.boss_available:
+            # Routing from the current node is cheap with the index, so re-evaluate the route every floor
+            self.generate_map_route(self.game.screen.current_node)
         if self.game.screen.boss_available:
             return ChooseMapBossAction()
         chosen_x = self.map_route[self.game.screen.current_node.y + 1]
@@ -0,0 +1,63 @@
+import collections
+
+
+class DecisionCache:
+    """A least-recently-used cache of decisions, keyed by a fingerprint of everything the decision depends on"""
+
+    def __init__(self, max_size=1024, disabled_screen_types=(), screen_types=None):
+        """
+        :param max_size: the most decisions to keep, or 0 to cache nothing
+        :type max_size: int
+        :param disabled_screen_types: screen types never to cache
+        :type disabled_screen_types: iterable(ScreenType)
+        :param screen_types: if given, the only screen types to cache
+        :type screen_types: iterable(ScreenType)
+        """
+        self.max_size = max_size
+        self.disabled_screen_types = set(disabled_screen_types)
+        self.screen_types = set(screen_types) if screen_types is not None else None
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def is_enabled_for(self, screen_type):
+        if self.max_size <= 0 or screen_type in self.disabled_screen_types:
+            return False
+        return self.screen_types is None or screen_type in self.screen_types
+
+    def disable(self, screen_type):
+        self.disabled_screen_types.add(screen_type)
+
+    def enable(self, screen_type):
+        self.disabled_screen_types.discard(screen_type)
+        if self.screen_types is not None:
+            self.screen_types.add(screen_type)
+
+    def get(self, fingerprint):
+        decision = self.entries.get(fingerprint)
+        if decision is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(fingerprint)
+        return decision
+
+    def put(self, fingerprint, decision):
+        if self.max_size <= 0:
+            return
+        self.entries[fingerprint] = decision
+        self.entries.move_to_end(fingerprint)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / lookups
@@ -0,0 +1,351 @@
+import math
+
+from spirecomm.spire.card import CardType
+from spirecomm.spire.character import Intent
+
+
+# Base damage of attacks: card id -> (damage, upgraded damage, hits, upgraded hits, hits all enemies)
+# Cards whose damage depends on other state are in SCALING_ATTACK_DAMAGE, or left out if the state is not known,
+# e.g. Rampage and Claw, which grow with every play, and Rip and Tear, which hits random enemies. Sword Boomerang also
+# hits random enemies, so it only counts while one is left.
+ATTACK_DAMAGE = {
+    # Ironclad
+    "Strike_R": (6, 9, 1, 1, False),
+    "Bash": (8, 10, 1, 1, False),
+    "Anger": (6, 8, 1, 1, False),
+    "Clash": (14, 18, 1, 1, False),
+    "Cleave": (8, 11, 1, 1, True),
+    "Clothesline": (12, 14, 1, 1, False),
+    "Headbutt": (9, 12, 1, 1, False),
+    "Iron Wave": (5, 7, 1, 1, False),
+    "Pommel Strike": (9, 10, 1, 1, False),
+    "Thunderclap": (4, 7, 1, 1, True),
+    "Twin Strike": (5, 7, 2, 2, False),
+    "Wild Strike": (12, 17, 1, 1, False),
+    "Blood for Blood": (18, 22, 1, 1, False),
+    "Carnage": (20, 28, 1, 1, False),
+    "Dropkick": (5, 8, 1, 1, False),
+    "Hemokinesis": (15, 20, 1, 1, False),
+    "Pummel": (2, 2, 4, 5, False),
+    "Reckless Charge": (7, 10, 1, 1, False),
+    "Sever Soul": (16, 22, 1, 1, False),
+    "Uppercut": (13, 13, 1, 1, False),
+    "Bludgeon": (32, 42, 1, 1, False),
+    "Feed": (10, 12, 1, 1, False),
+    "Immolate": (21, 28, 1, 1, True),
+    "Reaper": (4, 5, 1, 1, True),
+    # Silent
+    "Strike_G": (6, 9, 1, 1, False),
+    "Neutralize": (3, 4, 1, 1, False),
+    "Dagger Spray": (4, 6, 2, 2, True),
+    "Dagger Throw": (9, 12, 1, 1, False),
+    "Flying Knee": (8, 11, 1, 1, False),
+    "Poisoned Stab": (6, 8, 1, 1, False),
+    "Quick Slash": (8, 12, 1, 1, False),
+    "Slice": (6, 9, 1, 1, False),
+    "Underhanded Strike": (12, 16, 1, 1, False),
+    "Sucker Punch": (7, 9, 1, 1, False),
+    "All Out Attack": (10, 14, 1, 1, True),
+    "Backstab": (11, 15, 1, 1, False),
+    "Dash": (10, 13, 1, 1, False),
+    "Eviscerate": (7, 9, 3, 3, False),
+    "Heel Hook": (5, 8, 1, 1, False),
+    "Masterful Stab": (12, 16, 1, 1, False),
+    "Predator": (15, 20, 1, 1, False),
+    "Riddle With Holes": (3, 4, 5, 5, False),
+    "Choke": (12, 12, 1, 1, False),
+    "Die Die Die": (13, 17, 1, 1, True),
+    "Endless Agony": (4, 6, 1, 1, False),
+    "Glass Knife": (8, 12, 2, 2, False),
+    "Grand Finale": (50, 60, 1, 1, True),
+    "Unload": (14, 18, 1, 1, False),
+    "Shiv": (4, 6, 1, 1, False),
+    # Defect
+    "Strike_B": (6, 9, 1, 1, False),
+    "Ball Lightning": (7, 10, 1, 1, False),
+    "Beam Cell": (3, 4, 1, 1, False),
+    "Cold Snap": (6, 9, 1, 1, False),
+    "Compile Driver": (7, 10, 1, 1, False),
+    "Go for the Eyes": (3, 4, 1, 1, False),
+    "Rebound": (9, 12, 1, 1, False),
+    "Streamline": (15, 20, 1, 1, False),
+    "Sweeping Beam": (6, 9, 1, 1, True),
+    "Lockon": (8, 11, 1, 1, False),
+    "Doom and Gloom": (10, 14, 1, 1, True),
+    "FTL": (5, 6, 1, 1, False),
+    "Melter": (10, 14, 1, 1, False),
+    "Scrape": (7, 10, 1, 1, False),
+    "Sunder": (24, 32, 1, 1, False),
+    "All For One": (10, 14, 1, 1, False),
+    "Core Surge": (11, 15, 1, 1, False),
+    "Hyperbeam": (26, 34, 1, 1, True),
+    "Meteor Strike": (24, 30, 1, 1, False),
+    # Colorless
+    "Swift Strike": (7, 10, 1, 1, False),
+    "Flash of Steel": (3, 6, 1, 1, False),
+    "Dramatic Entrance": (8, 12, 1, 1, True),
+    "HandOfGreed": (20, 25, 1, 1, False),
+    "Bite": (7, 8, 1, 1, False),
+}
+
+
+def _heavy_blade_damage(engine, card):
+    return 14, 1, 5 if card.upgrades > 0 else 3
+
+
+def _perfected_strike_damage(engine, card):
+    game = engine.game
+    strikes = sum(1 for pile in (game.hand, game.draw_pile, game.discard_pile) for other in pile if "Strike" in other.name)
+    return 6 + strikes * (3 if card.upgrades > 0 else 2), 1, 1
+
+
+def _searing_blow_damage(engine, card):
+    # Searing Blow can be upgraded any number of times, and each upgrade adds one more damage than the last
+    return 12 + card.upgrades * (card.upgrades + 7) // 2, 1, 1
+
+
+def _bane_damage(engine, card):
+    return 10 if card.upgrades > 0 else 7, [2 if poisoned else 1 for poisoned in engine.poisoned], 1
+
+
+def _sword_boomerang_damage(engine, card):
+    # Each hit picks a random monster, so where the hits land is only known when one monster is left
+    hits = 4 if card.upgrades > 0 else 3
+    single_target = sum(engine.alive) == 1
+    return 3, [hits if alive and single_target else 0 for alive in engine.alive], 1
+
+
+def _ritual_dagger_damage(engine, card):
+    # The damage gained from kills is stored on the card
+    return card.misc if card.misc > 0 else 15, 1, 1
+
+
+# Attacks whose damage depends on the state: card id -> function(engine, card) -> (damage, hits, strength multiplier),
+# where hits is either a number or a list with the hits on each monster
+SCALING_ATTACK_DAMAGE = {
+    "Heavy Blade": _heavy_blade_damage,
+    "Perfected Strike": _perfected_strike_damage,
+    "Searing Blow": _searing_blow_damage,
+    "Bane": _bane_damage,
+    "Sword Boomerang": _sword_boomerang_damage,
+    "RitualDagger": _ritual_dagger_damage,
+}
+
+
+def get_power_amount(powers, power_id):
+    for power in powers:
+        if power.power_id == power_id:
+            return power.amount
+    return 0
+
+
+class DamageEngine:
+    """Damage calculations for one combat state, over the player's and monsters' powers and the player's orbs
+
+    Monster properties are gathered once into plain Python lists, one entry per monster, so each query is a short loop.
+    Build one engine per game state and reuse it for every query in that state.
+    """
+
+    def __init__(self, game, attack_damage=ATTACK_DAMAGE, unknown_intent_damage_per_act=5,
+                 scaling_attack_damage=SCALING_ATTACK_DAMAGE):
+        self.game = game
+        self.attack_damage = attack_damage
+        self.scaling_attack_damage = scaling_attack_damage
+        player = game.player
+        self.player_block = player.block if player is not None else 0
+        player_powers = player.powers if player is not None else []
+        self.player_strength = get_power_amount(player_powers, "Strength")
+        self.player_weak = get_power_amount(player_powers, "Weakened") > 0
+        self.player_double_damage = get_power_amount(player_powers, "Double Damage") > 0
+        self.player_intangible = get_power_amount(player_powers, "IntangiblePlayer") > 0 or get_power_amount(player_powers, "Intangible") > 0
+        self.player_vulnerable = get_power_amount(player_powers, "Vulnerable") > 0
+        self.player_buffer = get_power_amount(player_powers, "Buffer")
+        self.end_of_turn_block_gain = get_power_amount(player_powers, "Metallicize") + get_power_amount(player_powers, "Plated Armor")
+        self.orbs = player.orbs if player is not None else []
+
+        monsters = game.monsters
+        self.alive = [monster.current_hp > 0 and not monster.half_dead and not monster.is_gone for monster in monsters]
+        self.hp = [monster.current_hp for monster in monsters]
+        self.block = [monster.block for monster in monsters]
+        self.vulnerable = [get_power_amount(monster.powers, "Vulnerable") > 0 for monster in monsters]
+        self.intangible = [get_power_amount(monster.powers, "Intangible") > 0 for monster in monsters]
+        self.locked_on = [get_power_amount(monster.powers, "Lockon") > 0 for monster in monsters]
+        self.strength = [get_power_amount(monster.powers, "Strength") for monster in monsters]
+        self.weak = [get_power_amount(monster.powers, "Weakened") > 0 for monster in monsters]
+        self.poisoned = [get_power_amount(monster.powers, "Poison") > 0 for monster in monsters]
+        self.intent_hits = []
+        self.intent_damage = []
+        for monster, alive in zip(monsters, self.alive):
+            if not alive:
+                self.intent_hits.append(0)
+                self.intent_damage.append(0)
+            elif monster.move_adjusted_damage is not None and monster.move_adjusted_damage >= 0 and monster.intent.is_attack():
+                self.intent_hits.append(max(monster.move_hits, 1))
+                self.intent_damage.append(monster.move_adjusted_damage)
+            elif monster.intent == Intent.NONE:
+                # The intent is hidden, so guess
+                self.intent_hits.append(1)
+                self.intent_damage.append(unknown_intent_damage_per_act * game.act)
+            else:
+                self.intent_hits.append(0)
+                self.intent_damage.append(0)
+        self.base_intent_damage = [monster.move_base_damage for monster in monsters]
+
+    def get_incoming_hits(self, monster_strength_changes=None):
+        """Get the damage of each hit the monsters intend to deal this turn, in order
+
+        :param monster_strength_changes: changes to apply to each monster's strength, by monster index, e.g. from Disarm
+        :type monster_strength_changes: dict(int, int)
+        :return: the damage of each hit
+        :rtype: list(int)
+        """
+        hits = []
+        for i, (num_hits, damage) in enumerate(zip(self.intent_hits, self.intent_damage)):
+            if num_hits == 0:
+                continue
+            if monster_strength_changes is not None and i in monster_strength_changes and self.base_intent_damage[i] is not None \
+                    and self.base_intent_damage[i] > 0:
+                damage = self.base_intent_damage[i] + self.strength[i] + monster_strength_changes[i]
+                if self.weak[i]:
+                    damage *= 0.75
+                if self.player_vulnerable:
+                    damage *= 1.5
+                damage = max(int(damage), 0)
+            if self.player_intangible:
+                damage = min(damage, 1)
+            hits.extend([damage] * num_hits)
+        return hits
+
+    def incoming_damage(self, monster_strength_changes=None):
+        return sum(self.get_incoming_hits(monster_strength_changes))
+
+    def get_orb_amounts(self, orb_id, evoke=False):
+        return [orb.evoke_amount if evoke else orb.passive_amount for orb in self.orbs if orb.orb_id == orb_id]
+
+    def end_of_turn_block(self, extra_block=0):
+        """Get the block the player will have when the monsters attack, from powers and Frost orbs"""
+        return self.player_block + extra_block + self.end_of_turn_block_gain + sum(self.get_orb_amounts("Frost"))
+
+    def expected_hp_loss(self, extra_block=0, monster_strength_changes=None):
+        """Get the HP the player will lose to the monsters' intended attacks this turn
+
+        :param extra_block: block the player will still gain this turn
+        :type extra_block: int
+        :return: the HP lost, after block and Buffer
+        :rtype: int
+        """
+        block = self.end_of_turn_block(extra_block)
+        buffer = self.player_buffer
+        hp_loss = 0
+        for damage in self.get_incoming_hits(monster_strength_changes):
+            absorbed = min(block, damage)
+            block -= absorbed
+            if damage > absorbed:
+                if buffer > 0:
+                    buffer -= 1
+                else:
+                    hp_loss += damage - absorbed
+        return hp_loss
+
+    def attack_damage_per_hit(self, card):
+        """Get the damage per hit and number of hits a card would deal to each monster, before block
+
+        :return: (damage per hit, hits) for each monster, or None if the card's damage is unknown
+        :rtype: list(tuple(int, int))
+        """
+        if card.type != CardType.ATTACK:
+            return None
+        scaling_damage = self.scaling_attack_damage.get(card.card_id)
+        if scaling_damage is not None:
+            damage, hits, strength_multiplier = scaling_damage(self, card)
+        elif card.card_id in self.attack_damage:
+            damage, upgraded_damage, hits, upgraded_hits, _ = self.attack_damage[card.card_id]
+            if card.upgrades > 0:
+                damage, hits = upgraded_damage, upgraded_hits
+            strength_multiplier = 1
+        else:
+            return None
+        if not isinstance(hits, list):
+            hits = [hits] * len(self.hp)
+        damage += self.player_strength * strength_multiplier
+        if self.player_weak:
+            damage *= 0.75
+        if self.player_double_damage:
+            damage *= 2
+        result = []
+        for vulnerable, intangible, monster_hits in zip(self.vulnerable, self.intangible, hits):
+            per_hit = damage * 1.5 if vulnerable else damage
+            per_hit = max(int(per_hit), 0)
+            if intangible:
+                per_hit = min(per_hit, 1)
+            result.append((per_hit, monster_hits))
+        return result
+
+    def card_damage(self, card):
+        """Get the HP damage a card would deal to each monster, after block; zero for monsters it would not hit"""
+        per_hit = self.attack_damage_per_hit(card)
+        if per_hit is None:
+            return [0] * len(self.hp)
+        return [max(damage * hits - block, 0) if alive else 0
+                for (damage, hits), block, alive in zip(per_hit, self.block, self.alive)]
+
+    def is_aoe(self, card):
+        entry = self.attack_damage.get(card.card_id)
+        return entry is not None and entry[4]
+
+    def lethal_targets(self, card):
+        """Get the indices of the monsters that the card would kill if played on them (or on all, for AOE cards)"""
+        return [i for i, (damage, hp, alive) in enumerate(zip(self.card_damage(card), self.hp, self.alive)) if alive and damage >= hp]
+
+    def get_lethal_plays(self, cards=None):
+        """Check every card in hand for lethal damage
+
+        :return: for each card that can kill a monster, the card and the indices of the monsters it can kill
+        :rtype: list(tuple(Card, list(int)))
+        """
+        if cards is None:
+            cards = [card for card in self.game.hand if card.is_playable]
+        lethal_plays = []
+        for card in cards:
+            targets = self.lethal_targets(card)
+            if len(targets) > 0:
+                lethal_plays.append((card, targets))
+        return lethal_plays
+
+    def orb_passive_damage(self):
+        """Get the total damage Lightning orbs will deal at the end of the turn, to random monsters"""
+        return sum(self.get_orb_amounts("Lightning"))
+
+    def orb_evoke_damage(self):
+        """Get the damage evoking the front orb would deal, and to which monster index (None for a random monster)
+
+        :return: the damage and target index, or (0, None) if the front orb does not deal damage
+        :rtype: tuple(int, int)
+        """
+        if len(self.orbs) == 0:
+            return 0, None
+        orb = self.orbs[0]
+        alive_indices = [i for i, alive in enumerate(self.alive) if alive]
+        if len(alive_indices) == 0:
+            return 0, None
+        if orb.orb_id == "Lightning":
+            if len(alive_indices) == 1:
+                target = alive_indices[0]
+                return self._orb_damage(orb.evoke_amount, target), target
+            return orb.evoke_amount, None
+        elif orb.orb_id == "Dark":
+            target = min(alive_indices, key=lambda i: self.hp[i])
+            return self._orb_damage(orb.evoke_amount, target), target
+        return 0, None
+
+    def _orb_damage(self, amount, target):
+        if self.locked_on[target]:
+            amount = int(amount * 1.5)
+        if self.intangible[target]:
+            amount = min(amount, 1)
+        return amount
+
+    def turns_to_kill(self, monster_index, damage_per_turn):
+        if damage_per_turn <= 0:
+            return math.inf
+        return math.ceil((self.hp[monster_index] + self.block[monster_index]) / damage_per_turn)
@@ -0,0 +1,185 @@
+import collections
+import functools
+import math
+
+from spirecomm.spire.card import CardType
+
+
+@functools.lru_cache(maxsize=None)
+def hypergeometric_distribution(population, successes, draws):
+    """Get the probability of drawing each number of successes, without replacement
+
+    :param population: the number of cards to draw from
+    :type population: int
+    :param successes: the number of those cards that count as a success
+    :type successes: int
+    :param draws: the number of cards drawn
+    :type draws: int
+    :return: the probability of drawing exactly k successes, for k from 0 to draws
+    :rtype: tuple(float)
+    """
+    draws = min(draws, population)
+    total = math.comb(population, draws)
+    return tuple(math.comb(successes, k) * math.comb(population - successes, draws - k) / total for k in range(draws + 1))
+
+
+@functools.lru_cache(maxsize=None)
+def draw_count_distribution(draw_pile_size, draw_pile_successes, discard_size, discard_successes, draws):
+    """Get the distribution of successes drawn, shuffling the discard pile into the draw pile when it runs out
+
+    :return: the probability of drawing exactly k successes, for k from 0 to the number of cards actually drawn
+    :rtype: tuple(float)
+    """
+    if draws <= draw_pile_size:
+        return hypergeometric_distribution(draw_pile_size, draw_pile_successes, draws)
+    # The whole draw pile is drawn, then the rest comes from the reshuffled discard pile
+    reshuffled = hypergeometric_distribution(discard_size, discard_successes, draws - draw_pile_size)
+    return (0.0,) * draw_pile_successes + reshuffled
+
+
+@functools.lru_cache(maxsize=None)
+def _cost_total_ways(cost_counts, draws):
+    # The number of ways to draw each total cost, drawing exactly `draws` cards from piles of cards grouped by cost
+    ways = {(0, 0): 1}
+    for cost, count in cost_counts:
+        new_ways = collections.defaultdict(int)
+        for (drawn, total), num_ways in ways.items():
+            for taken in range(min(count, draws - drawn) + 1):
+                new_ways[(drawn + taken, total + taken * cost)] += num_ways * math.comb(count, taken)
+        ways = new_ways
+    totals = collections.defaultdict(int)
+    for (drawn, total), num_ways in ways.items():
+        if drawn == draws:
+            totals[total] += num_ways
+    return tuple(sorted(totals.items()))
+
+
+def _cost_total_distribution(cost_counts, draws):
+    population = sum(count for _, count in cost_counts)
+    draws = min(draws, population)
+    total_ways = math.comb(population, draws)
+    return {total: num_ways / total_ways for total, num_ways in _cost_total_ways(cost_counts, draws)}
+
+
+def _playable_cost(card):
+    # X cost (-1) and unplayable (-2) cards need no energy up front
+    return max(card.cost, 0)
+
+
+# Cards drawn with a full hand are not drawn at all
+MAX_HAND_SIZE = 10
+
+
+class DrawModel:
+    """Closed-form draw probabilities for the next draw, from the draw pile and then the reshuffled discard pile"""
+
+    def __init__(self, draw_pile, discard_pile, draws=5, hand_size=0):
+        """
+        :param draw_pile: the cards in the draw pile
+        :type draw_pile: list(Card)
+        :param discard_pile: the cards in the discard pile
+        :type discard_pile: list(Card)
+        :param draws: the default number of cards to draw
+        :type draws: int
+        :param hand_size: the number of cards already in hand, which limits how many can be drawn
+        :type hand_size: int
+        """
+        self.draws = draws
+        self.hand_size = hand_size
+        self.draw_pile_size = len(draw_pile)
+        self.discard_size = len(discard_pile)
+        self.draw_pile_ids = collections.Counter(card.card_id for card in draw_pile)
+        self.discard_ids = collections.Counter(card.card_id for card in discard_pile)
+        self.draw_pile_types = collections.Counter(card.type for card in draw_pile)
+        self.discard_types = collections.Counter(card.type for card in discard_pile)
+        self.draw_pile_costs = tuple(sorted(collections.Counter(_playable_cost(card) for card in draw_pile).items()))
+        self.discard_costs = tuple(sorted(collections.Counter(_playable_cost(card) for card in discard_pile).items()))
+        self.draw_pile = draw_pile
+        self.discard_pile = discard_pile
+
+    @classmethod
+    def from_game(cls, game, draws=5):
+        return cls(game.draw_pile, game.discard_pile, draws, len(game.hand))
+
+    def get_draws(self, draws=None):
+        """Get the number of cards actually drawn, which stops when the hand is full
+
+        :param draws: the number of cards to draw, if not the default for this model
+        :type draws: int
+        :return: the number of cards drawn
+        :rtype: int
+        """
+        if draws is None:
+            draws = self.draws
+        return max(min(draws, MAX_HAND_SIZE - self.hand_size), 0)
+
+    def _count_all_successes(self, keys):
+        # Predicates are all checked in one pass over each pile, rather than one pass per predicate
+        counts = [None] * len(keys)
+        predicates = []
+        for i, key in enumerate(keys):
+            if isinstance(key, CardType):
+                counts[i] = self.draw_pile_types.get(key, 0), self.discard_types.get(key, 0)
+            elif callable(key):
+                predicates.append((i, key))
+            elif isinstance(key, (list, tuple, set, frozenset)):
+                counts[i] = sum(self.draw_pile_ids.get(card_id, 0) for card_id in key), sum(self.discard_ids.get(card_id, 0) for card_id in key)
+            else:
+                counts[i] = self.draw_pile_ids.get(key, 0), self.discard_ids.get(key, 0)
+        if len(predicates) > 0:
+            draw_pile_counts = [0] * len(predicates)
+            discard_counts = [0] * len(predicates)
+            for pile, pile_counts in ((self.draw_pile, draw_pile_counts), (self.discard_pile, discard_counts)):
+                for card in pile:
+                    for j, (_, predicate) in enumerate(predicates):
+                        if predicate(card):
+                            pile_counts[j] += 1
+            for j, (i, _) in enumerate(predicates):
+                counts[i] = draw_pile_counts[j], discard_counts[j]
+        return counts
+
+    def _get_distribution(self, successes, draws):
+        draw_pile_successes, discard_successes = successes
+        return draw_count_distribution(self.draw_pile_size, draw_pile_successes, self.discard_size, discard_successes, draws)
+
+    def get_distribution(self, key, draws=None):
+        """Get the distribution of how many matching cards are drawn
+
+        :param key: a card id, a collection of card ids, a CardType, or a predicate on cards
+        :param draws: the number of cards to draw, if not the default for this model
+        :type draws: int
+        :return: the probability of drawing exactly k matching cards, for each k
+        :rtype: tuple(float)
+        """
+        return self._get_distribution(self._count_all_successes([key])[0], self.get_draws(draws))
+
+    def probability_at_least(self, key, count=1, draws=None):
+        return sum(self.get_distribution(key, draws)[count:])
+
+    def probabilities_at_least(self, keys, count=1, draws=None):
+        """Answer a batch of queries against the same piles, in one pass over each pile
+
+        :return: the probability of drawing at least count matching cards, for each key
+        :rtype: list(float)
+        """
+        draws = self.get_draws(draws)
+        return [sum(self._get_distribution(successes, draws)[count:]) for successes in self._count_all_successes(keys)]
+
+    def expected_count(self, key, draws=None):
+        return sum(k * probability for k, probability in enumerate(self.get_distribution(key, draws)))
+
+    def get_energy_distribution(self, draws=None):
+        """Get the distribution of the total energy cost of the cards drawn
+
+        :return: the probability of each total cost
+        :rtype: dict(int, float)
+        """
+        draws = self.get_draws(draws)
+        if draws <= self.draw_pile_size:
+            return _cost_total_distribution(self.draw_pile_costs, draws)
+        draw_pile_total = sum(cost * count for cost, count in self.draw_pile_costs)
+        reshuffled = _cost_total_distribution(self.discard_costs, draws - self.draw_pile_size)
+        return {draw_pile_total + total: probability for total, probability in reshuffled.items()}
+
+    def probability_energy_at_most(self, energy, draws=None):
+        return sum(probability for total, probability in self.get_energy_distribution(draws).items() if total <= energy)
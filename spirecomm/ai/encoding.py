@@ -0,0 +1,108 @@
+import numpy as np
+
+from spirecomm.spire.card import CardType
+from spirecomm.spire.screen import ScreenType
+
+
+class GameEncoder:
+    """Encodes a Game into a fixed-size float32 vector, for use with learned policies
+
+    Hands and monster lists are padded or truncated to a fixed number of slots.
+    """
+
+    GENERAL_FEATURES = 8
+    COMMAND_FEATURES = 6
+    PLAYER_FEATURES = 4
+    PILE_FEATURES = 4
+    CARD_FEATURES = 5 + len(CardType)
+    MONSTER_FEATURES = 7
+
+    def __init__(self, max_hand_cards=10, max_monsters=5):
+        self.max_hand_cards = max_hand_cards
+        self.max_monsters = max_monsters
+        self.screen_types = list(ScreenType)
+        self.screen_type_offsets = {screen_type: i for i, screen_type in enumerate(self.screen_types)}
+        self.card_types = list(CardType)
+        self.card_type_offsets = {card_type: i for i, card_type in enumerate(self.card_types)}
+
+        self.general_offset = 0
+        self.screen_offset = self.general_offset + self.GENERAL_FEATURES
+        self.command_offset = self.screen_offset + len(self.screen_types)
+        self.player_offset = self.command_offset + self.COMMAND_FEATURES
+        self.pile_offset = self.player_offset + self.PLAYER_FEATURES
+        self.hand_offset = self.pile_offset + self.PILE_FEATURES
+        self.monster_offset = self.hand_offset + self.max_hand_cards * self.CARD_FEATURES
+        self.size = self.monster_offset + self.max_monsters * self.MONSTER_FEATURES
+
+    def encode(self, game, out=None):
+        """Encode a game state
+
+        :param game: the game state
+        :type game: Game
+        :param out: an array of length self.size to write into, e.g. a row of a batch or of shared memory
+        :type out: numpy.ndarray
+        :return: the encoded game state
+        :rtype: numpy.ndarray
+        """
+        if out is None:
+            out = np.zeros(self.size, dtype=np.float32)
+        else:
+            out[:] = 0
+
+        max_hp = game.max_hp or 1
+        out[0] = (game.current_hp or 0) / max_hp
+        out[1] = max_hp / 100
+        out[2] = (game.floor or 0) / 55
+        out[3] = (game.act or 0) / 4
+        out[4] = (game.gold or 0) / 1000
+        out[5] = (game.ascension_level or 0) / 20
+        out[6] = game.in_combat
+        out[7] = len(game.deck) / 50
+
+        if game.screen_type is not None:
+            out[self.screen_offset + self.screen_type_offsets[game.screen_type]] = 1
+
+        offset = self.command_offset
+        out[offset] = game.end_available
+        out[offset + 1] = game.potion_available
+        out[offset + 2] = game.play_available
+        out[offset + 3] = game.proceed_available
+        out[offset + 4] = game.cancel_available
+        out[offset + 5] = game.choice_available
+
+        if game.player is not None:
+            offset = self.player_offset
+            out[offset] = game.player.block / 50
+            out[offset + 1] = game.player.energy / 5
+            out[offset + 2] = len(game.player.orbs) / 10
+            out[offset + 3] = len(game.player.powers) / 10
+
+        offset = self.pile_offset
+        out[offset] = len(game.draw_pile) / 50
+        out[offset + 1] = len(game.discard_pile) / 50
+        out[offset + 2] = len(game.exhaust_pile) / 50
+        out[offset + 3] = len(game.hand) / 10
+
+        for i, card in enumerate(game.hand[:self.max_hand_cards]):
+            offset = self.hand_offset + i * self.CARD_FEATURES
+            out[offset] = 1
+            out[offset + 1] = card.cost / 3
+            out[offset + 2] = card.upgrades
+            out[offset + 3] = card.is_playable
+            out[offset + 4] = card.has_target
+            out[offset + 5 + self.card_type_offsets[card.type]] = 1
+
+        for i, monster in enumerate(game.monsters[:self.max_monsters]):
+            if monster.is_gone or monster.half_dead or monster.current_hp <= 0:
+                continue
+            offset = self.monster_offset + i * self.MONSTER_FEATURES
+            out[offset] = 1
+            out[offset + 1] = monster.current_hp / (monster.max_hp or 1)
+            out[offset + 2] = monster.current_hp / 100
+            out[offset + 3] = monster.block / 50
+            out[offset + 4] = monster.intent.is_attack()
+            if monster.move_adjusted_damage is not None and monster.move_adjusted_damage > 0:
+                out[offset + 5] = monster.move_adjusted_damage * max(monster.move_hits, 1) / 50
+            out[offset + 6] = len(monster.powers) / 10
+
+        return out
@@ -0,0 +1,228 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from spirecomm.ai.encoding import GameEncoder
+from spirecomm.communication.action_space import DEFAULT_ACTION_SPACE
+from spirecomm.communication.action import *
+
+
+class LinearPolicyModel:
+    """A NumPy stand-in for a learned policy: a fixed random linear map from encoded states to action scores"""
+
+    def __init__(self, input_size, output_size, seed=0):
+        random_state = np.random.RandomState(seed)
+        self.weights = random_state.normal(0, 1 / np.sqrt(input_size), (input_size, output_size)).astype(np.float32)
+        self.bias = random_state.normal(0, 0.1, output_size).astype(np.float32)
+
+    def __call__(self, observations):
+        return observations @ self.weights + self.bias
+
+
+def decode_card_scores(game_state, scores, max_hand_cards=10):
+    """Turn a row of model outputs into an action, reading the first outputs as scores for hand cards or choices
+
+    :param game_state: the game state the outputs were computed for
+    :type game_state: Game
+    :param scores: the model outputs for this game state
+    :type scores: numpy.ndarray
+    :return: the action to take
+    :rtype: Action
+    """
+    if game_state.play_available:
+        playable = [i for i, card in enumerate(game_state.hand[:max_hand_cards]) if card.is_playable]
+        if len(playable) > 0:
+            card_index = max(playable, key=lambda i: scores[i])
+            card = game_state.hand[card_index]
+            if card.has_target:
+                targets = [monster for monster in game_state.monsters if monster.current_hp > 0 and not monster.half_dead and not monster.is_gone]
+                if len(targets) > 0:
+                    return PlayCardAction(card=card, target_monster=min(targets, key=lambda monster: monster.current_hp))
+            else:
+                return PlayCardAction(card=card)
+    if game_state.end_available:
+        return EndTurnAction()
+    if game_state.choice_available and len(game_state.choice_list) > 0:
+        num_choices = min(len(game_state.choice_list), len(scores))
+        return ChooseAction(int(np.argmax(scores[:num_choices])))
+    if game_state.proceed_available:
+        return ProceedAction()
+    if game_state.cancel_available:
+        return CancelAction()
+    return StateAction()
+
+
+def decode_masked_scores(game_state, scores, action_space=DEFAULT_ACTION_SPACE):
+    """Turn a row of model outputs into an action, reading them as scores over an ActionSpace
+
+    The model's output size must be action_space.size. Illegal actions are never chosen.
+    :param game_state: the game state the outputs were computed for
+    :type game_state: Game
+    :param scores: the model outputs for this game state
+    :type scores: numpy.ndarray
+    :return: the highest scoring legal action
+    :rtype: Action
+    """
+    legal_actions = action_space.legal_actions(game_state)
+    mask = np.frombuffer(legal_actions.mask, dtype=np.uint8)
+    if not mask.any():
+        return StateAction()
+    masked_scores = np.where(mask, scores[:action_space.size], -np.inf)
+    return legal_actions.get_action(int(np.argmax(masked_scores)))
+
+
+class InferenceRequest:
+
+    def __init__(self, game_state):
+        self.game_state = game_state
+        self.done = threading.Event()
+        self.action = None
+        self.error = None
+
+
+class InferenceBroker:
+    """Batches decisions from many game sessions into single model calls
+
+    Each coordinator runs in its own thread and registers get_action as its state change callback. The broker's worker
+    thread waits for the first pending decision, then up to max_wait seconds for more, encodes up to max_batch_size
+    game states into one array, runs the model once, and hands each session its decoded action.
+    """
+
+    def __init__(self, model, decode=decode_card_scores, encoder=None, max_batch_size=32, max_wait=0.002):
+        """
+        :param model: maps an array of encoded game states, of shape (batch size, encoder.size), to an array of outputs
+        :type model: function(numpy.ndarray) -> numpy.ndarray
+        :param decode: turns a game state and its row of outputs into an action
+        :type decode: function(game_state: Game, output: numpy.ndarray) -> Action
+        :param encoder: the game state encoder
+        :type encoder: GameEncoder
+        :param max_batch_size: the most decisions to make in one model call
+        :type max_batch_size: int
+        :param max_wait: the longest to wait for a batch to fill, in seconds
+        :type max_wait: float
+        """
+        self.model = model
+        self.decode = decode
+        self.encoder = encoder if encoder is not None else GameEncoder()
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.observations = np.zeros((max_batch_size, self.encoder.size), dtype=np.float32)
+        self.batches = 0
+        self.decisions = 0
+        self.thread = None
+        self.running = False
+        self.stopped = False
+        # Held while submitting a request or stopping, so that no request can arrive after the queue is drained
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            self._start()
+
+    def _start(self):
+        if self.thread is not None:
+            return
+        self.stopped = False
+        self.running = True
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop the worker thread, failing every decision still pending, and refuse new ones until started again
+
+        :return: None
+        """
+        with self.lock:
+            self.stopped = True
+            self.running = False
+            thread = self.thread
+            if thread is not None:
+                self.requests.put(None)
+        if thread is not None:
+            thread.join()
+            self.thread = None
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request.error = RuntimeError("The inference broker was stopped")
+                request.done.set()
+
+    def get_action(self, game_state):
+        """Submit a game state for the next batch and wait for its action
+
+        :param game_state: the game state to decide on
+        :type game_state: Game
+        :return: the action to take
+        :rtype: Action
+        :raises RuntimeError: if the broker was stopped, before or while deciding
+        """
+        request = InferenceRequest(game_state)
+        with self.lock:
+            if self.stopped:
+                raise RuntimeError("The inference broker was stopped")
+            self._start()
+            self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.action
+
+    @property
+    def mean_batch_size(self):
+        if self.batches == 0:
+            return 0.0
+        return self.decisions / self.batches
+
+    def _collect_batch(self):
+        first = self.requests.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    request = self.requests.get(timeout=remaining)
+                else:
+                    request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self.running = False
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while self.running:
+            batch = self._collect_batch()
+            if len(batch) > 0:
+                self._process(batch)
+
+    def _process(self, batch):
+        try:
+            observations = self.observations[:len(batch)]
+            for i, request in enumerate(batch):
+                self.encoder.encode(request.game_state, out=observations[i])
+            outputs = self.model(observations)
+            self.batches += 1
+            self.decisions += len(batch)
+        except Exception as e:
+            for request in batch:
+                request.error = e
+                request.done.set()
+            return
+        for i, request in enumerate(batch):
+            try:
+                request.action = self.decode(request.game_state, outputs[i])
+            except Exception as e:
+                request.error = e
+            request.done.set()
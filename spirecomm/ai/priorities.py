@@ -1,4 +1,45 @@
+import heapq
 import math
+import sys
+import types
+
+
+def _compile_priority_list(priority_list):
+    # Later duplicates win, as they did when the dictionaries were built per instance
+    return types.MappingProxyType({sys.intern(card_id): i for i, card_id in enumerate(priority_list)})
+
+
+def _make_score_function(priorities):
+    get_priority = priorities.get
+    inf = math.inf
+
+    def score(card):
+        return get_priority(card.card_id, inf) - 0.5 * card.upgrades
+
+    return score
+
+
+class PriorityTables:
+    """The lookup tables for a Priority class, compiled once and shared by all of its instances"""
+
+    def __init__(self, priority_class):
+        self.card_priorities = _compile_priority_list(priority_class.CARD_PRIORITY_LIST)
+        self.play_priorities = _compile_priority_list(priority_class.PLAY_PRIORITY_LIST)
+        self.boss_relic_priorities = _compile_priority_list(priority_class.BOSS_RELIC_PRIORITY_LIST)
+        self.map_node_priorities = types.MappingProxyType({
+            1: priority_class.MAP_NODE_PRIORITIES_1,
+            2: priority_class.MAP_NODE_PRIORITIES_2,
+            3: priority_class.MAP_NODE_PRIORITIES_3,
+            4: priority_class.MAP_NODE_PRIORITIES_3  # Doesn't really matter anyway
+        })
+        self.aoe_cards = frozenset(sys.intern(card_id) for card_id in priority_class.AOE_CARDS)
+        self.defensive_cards = frozenset(sys.intern(card_id) for card_id in priority_class.DEFENSIVE_CARDS)
+        self.card_score = _make_score_function(self.card_priorities)
+        self.play_score = _make_score_function(self.play_priorities)
+
+
+_COMPILED_TABLES = {}
+
 
 class Priority:
 
@@ -20,6 +61,14 @@ class Priority:
 
     MAP_NODE_PRIORITIES_3 = {'R': 1000, 'E': 1, '$': 100, '?': 100, 'M': 10, 'T': 0}
 
+    # Shop items are valued on one scale with cards, which are worth their distance above "Skip" in the card list.
+    # Shop relics are not ranked, so a relic is worth this fraction of the best card's value.
+    SHOP_RELIC_FRACTION = 0.5
+
+    # Potions are not ranked either. This is the value of the least wanted card still worth buying, so potions only
+    # get gold that nothing else wants.
+    SHOP_POTION_VALUE = 1
+
     GOOD_CARD_ACTIONS = [
         "PutOnDeckAction",
         "ArmamentsAction",
@@ -39,36 +88,70 @@ class Priority:
     ]
 
     def __init__(self):
-        self.CARD_PRIORITIES = {self.CARD_PRIORITY_LIST[i]: i for i in range(len(self.CARD_PRIORITY_LIST))}
-        self.PLAY_PRIORITIES = {self.PLAY_PRIORITY_LIST[i]: i for i in range(len(self.PLAY_PRIORITY_LIST))}
-        self.BOSS_RELIC_PRIORITIES = {self.BOSS_RELIC_PRIORITY_LIST[i]: i for i in range(len(self.BOSS_RELIC_PRIORITY_LIST))}
-        self.MAP_NODE_PRIORITIES = {
-            1: self.MAP_NODE_PRIORITIES_1,
-            2: self.MAP_NODE_PRIORITIES_2,
-            3: self.MAP_NODE_PRIORITIES_3,
-            4: self.MAP_NODE_PRIORITIES_3  # Doesn't really matter anyway
-        }
+        tables = self.get_compiled_tables()
+        self.CARD_PRIORITIES = tables.card_priorities
+        self.PLAY_PRIORITIES = tables.play_priorities
+        self.BOSS_RELIC_PRIORITIES = tables.boss_relic_priorities
+        self.MAP_NODE_PRIORITIES = tables.map_node_priorities
+        self.card_score = tables.card_score
+        self.play_score = tables.play_score
+        self.skip_priority = tables.card_priorities.get("Skip")
+        self.aoe_cards = tables.aoe_cards
+        self.defensive_cards = tables.defensive_cards
+
+    @classmethod
+    def get_compiled_tables(cls):
+        tables = _COMPILED_TABLES.get(cls)
+        if tables is None:
+            tables = PriorityTables(cls)
+            _COMPILED_TABLES[cls] = tables
+        return tables
 
     def get_best_card(self, card_list):
-        return min(card_list, key=lambda x: self.CARD_PRIORITIES.get(x.card_id, math.inf) - 0.5 * x.upgrades)
+        return min(card_list, key=self.card_score)
 
     def get_worst_card(self, card_list):
-        return max(card_list, key=lambda x: self.CARD_PRIORITIES.get(x.card_id, math.inf) - 0.5 * x.upgrades)
+        return max(card_list, key=self.card_score)
 
     def get_sorted_cards(self, card_list, reverse=False):
-        return sorted(card_list, key=lambda x: self.CARD_PRIORITIES.get(x.card_id, math.inf) - 0.5 * x.upgrades, reverse=reverse)
+        return sorted(card_list, key=self.card_score, reverse=reverse)
+
+    def get_top_k(self, card_list, k, reverse=False):
+        if reverse:
+            return heapq.nlargest(k, card_list, key=self.card_score)
+        else:
+            return heapq.nsmallest(k, card_list, key=self.card_score)
 
     def get_sorted_cards_to_play(self, card_list, reverse=False):
-        return sorted(card_list, key=lambda x: self.PLAY_PRIORITIES.get(x.card_id, math.inf) - 0.5 * x.upgrades, reverse=reverse)
+        return sorted(card_list, key=self.play_score, reverse=reverse)
 
     def get_best_card_to_play(self, card_list):
-        return min(card_list, key=lambda x: self.PLAY_PRIORITIES.get(x.card_id, math.inf) - 0.5 * x.upgrades)
+        return min(card_list, key=self.play_score)
 
     def get_worst_card_to_play(self, card_list):
-        return max(card_list, key=lambda x: self.PLAY_PRIORITIES.get(x.card_id, math.inf) - 0.5 * x.upgrades)
+        return max(card_list, key=self.play_score)
 
     def should_skip(self, card):
-        return self.CARD_PRIORITIES.get(card.card_id, math.inf) > self.CARD_PRIORITIES.get("Skip")
+        return self.CARD_PRIORITIES.get(card.card_id, math.inf) > self.skip_priority
+
+    def get_shop_card_value(self, card):
+        if self.skip_priority is None or self.should_skip(card):
+            return 0
+        return self.skip_priority - self.card_score(card)
+
+    def get_shop_purge_value(self, deck):
+        # Removing a card is worth its distance below "Skip", as adding one is worth its distance above it. Cards which
+        # are not in the list, e.g. curses, rank below all of those which are.
+        if self.skip_priority is None or len(deck) == 0:
+            return 0
+        unranked_priority = len(self.CARD_PRIORITIES)
+        worst_priority = max(min(self.card_score(card), unranked_priority) for card in deck)
+        return max(worst_priority - self.skip_priority, 0)
+
+    def get_shop_relic_value(self):
+        if self.skip_priority is None:
+            return 0
+        return self.SHOP_RELIC_FRACTION * self.skip_priority
 
     def needs_more_copies(self, card, num_copies):
         return self.MAX_COPIES.get(card.card_id, 0) > num_copies
@@ -77,18 +160,16 @@ class Priority:
         return min(relic_list, key=lambda x: self.BOSS_RELIC_PRIORITIES.get(x.relic_id, 0))
 
     def is_card_aoe(self, card):
-        return card.card_id in self.AOE_CARDS
+        return card.card_id in self.aoe_cards
 
     def is_card_defensive(self, card):
-        return card.card_id in self.DEFENSIVE_CARDS
+        return card.card_id in self.defensive_cards
 
     def get_cards_for_action(self, action, cards, max_cards):
         if action in self.GOOD_CARD_ACTIONS:
-            sorted_cards = self.get_sorted_cards(cards, reverse=False)
+            return self.get_top_k(cards, max_cards, reverse=False)
         else:
-            sorted_cards = self.get_sorted_cards(cards, reverse=True)
-        num_cards = min(max_cards, len(cards))
-        return sorted_cards[:num_cards]
+            return self.get_top_k(cards, max_cards, reverse=True)
 
 
 class SilentPriority(Priority):
@@ -0,0 +1,57 @@
+import functools
+import json
+import time
+
+from spirecomm.communication.latency import LatencyHistogram
+
+
+class DecisionProfiler:
+    """Call counts and latency histograms for named decision paths"""
+
+    def __init__(self):
+        self.histograms = {}
+
+    def record(self, path, seconds):
+        histogram = self.histograms.get(path)
+        if histogram is None:
+            histogram = LatencyHistogram()
+            self.histograms[path] = histogram
+        histogram.record(seconds)
+
+    def wrap(self, path, function, get_path_suffix=None):
+        """Wrap a function so that each call is timed under the given path
+
+        :param path: the name of the decision path
+        :type path: str
+        :param function: the function to time
+        :type function: function
+        :param get_path_suffix: if given, called before each call to get a suffix to split the path by, e.g. a screen type
+        :type get_path_suffix: function() -> str
+        :return: the wrapped function
+        :rtype: function
+        """
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            if get_path_suffix is None:
+                full_path = path
+            else:
+                full_path = "{}.{}".format(path, get_path_suffix())
+            start_time = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(full_path, time.perf_counter() - start_time)
+        return timed
+
+    def reset(self):
+        self.histograms.clear()
+
+    def to_dict(self):
+        return {path: histogram.to_dict() for path, histogram in sorted(self.histograms.items())}
+
+    def to_json(self, indent=None):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def write_json(self, filename):
+        with open(filename, "w") as json_file:
+            json_file.write(self.to_json(indent=2))
@@ -0,0 +1,169 @@
+import numpy as np
+
+from spirecomm.spire.map import MapIndex
+
+
+MAP_SYMBOLS = ('M', '?', '$', 'E', 'R', 'T')
+
+
+def get_weight_matrix(node_priority_tables, symbols=MAP_SYMBOLS):
+    """Stack map node priority tables, like Priority.MAP_NODE_PRIORITIES_1, into a weight matrix
+
+    :param node_priority_tables: the rewards for each map symbol, one table per weight vector
+    :type node_priority_tables: list(dict(str, float))
+    :param symbols: the map symbols, in column order
+    :type symbols: tuple(str)
+    :return: an array of shape (number of tables, number of symbols)
+    :rtype: numpy.ndarray
+    """
+    return np.array([[table.get(symbol, 0) for symbol in symbols] for table in node_priority_tables], dtype=float)
+
+
+class RouteScorer:
+    """Scores every route through a map against many weight vectors at once
+
+    The map is laid out as a (height, width) grid of node symbols, with an edge tensor between consecutive rows,
+    so the best route for each weight vector is found with one vectorized dynamic programming pass.
+    """
+
+    def __init__(self, dungeon_map, symbols=MAP_SYMBOLS):
+        if isinstance(dungeon_map, MapIndex):
+            self.index = dungeon_map
+        else:
+            self.index = MapIndex(dungeon_map)
+        self.symbols = symbols
+        symbol_columns = {symbol: i for i, symbol in enumerate(symbols)}
+        nodes = self.index.nodes
+        self.height = self.index.height
+        self.width = max(node.x for node in nodes) + 1 if len(nodes) > 0 else 0
+
+        # symbol_matrix[y, x, s] is 1 if the node at (x, y) has symbol s
+        self.symbol_matrix = np.zeros((self.height, self.width, len(symbols)), dtype=float)
+        self.node_mask = np.zeros((self.height, self.width), dtype=bool)
+        # edges[y, x, child_x] is True if (x, y) connects to (child_x, y + 1)
+        self.edges = np.zeros((max(self.height - 1, 0), self.width, self.width), dtype=bool)
+        for node in nodes:
+            self.node_mask[node.y, node.x] = True
+            if node.symbol in symbol_columns:
+                self.symbol_matrix[node.y, node.x, symbol_columns[node.symbol]] = 1
+            for child in node.children:
+                self.edges[node.y, node.x, child.x] = True
+        self.edge_penalties = np.where(self.edges, 0.0, -np.inf)
+
+        self._count_tables = None
+        self._own_counts = None
+
+    def get_node_rewards(self, weights):
+        weights = np.atleast_2d(np.asarray(weights, dtype=float))
+        rewards = np.einsum('hws,ns->nhw', self.symbol_matrix, weights)
+        rewards[:, ~self.node_mask] = -np.inf
+        return rewards
+
+    def best_routes(self, weights):
+        """Find the best route for each weight vector
+
+        :param weights: an array of shape (number of weight vectors, number of symbols)
+        :type weights: numpy.ndarray
+        :return: the best score for each weight vector, and the x coordinate of each best route on every row
+        :rtype: tuple(numpy.ndarray, numpy.ndarray)
+        """
+        rewards = self.get_node_rewards(weights)
+        num_weights = rewards.shape[0]
+        rows = np.arange(num_weights)
+        best = rewards[:, 0, :]
+        parents = np.zeros((num_weights, self.height, self.width), dtype=int)
+        for y in range(1, self.height):
+            candidates = best[:, :, None] + self.edge_penalties[y - 1][None, :, :]
+            parents[:, y, :] = np.argmax(candidates, axis=1)
+            best = np.max(candidates, axis=1) + rewards[:, y, :]
+        routes = np.zeros((num_weights, self.height), dtype=int)
+        routes[:, -1] = np.argmax(best, axis=1)
+        scores = best[rows, routes[:, -1]]
+        for y in range(self.height - 1, 0, -1):
+            routes[:, y - 1] = parents[rows, y, routes[:, y]]
+        return scores, routes
+
+    def get_route_nodes(self, route):
+        return [self.index.map.get_node(int(x), y) for y, x in enumerate(route)]
+
+    def get_route_symbol_counts(self):
+        """Get every distinct combination of symbol counts over all complete routes
+
+        Any linear score of a route depends only on how many nodes of each symbol it visits, so this is usually far
+        smaller than the number of routes.
+
+        :return: an array of shape (number of combinations, number of symbols)
+        :rtype: numpy.ndarray
+        """
+        tables = self._get_count_tables()
+        return np.unique(np.concatenate([tables[root][0] for root in self.index.roots]), axis=0)
+
+    def pareto_front(self, weights):
+        """Find the routes which are not dominated under a set of weight vectors
+
+        :param weights: an array of shape (number of weight vectors, number of symbols)
+        :type weights: numpy.ndarray
+        :return: the symbol counts of the non-dominated routes, their scores under each weight vector,
+                 and one route (as a list of nodes) for each
+        :rtype: tuple(numpy.ndarray, numpy.ndarray, list(list(Node)))
+        """
+        weights = np.atleast_2d(np.asarray(weights, dtype=float))
+        counts = self.get_route_symbol_counts()
+        scores = counts @ weights.T
+        dominated = np.zeros(len(counts), dtype=bool)
+        for i in range(len(counts)):
+            at_least_as_good = np.all(scores >= scores[i], axis=1)
+            strictly_better = np.any(scores > scores[i], axis=1)
+            if np.any(at_least_as_good & strictly_better):
+                dominated[i] = True
+        front_counts = counts[~dominated]
+        routes = [self._find_route_with_counts(route_counts) for route_counts in front_counts]
+        return front_counts, scores[~dominated], routes
+
+    def _get_count_tables(self):
+        # For each node, the distinct symbol counts of routes from it to the top row, plus the child to go to next
+        if self._count_tables is not None:
+            return self._count_tables
+        num_symbols = len(self.symbols)
+        symbol_columns = {symbol: i for i, symbol in enumerate(self.symbols)}
+        tables = [None] * len(self.index.nodes)
+        self._own_counts = [None] * len(self.index.nodes)
+        for node_id in reversed(range(len(self.index.nodes))):
+            own_counts = np.zeros(num_symbols, dtype=np.int32)
+            symbol = self.index.symbols[node_id]
+            if symbol in symbol_columns:
+                own_counts[symbol_columns[symbol]] = 1
+            self._own_counts[node_id] = own_counts
+            if self.index.nodes[node_id].y == self.height - 1:
+                tables[node_id] = (own_counts[None, :], np.array([-1]))
+                continue
+            child_counts = []
+            child_ids = []
+            for child_id in self.index.children[node_id]:
+                child_counts.append(tables[child_id][0])
+                child_ids.append(np.full(len(tables[child_id][0]), child_id))
+            if len(child_counts) == 0:
+                tables[node_id] = (np.zeros((0, num_symbols), dtype=np.int32), np.zeros(0, dtype=int))
+                continue
+            counts, first = np.unique(np.concatenate(child_counts), axis=0, return_index=True)
+            tables[node_id] = (counts + own_counts, np.concatenate(child_ids)[first])
+        self._count_tables = tables
+        return tables
+
+    def _find_route_with_counts(self, route_counts):
+        tables = self._get_count_tables()
+        for node_id in self.index.roots:
+            route = []
+            current_id = node_id
+            remaining = route_counts
+            while current_id != -1:
+                counts, next_ids = tables[current_id]
+                matches = np.flatnonzero(np.all(counts == remaining, axis=1))
+                if len(matches) == 0:
+                    break
+                route.append(self.index.nodes[current_id])
+                remaining = remaining - self._own_counts[current_id]
+                current_id = int(next_ids[matches[0]])
+            if len(route) == self.height:
+                return route
+        return []
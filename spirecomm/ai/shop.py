@@ -0,0 +1,90 @@
+import functools
+
+from spirecomm.communication.action import BuyCardAction, BuyRelicAction, BuyPotionAction, BuyPurgeAction
+
+
+class ShopItem:
+    """Something that can be bought in a shop, with the action to buy it and how much it is wanted"""
+
+    def __init__(self, action, price, value, uses_potion_slot=False):
+        self.action = action
+        self.price = price
+        self.value = value
+        self.uses_potion_slot = uses_potion_slot
+
+
+def get_shop_items(game, priorities):
+    """Score everything for sale on a shop screen
+
+    :param game: the game state, on a shop screen
+    :type game: Game
+    :param priorities: the priorities to score items with
+    :type priorities: Priority
+    :return: the items worth buying, with the purge (if any) first
+    :rtype: list(ShopItem)
+    """
+    screen = game.screen
+    items = []
+    if screen.purge_available:
+        purge_value = priorities.get_shop_purge_value(game.deck)
+        if purge_value > 0:
+            items.append(ShopItem(BuyPurgeAction(), screen.purge_cost, purge_value))
+    for card in screen.cards:
+        value = priorities.get_shop_card_value(card)
+        if value > 0:
+            items.append(ShopItem(BuyCardAction(card), card.price, value))
+    relic_value = priorities.get_shop_relic_value()
+    if relic_value > 0:
+        for relic in screen.relics:
+            items.append(ShopItem(BuyRelicAction(relic), relic.price, relic_value))
+    for potion in screen.potions:
+        if priorities.SHOP_POTION_VALUE > 0:
+            items.append(ShopItem(BuyPotionAction(potion), potion.price, priorities.SHOP_POTION_VALUE, uses_potion_slot=True))
+    return items
+
+
+def choose_purchases(items, gold, potion_slots):
+    """Choose the most valuable set of items that can be afforded, as a 0/1 knapsack over gold and potion slots
+
+    :param items: the items for sale
+    :type items: list(ShopItem)
+    :param gold: the gold available
+    :type gold: int
+    :param potion_slots: the number of empty potion slots
+    :type potion_slots: int
+    :return: the items to buy, in the order given
+    :rtype: list(ShopItem)
+    """
+    @functools.lru_cache(maxsize=None)
+    def best(index, gold_left, slots_left):
+        # The best (value, chosen item indices) using only items from index onwards
+        if index == len(items):
+            return 0, ()
+        best_value, best_chosen = best(index + 1, gold_left, slots_left)
+        item = items[index]
+        slots_needed = 1 if item.uses_potion_slot else 0
+        if item.price <= gold_left and slots_needed <= slots_left:
+            value, chosen = best(index + 1, gold_left - item.price, slots_left - slots_needed)
+            if value + item.value > best_value:
+                best_value, best_chosen = value + item.value, (index,) + chosen
+        return best_value, best_chosen
+
+    _, chosen_indices = best(0, gold, potion_slots)
+    return [items[i] for i in chosen_indices]
+
+
+def plan_shop_purchases(game, priorities):
+    """Plan everything to buy on a shop screen at once
+
+    Card removal is bought last, since it leaves the shop screen for a card selection screen.
+    :param game: the game state, on a shop screen
+    :type game: Game
+    :param priorities: the priorities to score items with
+    :type priorities: Priority
+    :return: the actions to buy the chosen items, in order
+    :rtype: list(Action)
+    """
+    potion_slots = len(game.potions) - len(game.get_real_potions())
+    purchases = choose_purchases(get_shop_items(game, priorities), game.gold, potion_slots)
+    purchases.sort(key=lambda item: isinstance(item.action, BuyPurgeAction))
+    return [item.action for item in purchases]
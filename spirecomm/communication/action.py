@@ -53,6 +53,66 @@ class PlayCardAction(Action):
             coordinator.send_message("{} {} {}".format(self.command, hand_card_index, self.target_index))
 
 
+class PlannedPlayCardAction(PlayCardAction):
+    """An action to play a card as part of a planned turn, if the hand and energy are still as expected
+
+    If the game state no longer matches the plan, the remaining queued actions are dropped and the state is
+    requested, so that the next action is decided from scratch.
+    """
+
+    def __init__(self, card=None, card_index=-1, target_monster=None, target_index=None, expected_hand=None, expected_energy=None):
+        super().__init__(card, card_index, target_monster, target_index)
+        self.expected_hand = None
+        if expected_hand is not None:
+            self.expected_hand = [hand_card.uuid for hand_card in expected_hand]
+        self.expected_energy = expected_energy
+
+    def is_still_valid(self, game_state):
+        """Check whether the planned play is still sensible in the given game state
+
+        :param game_state: the current game state
+        :type game_state: Game
+        :return: True if the card can still be played as planned
+        :rtype: bool
+        """
+        if not game_state.play_available or game_state.player is None:
+            return False
+        if self.expected_energy is not None and game_state.player.energy != self.expected_energy:
+            return False
+        if self.expected_hand is not None and [card.uuid for card in game_state.hand] != self.expected_hand:
+            return False
+        if self.card is not None:
+            if self.card not in game_state.hand or not game_state.hand[game_state.hand.index(self.card)].is_playable:
+                return False
+        if self.target_monster is not None:
+            target_index = self.target_monster.monster_index
+            if target_index >= len(game_state.monsters):
+                return False
+            target = game_state.monsters[target_index]
+            if target.current_hp <= 0 or target.half_dead or target.is_gone:
+                return False
+        return True
+
+    def execute(self, coordinator):
+        if self.is_still_valid(coordinator.last_game_state):
+            super().execute(coordinator)
+        else:
+            coordinator.clear_actions()
+            StateAction().execute(coordinator)
+
+
+class ActionSequence(Action):
+    """An action to queue several actions at once, to be executed in order without further callbacks"""
+
+    def __init__(self, actions):
+        super().__init__()
+        self.actions = actions
+
+    def execute(self, coordinator):
+        for action in self.actions:
+            coordinator.add_action_to_queue(action)
+
+
 class PotionAction(Action):
     """An action to use or discard a selected potion"""
 
@@ -146,7 +206,7 @@ class BuyPotionAction(ChooseAction):
         super().__init__(name=potion.name)
 
     def execute(self, coordinator):
-        if coordinator.game.are_potions_full():
+        if coordinator.last_game_state.are_potions_full():
             raise Exception("Cannot buy potion because potion slots are full.")
         super().execute(coordinator)
 
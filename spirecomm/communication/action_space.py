@@ -0,0 +1,215 @@
+from spirecomm.communication.action import PlayCardAction, PotionAction, ChooseAction, EndTurnAction, ProceedAction, CancelAction
+
+
+class ActionSpace:
+    """A fixed-size, flat numbering of every command that can be sent to Communication Mod
+
+    The layout, in order:
+    - card plays: one block per hand slot, with one entry for an untargeted play and then one per monster slot
+    - potion uses: one block per potion slot, laid out like card plays
+    - potion discards: one per potion slot
+    - choices: one per choice_list entry
+    - end, proceed and cancel
+    """
+
+    def __init__(self, max_hand_cards=10, max_monsters=5, max_potions=5, max_choices=100):
+        self.max_hand_cards = max_hand_cards
+        self.max_monsters = max_monsters
+        self.max_potions = max_potions
+        self.max_choices = max_choices
+        self.targets = max_monsters + 1
+
+        self.play_offset = 0
+        self.potion_use_offset = self.play_offset + max_hand_cards * self.targets
+        self.potion_discard_offset = self.potion_use_offset + max_potions * self.targets
+        self.choice_offset = self.potion_discard_offset + max_potions
+        self.end_index = self.choice_offset + max_choices
+        self.proceed_index = self.end_index + 1
+        self.cancel_index = self.end_index + 2
+        self.size = self.end_index + 3
+
+    def get_mask(self, game, out=None):
+        """Mark every legal action in the given game state
+
+        :param game: the game state
+        :type game: Game
+        :param out: a mask of length self.size to reuse
+        :type out: bytearray
+        :return: the mask, with 1 for legal actions and 0 otherwise
+        :rtype: bytearray
+        """
+        if out is None:
+            out = bytearray(self.size)
+        else:
+            out[:] = bytes(self.size)
+
+        targets = self.targets
+        live_slots = [i + 1 for i, monster in enumerate(game.monsters[:self.max_monsters])
+                      if monster.current_hp > 0 and not monster.half_dead and not monster.is_gone]
+
+        if game.play_available:
+            for i, card in enumerate(game.hand[:self.max_hand_cards]):
+                if not card.is_playable:
+                    continue
+                offset = self.play_offset + i * targets
+                if card.has_target:
+                    for slot in live_slots:
+                        out[offset + slot] = 1
+                else:
+                    out[offset] = 1
+
+        if game.potion_available:
+            for i, potion in enumerate(game.potions[:self.max_potions]):
+                if potion.potion_id == "Potion Slot":
+                    continue
+                if potion.can_use:
+                    offset = self.potion_use_offset + i * targets
+                    if potion.requires_target:
+                        for slot in live_slots:
+                            out[offset + slot] = 1
+                    else:
+                        out[offset] = 1
+                if potion.can_discard:
+                    out[self.potion_discard_offset + i] = 1
+
+        if game.choice_available:
+            num_choices = min(len(game.choice_list), self.max_choices)
+            out[self.choice_offset:self.choice_offset + num_choices] = b"\x01" * num_choices
+
+        out[self.end_index] = game.end_available
+        out[self.proceed_index] = game.proceed_available
+        out[self.cancel_index] = game.cancel_available
+        return out
+
+    def legal_actions(self, game, out=None):
+        """Get the legal actions in a game state as a mask over this space
+
+        :param game: the game state
+        :type game: Game
+        :param out: a mask of length self.size to reuse
+        :type out: bytearray
+        :return: the mask, which maps indices to actions
+        :rtype: LegalActions
+        """
+        return LegalActions(game, self, out)
+
+    def get_action(self, game, index):
+        """Build the action for an index
+
+        :param game: the game state the index was chosen in
+        :type game: Game
+        :param index: the action index
+        :type index: int
+        :return: the action
+        :rtype: Action
+        """
+        if index < 0 or index >= self.size:
+            raise IndexError("Action index {} is out of range".format(index))
+        if index < self.potion_use_offset:
+            card_index, slot = divmod(index - self.play_offset, self.targets)
+            if slot == 0:
+                return PlayCardAction(card=game.hand[card_index])
+            return PlayCardAction(card=game.hand[card_index], target_monster=game.monsters[slot - 1])
+        elif index < self.potion_discard_offset:
+            potion_index, slot = divmod(index - self.potion_use_offset, self.targets)
+            if slot == 0:
+                return PotionAction(True, potion_index=potion_index)
+            return PotionAction(True, potion_index=potion_index, target_monster=game.monsters[slot - 1])
+        elif index < self.choice_offset:
+            return PotionAction(False, potion_index=index - self.potion_discard_offset)
+        elif index < self.end_index:
+            return ChooseAction(choice_index=index - self.choice_offset)
+        elif index == self.end_index:
+            return EndTurnAction()
+        elif index == self.proceed_index:
+            return ProceedAction()
+        else:
+            return CancelAction()
+
+    def get_index(self, game, action):
+        """Find the index of an action, e.g. to label the decisions of another agent
+
+        :param game: the game state the action was chosen in
+        :type game: Game
+        :param action: the action
+        :type action: Action
+        :return: the action index, or None if the action has no index in this space
+        :rtype: int
+        """
+        if isinstance(action, PlayCardAction):
+            card_index = game.hand.index(action.card) if action.card is not None else action.card_index
+            target_index = action.target_monster.monster_index if action.target_monster is not None else action.target_index
+            return self._get_targeted_index(self.play_offset, card_index, target_index, self.max_hand_cards)
+        elif isinstance(action, PotionAction):
+            potion_index = game.potions.index(action.potion) if action.potion is not None else action.potion_index
+            if not action.use:
+                if 0 <= potion_index < self.max_potions:
+                    return self.potion_discard_offset + potion_index
+                return None
+            target_index = action.target_monster.monster_index if action.target_monster is not None else action.target_index
+            return self._get_targeted_index(self.potion_use_offset, potion_index, target_index, self.max_potions)
+        elif isinstance(action, ChooseAction):
+            choice_index = self._get_choice_index(game, action)
+            if choice_index is not None and 0 <= choice_index < self.max_choices:
+                return self.choice_offset + choice_index
+            return None
+        elif isinstance(action, EndTurnAction):
+            return self.end_index
+        elif isinstance(action, ProceedAction):
+            return self.proceed_index
+        elif isinstance(action, CancelAction):
+            return self.cancel_index
+        return None
+
+    def _get_targeted_index(self, offset, item_index, target_index, max_items):
+        if item_index < 0 or item_index >= max_items:
+            return None
+        if target_index is None:
+            slot = 0
+        elif 0 <= target_index < self.max_monsters:
+            slot = target_index + 1
+        else:
+            return None
+        return offset + item_index * self.targets + slot
+
+    @staticmethod
+    def _get_choice_index(game, action):
+        if getattr(action, "combat_reward", None) is not None:
+            rewards = game.screen.rewards
+            return rewards.index(action.combat_reward) if action.combat_reward in rewards else None
+        if action.name is not None:
+            name = action.name.lower()
+            for i, choice in enumerate(game.choice_list):
+                if choice.lower() == name:
+                    return i
+            return None
+        return action.choice_index
+
+
+DEFAULT_ACTION_SPACE = ActionSpace()
+
+
+class LegalActions:
+    """The legal actions in a game state, as a mask over an ActionSpace"""
+
+    def __init__(self, game, action_space=DEFAULT_ACTION_SPACE, out=None):
+        self.game = game
+        self.action_space = action_space
+        self.mask = action_space.get_mask(game, out)
+
+    def __len__(self):
+        return len(self.mask)
+
+    def __getitem__(self, index):
+        return self.mask[index] == 1
+
+    def get_indices(self):
+        return [i for i, legal in enumerate(self.mask) if legal]
+
+    def get_action(self, index):
+        if not self.mask[index]:
+            raise Exception("Action index {} is not legal in this state".format(index))
+        return self.action_space.get_action(self.game, index)
+
+    def get_index(self, action):
+        return self.action_space.get_index(self.game, action)
@@ -0,0 +1,187 @@
+import collections
+import os
+import selectors
+import time
+
+
+class SelectorConnection:
+    """Newline separated messages over a pair of file descriptors, with non-blocking reads and writes and no threads
+
+    Reading and writing only happen when the connection is polled, or when a message is sent and the descriptor can
+    take it at once. This needs file descriptors which support select, e.g. pipes and sockets on POSIX systems.
+
+    Both descriptors are non-blocking from the constructor until close. The mode belongs to the open file, not to this
+    object, so any other writes to the same file, e.g. print or logging to sys.stdout when it is the output, can fail
+    with BlockingIOError while the pipe is full.
+    """
+
+    def __init__(self, input_file, output_file, read_size=65536):
+        """
+        :param input_file: the file to read messages from, which must have a file descriptor
+        :type input_file: io.IOBase
+        :param output_file: the file to write messages to, which must have a file descriptor
+        :type output_file: io.IOBase
+        :param read_size: the most bytes read at once
+        :type read_size: int
+        """
+        # The files are kept, as closing them when they are garbage collected would close the descriptors too
+        self.input_file = input_file
+        self.output_file = output_file
+        self.input_fd = input_file.fileno()
+        self.output_fd = output_file.fileno()
+        self.read_size = read_size
+        # The blocking mode belongs to the open file, which can be shared with other processes, e.g. a terminal, so it
+        # is put back on close
+        self.input_was_blocking = os.get_blocking(self.input_fd)
+        self.output_was_blocking = os.get_blocking(self.output_fd)
+        os.set_blocking(self.input_fd, False)
+        os.set_blocking(self.output_fd, False)
+        self.selector = selectors.DefaultSelector()
+        self.registered_events = {}
+        self.read_buffer = bytearray()
+        self.write_buffer = bytearray()
+        self.messages = collections.deque()
+        self.end_of_input = False
+        self._update_registration()
+
+    def _update_registration(self):
+        # The input and output can share a descriptor, e.g. a socket, which can only be registered once
+        events = collections.defaultdict(int)
+        if not self.end_of_input:
+            events[self.input_fd] |= selectors.EVENT_READ
+        if len(self.write_buffer) > 0:
+            events[self.output_fd] |= selectors.EVENT_WRITE
+        for fd in list(self.registered_events):
+            if fd not in events:
+                self.selector.unregister(fd)
+                del self.registered_events[fd]
+        for fd, fd_events in events.items():
+            if fd not in self.registered_events:
+                self.selector.register(fd, fd_events)
+            elif self.registered_events[fd] != fd_events:
+                self.selector.modify(fd, fd_events)
+            self.registered_events[fd] = fd_events
+
+    def _read(self):
+        while True:
+            try:
+                data = os.read(self.input_fd, self.read_size)
+            except BlockingIOError:
+                break
+            if len(data) == 0:
+                # A last message without a newline is still a message, as it is when reading lines in threaded mode
+                if len(self.read_buffer) > 0:
+                    self.messages.append(self.read_buffer.decode("utf-8"))
+                    del self.read_buffer[:]
+                self.end_of_input = True
+                self._update_registration()
+                break
+            search_start = len(self.read_buffer)
+            self.read_buffer += data
+            # Only the new data can hold the end of a message
+            end = self.read_buffer.find(b"\n", search_start)
+            start = 0
+            while end >= 0:
+                self.messages.append(self.read_buffer[start:end].decode("utf-8"))
+                start = end + 1
+                end = self.read_buffer.find(b"\n", start)
+            del self.read_buffer[:start]
+
+    def _write(self):
+        try:
+            written = os.write(self.output_fd, self.write_buffer)
+        except BlockingIOError:
+            written = 0
+        del self.write_buffer[:written]
+        self._update_registration()
+
+    def poll(self, timeout=0.0):
+        """Read and write whatever the file descriptors are ready for, waiting up to timeout for either
+
+        :param timeout: the longest time to wait, in seconds, or None to wait until something is ready
+        :type timeout: float
+        :return: None
+        """
+        if len(self.registered_events) == 0:
+            return
+        for key, events in self.selector.select(timeout):
+            if events & selectors.EVENT_READ:
+                self._read()
+            if events & selectors.EVENT_WRITE and len(self.write_buffer) > 0:
+                self._write()
+
+    def get_message(self, block=False, timeout=None):
+        """Get the next message, reading more from the input if there is none waiting
+
+        :param block: set to True to wait for a message
+        :type block: bool
+        :param timeout: when blocking, the longest time to wait, in seconds, or None to wait forever
+        :type timeout: float
+        :return: the message, or None if there was none
+        :rtype: str
+        """
+        if len(self.messages) == 0:
+            if not block:
+                self.poll(0)
+            else:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while len(self.messages) == 0:
+                    if self.end_of_input:
+                        raise EOFError("The input was closed")
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self.poll(remaining)
+        if len(self.messages) > 0:
+            return self.messages.popleft()
+        return None
+
+    def send(self, message):
+        """Send a message, writing as much of it as possible at once and leaving the rest for later polls
+
+        :param message: the message, without a newline
+        :type message: str
+        :return: None
+        """
+        self.write_buffer += message.encode("utf-8")
+        self.write_buffer += b"\n"
+        self._write()
+
+    def flush(self, timeout=None):
+        """Wait until every message sent has been written
+
+        :param timeout: the longest time to wait, in seconds, or None to wait until done
+        :type timeout: float
+        :return: whether everything was written
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(self.write_buffer) > 0:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self.poll(remaining)
+        return True
+
+    def pending_output(self):
+        """Count the messages sent but not fully written yet
+
+        :return: the number of messages
+        :rtype: int
+        """
+        return self.write_buffer.count(b"\n")
+
+    def close(self):
+        """Stop using the file descriptors, and put back the blocking mode they had before
+
+        Anything not written yet is dropped, so call flush first to keep it. The files themselves are left open.
+        :return: None
+        """
+        if self.selector is None:
+            return
+        self.selector.close()
+        self.selector = None
+        self.registered_events = {}
+        del self.write_buffer[:]
+        os.set_blocking(self.output_fd, self.output_was_blocking)
+        os.set_blocking(self.input_fd, self.input_was_blocking)
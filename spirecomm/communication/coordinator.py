@@ -3,56 +3,125 @@ import queue
 import threading
 import json
 import collections
+import time
 
 from spirecomm.spire.game import Game
 from spirecomm.spire.screen import ScreenType
 from spirecomm.communication.action import Action, StartGameAction
 
 
-def read_stdin(input_queue):
-    """Read lines from stdin and write them to a queue
+def read_stdin(input_queue, input_file=None):
+    """Read lines from stdin and write them to a queue, followed by None at the end of the input
 
     :param input_queue: A queue, to which lines from stdin will be written
     :type input_queue: queue.Queue
+    :param input_file: the file to read from instead of stdin, if given
+    :type input_file: io.TextIOBase
     :return: None
     """
+    if input_file is None:
+        input_file = sys.stdin
     while True:
-        stdin_input = ""
-        while True:
-            input_char = sys.stdin.read(1)
-            if input_char == '\n':
-                break
-            else:
-                stdin_input += input_char
-        input_queue.put(stdin_input)
+        stdin_input = input_file.readline()
+        if stdin_input == '':
+            # End of file: nothing more will ever be received, which the reader is told with None
+            input_queue.put(None)
+            return
+        input_queue.put(stdin_input.rstrip('\n'))
 
 
-def write_stdout(output_queue):
+def write_stdout(output_queue, output_file=None):
     """Read lines from a queue and write them to stdout
 
     :param output_queue: A queue, from which this function will receive lines of text
     :type output_queue: queue.Queue
+    :param output_file: the file to write to instead of stdout, if given
+    :type output_file: io.TextIOBase
     :return: None
     """
+    if output_file is None:
+        output_file = sys.stdout
     while True:
         output = output_queue.get()
-        print(output, end='\n', flush=True)
+        print(output, end='\n', file=output_file, flush=True)
+
+
+class DeadlineStatistics:
+    """Statistics on decisions made with a deadline"""
+
+    def __init__(self):
+        self.decisions = 0
+        self.deadlines_hit = 0
+        self.candidates = 0
+        self.total_overrun = 0.0
+        self.max_overrun = 0.0
+
+    def record(self, candidates, deadline_hit, overrun):
+        self.decisions += 1
+        self.candidates += candidates
+        if deadline_hit:
+            self.deadlines_hit += 1
+        if overrun > 0:
+            self.total_overrun += overrun
+            self.max_overrun = max(self.max_overrun, overrun)
+
+    @property
+    def deadline_hit_rate(self):
+        if self.decisions == 0:
+            return 0.0
+        return self.deadlines_hit / self.decisions
+
+    def to_dict(self):
+        return {
+            "decisions": self.decisions,
+            "deadlines_hit": self.deadlines_hit,
+            "deadline_hit_rate": self.deadline_hit_rate,
+            "mean_candidates": self.candidates / self.decisions if self.decisions > 0 else 0.0,
+            "total_overrun_seconds": self.total_overrun,
+            "max_overrun_seconds": self.max_overrun
+        }
 
 
 class Coordinator:
     """An object to coordinate communication with Slay the Spire"""
 
-    def __init__(self):
-        self.input_queue = queue.Queue()
-        self.output_queue = queue.Queue()
-        self.input_thread = threading.Thread(target=read_stdin, args=(self.input_queue,))
-        self.output_thread = threading.Thread(target=write_stdout, args=(self.output_queue,))
-        self.input_thread.daemon = True
-        self.input_thread.start()
-        self.output_thread.daemon = True
-        self.output_thread.start()
+    def __init__(self, input_file=None, output_file=None, use_threads=True):
+        """Start communicating over stdin and stdout, or over the given files
+
+        By default, helper threads read messages and write commands. Without threads, reads and writes are non-blocking
+        and only happen inside the coordinator's own calls, e.g. poll, which suits embedding in another event loop and
+        deterministic profiling. That needs files with file descriptors which support select, e.g. pipes on POSIX. The
+        files are non-blocking until close is called, so anything else writing to them, e.g. print or logging to stdout,
+        can fail with BlockingIOError while the pipe is full.
+        :param input_file: the file to read messages from, instead of stdin
+        :type input_file: io.TextIOBase
+        :param output_file: the file to write commands to, instead of stdout
+        :type output_file: io.TextIOBase
+        :param use_threads: set to False to communicate from the calling thread only, using a selector
+        :type use_threads: bool
+        """
+        if use_threads:
+            self.connection = None
+            self.input_queue = queue.Queue()
+            self.output_queue = queue.Queue()
+            self.input_thread = threading.Thread(target=read_stdin, args=(self.input_queue, input_file))
+            self.output_thread = threading.Thread(target=write_stdout, args=(self.output_queue, output_file))
+            self.input_thread.daemon = True
+            self.input_thread.start()
+            self.output_thread.daemon = True
+            self.output_thread.start()
+        else:
+            from spirecomm.communication.connection import SelectorConnection
+            self.connection = SelectorConnection(input_file if input_file is not None else sys.stdin,
+                                                 output_file if output_file is not None else sys.stdout)
+            self.input_queue = None
+            self.output_queue = None
+            self.input_thread = None
+            self.output_thread = None
         self.action_queue = collections.deque()
         self.state_change_callback = None
+        self.state_change_time_limit = None
+        self.deadline_statistics = DeadlineStatistics()
         self.out_of_game_callback = None
         self.error_callback = None
         self.game_is_ready = False
@@ -60,6 +129,158 @@ class Coordinator:
         self.in_game = False
         self.last_game_state = None
         self.last_error = None
+        self.trace_file = None
+        self.memory_monitor = None
+        self.metrics = None
+        self.tracer = None
+        self.message_receive_time = None
+
+    def start_recording(self, trace_file):
+        """Record every message received and command sent, for replaying later
+
+        Each line of the trace is a JSON object, with either a "message" from Communication Mod or a "command" sent to it.
+        :param trace_file: the file to write the trace to
+        :type trace_file: io.TextIOBase
+        :return: None
+        """
+        self.trace_file = trace_file
+
+    def stop_recording(self):
+        """Stop recording messages and commands, and flush the trace
+
+        :return: None
+        """
+        if self.trace_file is not None:
+            self.trace_file.flush()
+        self.trace_file = None
+
+    def enable_memory_monitoring(self, output_file=None, interval=60.0, growth_threshold=1024 * 1024, top_n=20, frames=1):
+        """Periodically sample memory use while running, for finding leaks in long sessions
+
+        Samples are taken after receiving a message, at most once per interval. Each records the memory traced by
+        tracemalloc, the live Game, Card, Monster and other game objects, and the depth of the queues. Whenever traced
+        memory grows by more than growth_threshold bytes, the source lines which allocated the most are reported too.
+        Tracing slows down every allocation, so this is best left off except when looking for a leak.
+        :param output_file: the file to write samples and reports to, as JSON lines
+        :type output_file: io.TextIOBase
+        :param interval: the least time between samples, in seconds
+        :type interval: float
+        :param growth_threshold: the growth in traced memory, in bytes, which triggers a report
+        :type growth_threshold: int
+        :param top_n: the number of allocation differences in each report
+        :type top_n: int
+        :param frames: the number of stack frames tracemalloc stores for each allocation
+        :type frames: int
+        :return: the memory monitor, which keeps recent samples and reports
+        :rtype: MemoryMonitor
+        """
+        # Monitoring, metrics and tracing are imported when enabled, so that bots which never use them start faster
+        from spirecomm.communication.memory import MemoryMonitor
+        self.disable_memory_monitoring()
+        self.memory_monitor = MemoryMonitor(output_file, interval, growth_threshold, top_n, frames)
+        self.memory_monitor.start()
+        return self.memory_monitor
+
+    def disable_memory_monitoring(self):
+        """Stop sampling memory use, and stop tracemalloc if it was started for monitoring
+
+        :return: None
+        """
+        if self.memory_monitor is not None:
+            self.memory_monitor.stop()
+        self.memory_monitor = None
+
+    def enable_metrics(self, metrics=None, output_filename=None, interval=15.0, http_port=None, http_host="127.0.0.1"):
+        """Record metrics on games, decisions, latencies and queue depths, in the Prometheus text format
+
+        Callbacks are timed by the coordinator, so they need no changes. Pass the metrics to
+        CoordinatorMetrics.watch_agent to export the statistics of a SimpleAgent as well.
+        :param metrics: the metrics to record to, or None for new ones
+        :type metrics: CoordinatorMetrics
+        :param output_filename: if given, the file to rewrite with the metrics every interval
+        :type output_filename: str
+        :param interval: the time between rewrites of the file, in seconds
+        :type interval: float
+        :param http_port: if given, the port to serve the metrics on over HTTP, or 0 for any free port
+        :type http_port: int
+        :param http_host: the address to serve the metrics on
+        :type http_host: str
+        :return: the metrics
+        :rtype: CoordinatorMetrics
+        """
+        from spirecomm.communication.metrics import CoordinatorMetrics
+        self.disable_metrics()
+        if metrics is None:
+            metrics = CoordinatorMetrics()
+        metrics.watch_coordinator(self)
+        if output_filename is not None:
+            metrics.registry.start_file_export(output_filename, interval)
+        if http_port is not None:
+            metrics.registry.start_http_server(http_port, http_host)
+        self.metrics = metrics
+        return metrics
+
+    def disable_metrics(self):
+        """Stop recording metrics, writing the metrics file one last time and stopping the HTTP server
+
+        :return: None
+        """
+        if self.metrics is not None:
+            self.metrics.registry.close()
+        self.metrics = None
+
+    def enable_tracing(self, filename, sample_rate=0.01, slow_threshold=None, max_bytes=64 * 1024 * 1024, backup_count=3,
+                       seed=None):
+        """Write timed spans of a sample of decisions, for finding out where slow decisions spend their time
+
+        Each decision is split into receive, parse, callback, execute and send spans, and identified by a game ID and a
+        decision ID. Records are written as JSON lines by a background thread, so the loop never waits for the disk.
+        :param filename: the file to write the trace to, which is rotated when it grows past max_bytes
+        :type filename: str
+        :param sample_rate: the fraction of decisions to write
+        :type sample_rate: float
+        :param slow_threshold: if given, the duration in seconds above which every decision is written
+        :type slow_threshold: float
+        :param max_bytes: the size at which the file is rotated, or 0 to never rotate it
+        :type max_bytes: int
+        :param backup_count: the number of rotated files to keep
+        :type backup_count: int
+        :param seed: the seed of the random sampling
+        :type seed: int
+        :return: the tracer
+        :rtype: DecisionTracer
+        """
+        from spirecomm.communication.tracing import TraceWriter, DecisionTracer
+        self.disable_tracing()
+        writer = TraceWriter(filename, max_bytes, backup_count)
+        self.tracer = DecisionTracer(writer, sample_rate, slow_threshold, seed)
+        return self.tracer
+
+    def disable_tracing(self):
+        """Stop tracing, and write every queued record
+
+        :return: None
+        """
+        if self.tracer is not None:
+            self.tracer.close()
+        self.tracer = None
+
+    def close(self, timeout=1.0):
+        """Stop memory monitoring, metrics and tracing, and without threads, write what is left and release the files
+
+        Without threads, the files are set back to the blocking mode they had before, as it is shared with anything
+        else using them, e.g. a terminal. The files themselves are left open. With threads, the helper threads are
+        daemon threads, which end with the process.
+        :param timeout: without threads, the longest time to wait for commands still being written, in seconds
+        :type timeout: float
+        :return: None
+        """
+        self.disable_memory_monitoring()
+        self.disable_metrics()
+        self.disable_tracing()
+        if self.connection is not None:
+            self.connection.flush(timeout)
+            self.connection.close()
 
     def signal_ready(self):
         """Indicate to Communication Mod that setup is complete
@@ -76,8 +297,44 @@ class Coordinator:
         :type message: str
         :return: None
         """
-        self.output_queue.put(message)
+        if self.tracer is not None:
+            start_time = time.perf_counter()
+            self._send(message)
+            self.tracer.add_span("send", start_time, time.perf_counter())
+        else:
+            self._send(message)
         self.game_is_ready = False
+        if self.metrics is not None and self.message_receive_time is not None:
+            self.metrics.record_send(time.perf_counter() - self.message_receive_time)
+            self.message_receive_time = None
+        if self.trace_file is not None:
+            self.trace_file.write(json.dumps({"command": message}) + "\n")
+
+    def _send(self, message):
+        if self.connection is not None:
+            self.connection.send(message)
+        else:
+            self.output_queue.put(message)
+
+    def get_input_queue_size(self):
+        """Count the messages received but not handled yet
+
+        :return: the number of messages
+        :rtype: int
+        """
+        if self.connection is not None:
+            return len(self.connection.messages)
+        return self.input_queue.qsize()
+
+    def get_output_queue_size(self):
+        """Count the commands sent but not written yet
+
+        :return: the number of commands
+        :rtype: int
+        """
+        if self.connection is not None:
+            return self.connection.pending_output()
+        return self.output_queue.qsize()
 
     def add_action_to_queue(self, action):
         """Queue an action to perform when ready
@@ -101,15 +358,23 @@ class Coordinator:
         :return: None
         """
         action = self.action_queue.popleft()
-        action.execute(self)
+        if self.tracer is not None:
+            start_time = time.perf_counter()
+            action.execute(self)
+            self.tracer.add_span("execute", start_time, time.perf_counter())
+        else:
+            action.execute(self)
 
     def execute_next_action_if_ready(self):
         """Immediately execute the next action in the action queue, if ready to do so
 
-        :return: None
+        :return: whether an action was executed
+        :rtype: bool
         """
         if len(self.action_queue) > 0 and self.action_queue[0].can_be_executed(self):
             self.execute_next_action()
+            return True
+        return False
 
     def register_state_change_callback(self, new_callback):
         """Register a function to be called when a message is received from Communication Mod
@@ -119,6 +384,25 @@ class Coordinator:
         :return: None
         """
         self.state_change_callback = new_callback
+        self.state_change_time_limit = None
+
+    def register_anytime_state_change_callback(self, new_callback, time_limit):
+        """Register a function to be called with a deadline when a message is received from Communication Mod
+
+        The function should yield improving candidate actions. The last candidate yielded when the deadline passes,
+        or when the function finishes, is used. The deadline is only checked after each yield, so the function should
+        yield often and stop working once time.perf_counter() passes the deadline. Yielding None lets the deadline be
+        checked without offering a candidate; the function keeps running past the deadline until it yields an action.
+        A function which finishes without yielding any action is an error. SimpleAgent.get_next_action_in_game_anytime
+        is an example.
+        :param new_callback: the function to call
+        :type new_callback: function(game_state: Game, deadline: float) -> iterator(Action)
+        :param time_limit: the time allowed for each decision, in seconds
+        :type time_limit: float
+        :return: None
+        """
+        self.state_change_callback = new_callback
+        self.state_change_time_limit = time_limit
 
     def register_command_error_callback(self, new_callback):
         """Register a function to be called when an error is received from Communication Mod
@@ -138,35 +422,109 @@ class Coordinator:
         """
         self.out_of_game_callback = new_callback
 
-    def get_next_raw_message(self, block=False):
+    def get_state_change_action(self):
+        """Get the action to take in the latest game state from the state change callback
+
+        :return: the action to take
+        :rtype: Action
+        """
+        if self.metrics is not None:
+            start_time = time.perf_counter()
+            action = self._get_state_change_action()
+            self.metrics.record_decision(self.last_game_state.screen_type, time.perf_counter() - start_time)
+            return action
+        return self._get_state_change_action()
+
+    def _get_state_change_action(self):
+        if self.state_change_time_limit is None:
+            return self.state_change_callback(self.last_game_state)
+        deadline = time.perf_counter() + self.state_change_time_limit
+        candidates = self.state_change_callback(self.last_game_state, deadline)
+        if isinstance(candidates, Action):
+            self.deadline_statistics.record(1, False, time.perf_counter() - deadline)
+            return candidates
+        best_action = None
+        num_candidates = 0
+        deadline_hit = False
+        for candidate in candidates or ():
+            if candidate is not None:
+                best_action = candidate
+                num_candidates += 1
+            if best_action is not None and time.perf_counter() >= deadline:
+                deadline_hit = True
+                break
+        if deadline_hit and hasattr(candidates, "close"):
+            candidates.close()
+        if best_action is None:
+            # Queueing nothing would stall the game, and queueing None would fail later, far from the callback
+            raise RuntimeError("The anytime state change callback {} finished without yielding an action".format(
+                getattr(self.state_change_callback, "__qualname__", repr(self.state_change_callback))))
+        self.deadline_statistics.record(num_candidates, deadline_hit, time.perf_counter() - deadline)
+        return best_action
+
+    def get_next_raw_message(self, block=False, timeout=None):
         """Get the next message from Communication Mod as a string
 
         :param block: set to True to wait for the next message
         :type block: bool
-        :return: the message from Communication Mod
+        :param timeout: when blocking, the longest time to wait, in seconds, or None to wait forever
+        :type timeout: float
+        :return: the message from Communication Mod, or None if there was none
         :rtype: str
+        :raises EOFError: when blocking after the input was closed
         """
-        if block or not self.input_queue.empty():
-            return self.input_queue.get()
-
-    def receive_game_state_update(self, block=False, perform_callbacks=True):
+        if self.connection is not None:
+            return self.connection.get_message(block, timeout)
+        if block:
+            try:
+                message = self.input_queue.get(timeout=timeout)
+            except queue.Empty:
+                return None
+        elif not self.input_queue.empty():
+            message = self.input_queue.get()
+        else:
+            return None
+        if message is None:
+            # The end of the input is put back, so that every later read sees it too
+            self.input_queue.put(None)
+            if block:
+                raise EOFError("The input was closed")
+        return message
+
+    def receive_game_state_update(self, block=False, perform_callbacks=True, timeout=None):
         """Using the next message from Communication Mod, update the stored game state
 
         :param block: set to True to wait for the next message
         :type block: bool
         :param perform_callbacks: set to True to perform callbacks based on the new game state
         :type perform_callbacks: bool
+        :param timeout: when blocking, the longest time to wait, in seconds, or None to wait forever
+        :type timeout: float
         :return: whether a message was received
         """
-        message = self.get_next_raw_message(block)
+        message = self.get_next_raw_message(block, timeout)
         if message is not None:
+            timed = self.metrics is not None or self.tracer is not None
+            if timed:
+                self.message_receive_time = time.perf_counter()
+                if self.tracer is not None:
+                    self.tracer.start_decision(self.message_receive_time)
+            if self.trace_file is not None:
+                self.trace_file.write(json.dumps({"message": message}) + "\n")
             communication_state = json.loads(message)
             self.last_error = communication_state.get("error", None)
             self.game_is_ready = communication_state.get("ready_for_command")
             if self.last_error is None:
                 self.in_game = communication_state.get("in_game")
                 if self.in_game:
-                    self.last_game_state = Game.from_json(communication_state.get("game_state"), communication_state.get("available_commands"))
+                    self.last_game_state = Game.from_json(communication_state.get("game_state"), communication_state.get("available_commands"), self.last_game_state)
+            if timed:
+                parse_end_time = time.perf_counter()
+                if self.metrics is not None:
+                    self.metrics.record_message(parse_end_time - self.message_receive_time, self.last_error, self.in_game, self.last_game_state)
+                if self.tracer is not None:
+                    self.tracer.add_span("parse", self.message_receive_time, parse_end_time)
+                    self.tracer.set_state(self.in_game, self.last_game_state)
             if perform_callbacks:
                 if self.last_error is not None:
                     self.action_queue.clear()
@@ -174,26 +532,54 @@ class Coordinator:
                     self.add_action_to_queue(new_action)
                 elif self.in_game:
                     if len(self.action_queue) == 0 and perform_callbacks:
-                        new_action = self.state_change_callback(self.last_game_state)
+                        new_action = self.get_state_change_action()
                         self.add_action_to_queue(new_action)
                 elif self.stop_after_run:
                     self.clear_actions()
                 else:
                     new_action = self.out_of_game_callback()
                     self.add_action_to_queue(new_action)
+                if self.tracer is not None:
+                    self.tracer.add_span("callback", parse_end_time, time.perf_counter())
+            if self.memory_monitor is not None:
+                self.memory_monitor.check(self)
             return True
         return False
 
+    def poll(self, timeout=0.0, max_messages=None):
+        """Execute actions and handle messages until nothing more can be done without waiting
+
+        Meant to be called repeatedly from another event loop, especially without helper threads, where it also does all
+        of the reading and writing. With nothing to execute, it waits up to timeout for the first message.
+        :param timeout: the longest time to wait for a message, in seconds, or None to wait until one arrives
+        :type timeout: float
+        :param max_messages: if given, the most messages to handle, so that a fast game cannot hold up the event loop
+        :type max_messages: int
+        :return: the number of messages handled
+        :rtype: int
+        """
+        action_executed = self.execute_next_action_if_ready()
+        block = not action_executed and timeout != 0
+        messages_handled = 0
+        while max_messages is None or messages_handled < max_messages:
+            if not self.receive_game_state_update(block=block, timeout=timeout):
+                break
+            messages_handled += 1
+            block = False
+            self.execute_next_action_if_ready()
+        return messages_handled
+
     def run(self):
         """Start executing actions forever
 
         :return: None
         """
         while True:
-            self.execute_next_action_if_ready()
-            self.receive_game_state_update(perform_callbacks=True)
+            # With nothing to execute, only a new message can change anything, so wait for one instead of spinning
+            action_executed = self.execute_next_action_if_ready()
+            self.receive_game_state_update(block=not action_executed, perform_callbacks=True)
 
-    def play_one_game(self, player_class, ascension_level=0, seed=None):
+    def play_one_game(self, player_class, ascension_level=0, seed=None, timeout=None):
         """
 
         :param player_class: the class to play
@@ -202,18 +588,31 @@ class Coordinator:
         :type ascension_level: int
         :param seed: the alphanumeric seed to use
         :type seed: str
+        :param timeout: the longest time the whole game may take, in seconds, or None for no limit
+        :type timeout: float
         :return: True if the game was a victory, else False
         :rtype: bool
+        :raises TimeoutError: if the game took longer than the timeout
+        :raises EOFError: if the input was closed before the game ended
         """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def wait_for_update(perform_callbacks=True):
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            if not self.receive_game_state_update(block=True, perform_callbacks=perform_callbacks, timeout=remaining):
+                raise TimeoutError("The game took longer than {} seconds".format(timeout))
+
         self.clear_actions()
         while not self.game_is_ready:
-            self.receive_game_state_update(block=True, perform_callbacks=False)
+            wait_for_update(perform_callbacks=False)
         if not self.in_game:
             StartGameAction(player_class, ascension_level, seed).execute(self)
-            self.receive_game_state_update(block=True)
+            wait_for_update()
         while self.in_game:
-            self.execute_next_action_if_ready()
-            self.receive_game_state_update()
+            if self.execute_next_action_if_ready():
+                self.receive_game_state_update()
+            else:
+                wait_for_update()
         if self.last_game_state.screen_type == ScreenType.GAME_OVER:
             return self.last_game_state.screen.victory
         else:
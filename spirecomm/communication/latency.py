@@ -0,0 +1,39 @@
+import bisect
+
+
+class LatencyHistogram:
+    """Counts of latencies in fixed, roughly logarithmic buckets, plus the total and maximum"""
+
+    # Upper bounds of the buckets, in seconds. The last bucket holds everything slower.
+    BUCKET_BOUNDS = (
+        1e-6, 2e-6, 5e-6,
+        1e-5, 2e-5, 5e-5,
+        1e-4, 2e-4, 5e-4,
+        1e-3, 2e-3, 5e-3,
+        1e-2, 2e-2, 5e-2,
+        1e-1, 2e-1, 5e-1,
+        1.0, 2.0, 5.0
+    )
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(self.BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.bucket_counts[bisect.bisect_left(self.BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_seconds": self.total,
+            "mean_seconds": self.total / self.count if self.count > 0 else 0.0,
+            "max_seconds": self.max,
+            "bucket_bounds": list(self.BUCKET_BOUNDS) + [None],
+            "bucket_counts": list(self.bucket_counts)
+        }
@@ -0,0 +1,170 @@
+import collections
+import gc
+import json
+import time
+import tracemalloc
+
+from spirecomm.spire.game import Game
+from spirecomm.spire.card import Card
+from spirecomm.spire.character import Monster, Player
+from spirecomm.spire.map import Node
+from spirecomm.spire.potion import Potion
+from spirecomm.spire.power import Power
+from spirecomm.spire.relic import Relic
+
+
+TRACKED_TYPES = (Game, Card, Monster, Player, Power, Relic, Potion, Node)
+
+IGNORED_FILENAMES = frozenset([tracemalloc.__file__, "<frozen importlib._bootstrap>", "<unknown>"])
+
+
+class MemoryMonitor:
+    """Periodic memory samples for long-running bots, with a report of what grew whenever growth passes a threshold
+
+    Each sample records the memory traced by tracemalloc, the live count of each tracked type, and the depth of the
+    coordinator's queues. When traced memory has grown by more than growth_threshold bytes since the last report (or
+    since monitoring started), the largest allocation differences by source line are reported as well.
+    """
+
+    def __init__(self, output_file=None, interval=60.0, growth_threshold=1024 * 1024, top_n=20, frames=1,
+                 tracked_types=TRACKED_TYPES, max_samples=1000):
+        """
+        :param output_file: the file to write samples and reports to, as JSON lines
+        :type output_file: io.TextIOBase
+        :param interval: the least time between samples, in seconds
+        :type interval: float
+        :param growth_threshold: the growth in traced memory, in bytes, which triggers a report
+        :type growth_threshold: int
+        :param top_n: the number of allocation differences in each report
+        :type top_n: int
+        :param frames: the number of stack frames tracemalloc stores for each allocation
+        :type frames: int
+        :param tracked_types: the classes whose live instances are counted
+        :type tracked_types: tuple(type)
+        :param max_samples: the number of recent samples kept in memory
+        :type max_samples: int
+        """
+        self.output_file = output_file
+        self.interval = interval
+        self.growth_threshold = growth_threshold
+        self.top_n = top_n
+        self.frames = frames
+        self.tracked_types = frozenset(tracked_types)
+        self.samples = collections.deque(maxlen=max_samples)
+        self.reports = collections.deque(maxlen=max_samples)
+        self.reference_snapshot = None
+        self.reference_size = None
+        self.reference_objects = None
+        self.last_sample_time = None
+        self.started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.started_tracing = True
+        self.last_sample_time = None
+        self.reference_snapshot = None
+        self.reference_size = None
+        self.reference_objects = None
+
+    def stop(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        if self.output_file is not None:
+            self.output_file.flush()
+
+    def check(self, coordinator):
+        """Take a sample if the interval has passed since the last one
+
+        :param coordinator: the coordinator whose queues to measure
+        :type coordinator: Coordinator
+        :return: whether a sample was taken
+        :rtype: bool
+        """
+        if self.last_sample_time is not None and time.monotonic() - self.last_sample_time < self.interval:
+            return False
+        self.sample(coordinator)
+        # Measured from the end of the sample, so that slow snapshots cannot take up all of the time
+        self.last_sample_time = time.monotonic()
+        return True
+
+    def count_objects(self):
+        counts = collections.Counter()
+        tracked_types = self.tracked_types
+        for obj in gc.get_objects():
+            object_type = type(obj)
+            if object_type in tracked_types:
+                counts[object_type.__name__] += 1
+        return dict(counts)
+
+    def take_snapshot(self):
+        # Filtering every trace is slow in a large heap, so allocations by tracemalloc itself are left out of the
+        # differences instead, after grouping
+        return tracemalloc.take_snapshot()
+
+    def sample(self, coordinator=None):
+        """Record a sample now, and a report if memory has grown past the threshold
+
+        :param coordinator: the coordinator whose queues to measure
+        :type coordinator: Coordinator
+        :return: the sample
+        :rtype: dict
+        """
+        if not tracemalloc.is_tracing():
+            self.start()
+        traced_size, traced_peak = tracemalloc.get_traced_memory()
+        sample = {
+            "type": "sample",
+            "time": time.time(),
+            "traced_bytes": traced_size,
+            "traced_peak_bytes": traced_peak,
+            "objects": self.count_objects()
+        }
+        if coordinator is not None:
+            sample["action_queue"] = len(coordinator.action_queue)
+            sample["input_queue"] = coordinator.get_input_queue_size()
+            sample["output_queue"] = coordinator.get_output_queue_size()
+        self.samples.append(sample)
+        self._write(sample)
+
+        if self.reference_snapshot is None:
+            self.reference_snapshot = self.take_snapshot()
+            self.reference_size = traced_size
+            self.reference_objects = sample["objects"]
+        elif traced_size - self.reference_size > self.growth_threshold:
+            snapshot = self.take_snapshot()
+            self.report_growth(sample, snapshot)
+            self.reference_snapshot = snapshot
+            self.reference_size = traced_size
+            self.reference_objects = sample["objects"]
+        return sample
+
+    def report_growth(self, sample, snapshot):
+        differences = [difference for difference in snapshot.compare_to(self.reference_snapshot, "lineno")
+                       if difference.traceback[0].filename not in IGNORED_FILENAMES]
+        report = {
+            "type": "growth",
+            "time": sample["time"],
+            "growth_bytes": sample["traced_bytes"] - self.reference_size,
+            "traced_bytes": sample["traced_bytes"],
+            "objects": sample["objects"],
+            "top": [{
+                "location": str(difference.traceback),
+                "size_bytes": difference.size,
+                "size_diff_bytes": difference.size_diff,
+                "count": difference.count,
+                "count_diff": difference.count_diff
+            } for difference in differences[:self.top_n]]
+        }
+        object_names = set(sample["objects"]) | set(self.reference_objects)
+        report["object_diffs"] = {name: sample["objects"].get(name, 0) - self.reference_objects.get(name, 0) for name in object_names
+                                  if sample["objects"].get(name, 0) != self.reference_objects.get(name, 0)}
+        self.reports.append(report)
+        self._write(report)
+        return report
+
+    def _write(self, record):
+        if self.output_file is not None:
+            self.output_file.write(json.dumps(record) + "\n")
+            self.output_file.flush()
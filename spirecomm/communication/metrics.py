@@ -0,0 +1,386 @@
+import bisect
+import math
+import os
+import threading
+import time
+
+from spirecomm.communication.latency import LatencyHistogram
+from spirecomm.spire.screen import ScreenType
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if len(pairs) == 0:
+        return ""
+    return "{" + ",".join("{}=\"{}\"".format(name, _escape_label_value(value)) for name, value in pairs) + "}"
+
+
+class Metric:
+    """A named metric, with one value for each combination of label values"""
+
+    metric_type = "untyped"
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.functions = {}
+
+    def set_function(self, function, labels=()):
+        """Compute the value with the given labels when the metrics are exported, instead of storing it
+
+        :param function: returns the current value
+        :type function: function() -> float
+        :param labels: the label values, in the order of the label names
+        :type labels: tuple
+        :return: None
+        """
+        self.functions[tuple(labels)] = function
+
+    def get(self, labels=()):
+        labels = tuple(labels)
+        function = self.functions.get(labels)
+        if function is not None:
+            return function()
+        return self.values.get(labels, 0)
+
+    def render_samples(self):
+        # list() copies each dict in one step, so updates from the main thread cannot break an export in progress
+        samples = list(self.values.items())
+        samples += [(labels, function()) for labels, function in list(self.functions.items())]
+        if len(samples) == 0 and len(self.label_names) == 0:
+            samples = [((), 0)]
+        return ["{}{} {}".format(self.name, _format_labels(self.label_names, labels), _format_value(value))
+                for labels, value in sorted(samples, key=lambda sample: sample[0])]
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.description), "# TYPE {} {}".format(self.name, self.metric_type)]
+        return lines + self.render_samples()
+
+
+class Counter(Metric):
+    """A value which only increases, e.g. the number of games played"""
+
+    metric_type = "counter"
+
+    def inc(self, amount=1, labels=()):
+        labels = tuple(labels)
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """A value which can go up and down, e.g. a queue depth"""
+
+    metric_type = "gauge"
+
+    def set(self, value, labels=()):
+        self.values[tuple(labels)] = value
+
+    def inc(self, amount=1, labels=()):
+        labels = tuple(labels)
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, amount=1, labels=()):
+        self.inc(-amount, labels)
+
+
+class Histogram(Metric):
+    """Counts of observations in fixed buckets, plus their sum, e.g. of latencies"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name, description, label_names=(), bucket_bounds=LatencyHistogram.BUCKET_BOUNDS):
+        super().__init__(name, description, label_names)
+        self.bucket_bounds = tuple(bucket_bounds)
+
+    def observe(self, value, labels=()):
+        labels = tuple(labels)
+        state = self.values.get(labels)
+        if state is None:
+            # The bucket counts, then the sum and count of observations
+            state = [[0] * (len(self.bucket_bounds) + 1), 0.0, 0]
+            self.values[labels] = state
+        state[0][bisect.bisect_left(self.bucket_bounds, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def get(self, labels=()):
+        state = self.values.get(tuple(labels))
+        if state is None:
+            return 0, 0.0
+        return state[2], state[1]
+
+    def render_samples(self):
+        lines = []
+        samples = list(self.values.items())
+        if len(samples) == 0 and len(self.label_names) == 0:
+            samples = [((), ([0] * (len(self.bucket_bounds) + 1), 0.0, 0))]
+        for labels, (bucket_counts, total, count) in sorted(samples, key=lambda sample: sample[0]):
+            bucket_counts = list(bucket_counts)
+            cumulative = 0
+            for bound, bucket_count in zip(self.bucket_bounds + (math.inf,), bucket_counts):
+                cumulative += bucket_count
+                lines.append("{}_bucket{} {}".format(self.name, _format_labels(self.label_names, labels, [("le", _format_value(bound))]), cumulative))
+            label_text = _format_labels(self.label_names, labels)
+            lines.append("{}_sum{} {}".format(self.name, label_text, _format_value(total)))
+            lines.append("{}_count{} {}".format(self.name, label_text, count))
+        return lines
+
+
+class MetricsRegistry:
+    """A set of metrics, which can be exported in the Prometheus text format to a file or over HTTP"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.export_thread = None
+        self.export_stop = None
+        self.http_server = None
+
+    def _get_or_create(self, metric_class, name, description, label_names, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, description, label_names, **kwargs)
+                self.metrics[name] = metric
+            elif not isinstance(metric, metric_class):
+                raise ValueError("Metric {} already exists as a {}".format(name, metric.metric_type))
+            return metric
+
+    def counter(self, name, description, label_names=()):
+        return self._get_or_create(Counter, name, description, label_names)
+
+    def gauge(self, name, description, label_names=()):
+        return self._get_or_create(Gauge, name, description, label_names)
+
+    def histogram(self, name, description, label_names=(), bucket_bounds=LatencyHistogram.BUCKET_BOUNDS):
+        return self._get_or_create(Histogram, name, description, label_names, bucket_bounds=bucket_bounds)
+
+    def render(self):
+        """Export every metric in the Prometheus text format
+
+        :return: the metrics, as text
+        :rtype: str
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, filename):
+        """Write the metrics to a file, replacing it at once so that readers never see a partial file
+
+        :param filename: the file to write, e.g. in the textfile collector directory of a node exporter
+        :type filename: str
+        :return: None
+        """
+        temporary_filename = "{}.{}.tmp".format(filename, os.getpid())
+        with open(temporary_filename, "w") as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(temporary_filename, filename)
+
+    def start_file_export(self, filename, interval=15.0):
+        """Rewrite a file with the metrics periodically, from a background thread
+
+        :param filename: the file to write
+        :type filename: str
+        :param interval: the time between writes, in seconds
+        :type interval: float
+        :return: None
+        """
+        self.stop_file_export()
+        stop = threading.Event()
+
+        def export():
+            while not stop.wait(interval):
+                self.write_file(filename)
+            self.write_file(filename)
+
+        self.export_stop = stop
+        self.export_thread = threading.Thread(target=export)
+        self.export_thread.daemon = True
+        self.export_thread.start()
+
+    def stop_file_export(self):
+        """Stop rewriting the metrics file, after writing it one last time
+
+        :return: None
+        """
+        if self.export_thread is None:
+            return
+        self.export_stop.set()
+        self.export_thread.join()
+        self.export_thread = None
+        self.export_stop = None
+
+    def start_http_server(self, port, host="127.0.0.1"):
+        """Serve the metrics over HTTP from a background thread, on every path
+
+        :param port: the port to listen on, or 0 for any free port
+        :type port: int
+        :param host: the address to listen on, which is only the local machine by default
+        :type host: str
+        :return: the address being listened on
+        :rtype: tuple(str, int)
+        """
+        # http.server takes longer to import than the rest of the package, and most bots only write files
+        import http.server
+        self.stop_http_server()
+        registry = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.http_server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        self.http_server.daemon_threads = True
+        server_thread = threading.Thread(target=self.http_server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        return self.http_server.server_address
+
+    def stop_http_server(self):
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+
+    def close(self):
+        self.stop_file_export()
+        self.stop_http_server()
+
+
+class CoordinatorMetrics:
+    """The metrics of a Coordinator: games, floors, decisions by screen type, latencies and queue depths
+
+    The parse latency is the time to decode a message into a Game, the decide latency is the time taken by the state
+    change callback, and the send latency is the time from receiving a message to sending the command in response.
+    """
+
+    def __init__(self, registry=None, prefix="spirecomm"):
+        """
+        :param registry: the registry to add the metrics to, or None for a new one
+        :type registry: MetricsRegistry
+        :param prefix: the prefix of every metric name
+        :type prefix: str
+        """
+        if registry is None:
+            registry = MetricsRegistry()
+        self.registry = registry
+        self.prefix = prefix
+        self.start_time = time.monotonic()
+        self.games_started = registry.counter(prefix + "_games_started_total", "Games started")
+        self.games_won = registry.counter(prefix + "_games_won_total", "Games ended in victory")
+        self.games_lost = registry.counter(prefix + "_games_lost_total", "Games ended in defeat")
+        self.floors = registry.counter(prefix + "_floors_total", "Floors reached")
+        self.floors_per_hour = registry.gauge(prefix + "_floors_per_hour", "Floors reached per hour since metrics were enabled")
+        self.floors_per_hour.set_function(self.get_floors_per_hour)
+        self.messages = registry.counter(prefix + "_messages_total", "Messages received from Communication Mod")
+        self.errors = registry.counter(prefix + "_errors_total", "Errors received from Communication Mod")
+        self.decisions = registry.counter(prefix + "_decisions_total", "Decisions made in game", ["screen_type"])
+        self.parse_seconds = registry.histogram(prefix + "_parse_seconds", "Time to parse each message")
+        self.decide_seconds = registry.histogram(prefix + "_decide_seconds", "Time taken by the state change callback", ["screen_type"])
+        self.send_seconds = registry.histogram(prefix + "_send_seconds", "Time from receiving a message to sending a command")
+        self.queue_depth = registry.gauge(prefix + "_queue_depth", "Items waiting in each queue", ["queue"])
+        self.last_screen_type = None
+        self.last_floor = None
+        # None until the first message, so that a game already in progress when metrics start is not counted as started
+        self.last_in_game = None
+
+    def get_floors_per_hour(self):
+        hours = (time.monotonic() - self.start_time) / 3600
+        return self.floors.get() / hours if hours > 0 else 0.0
+
+    def watch_coordinator(self, coordinator):
+        """Export the depth of a coordinator's queues
+
+        :param coordinator: the coordinator
+        :type coordinator: Coordinator
+        :return: None
+        """
+        self.queue_depth.set_function(lambda: len(coordinator.action_queue), ["action"])
+        self.queue_depth.set_function(coordinator.get_input_queue_size, ["input"])
+        self.queue_depth.set_function(coordinator.get_output_queue_size, ["output"])
+
+    def watch_agent(self, agent):
+        """Export the decision cache and error counts of a SimpleAgent
+
+        :param agent: the agent
+        :type agent: SimpleAgent
+        :return: None
+        """
+        cache_lookups = self.registry.counter(self.prefix + "_decision_cache_lookups_total", "Decision cache lookups", ["result"])
+        cache_lookups.set_function(lambda: agent.decision_cache.hits, ["hit"])
+        cache_lookups.set_function(lambda: agent.decision_cache.misses, ["miss"])
+        cache_size = self.registry.gauge(self.prefix + "_decision_cache_entries", "Decisions in the decision cache")
+        cache_size.set_function(lambda: len(agent.decision_cache.entries))
+
+    def record_message(self, parse_seconds, error, in_game, game):
+        """Record a message received from Communication Mod
+
+        :param parse_seconds: the time to parse the message
+        :type parse_seconds: float
+        :param error: the error in the message, if any
+        :type error: str
+        :param in_game: whether the message was sent in game
+        :type in_game: bool
+        :param game: the game state after the message
+        :type game: Game
+        :return: None
+        """
+        self.messages.inc()
+        self.parse_seconds.observe(parse_seconds)
+        if error is not None:
+            self.errors.inc()
+            return
+        if not in_game:
+            self.last_screen_type = None
+            self.last_floor = None
+            self.last_in_game = False
+            return
+        # A game starts when the game is entered from outside one, or when a new run starts on a lower floor
+        if self.last_in_game is False or (self.last_floor is not None and game.floor < self.last_floor):
+            self.games_started.inc()
+        elif self.last_floor is not None and game.floor > self.last_floor:
+            self.floors.inc(game.floor - self.last_floor)
+        self.last_in_game = True
+        self.last_floor = game.floor
+        if game.screen_type == ScreenType.GAME_OVER and self.last_screen_type != ScreenType.GAME_OVER:
+            if game.screen.victory:
+                self.games_won.inc()
+            else:
+                self.games_lost.inc()
+        self.last_screen_type = game.screen_type
+
+    def record_decision(self, screen_type, seconds):
+        labels = (screen_type.name,)
+        self.decisions.inc(labels=labels)
+        self.decide_seconds.observe(seconds, labels)
+
+    def record_send(self, seconds):
+        self.send_seconds.observe(seconds)
@@ -0,0 +1,232 @@
+import itertools
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+
+class TraceWriter:
+    """Writes records as JSON lines from a background thread, rotating the file when it grows too large
+
+    Records are handed over through a bounded queue, so writing never waits for the disk. When the queue is full,
+    records are dropped and counted instead.
+    """
+
+    def __init__(self, filename, max_bytes=64 * 1024 * 1024, backup_count=3, max_pending=10000, flush_interval=1.0,
+                 buffer_size=64 * 1024):
+        """
+        :param filename: the file to write to
+        :type filename: str
+        :param max_bytes: the size at which the file is rotated, or 0 to never rotate it
+        :type max_bytes: int
+        :param backup_count: the number of rotated files to keep, as filename.1, filename.2 and so on
+        :type backup_count: int
+        :param max_pending: the number of records which can wait to be written before more are dropped
+        :type max_pending: int
+        :param flush_interval: the longest time a written record stays in the buffer, in seconds
+        :type flush_interval: float
+        :param buffer_size: the size of the file buffer, in bytes
+        :type buffer_size: int
+        """
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.records = queue.Queue(max_pending)
+        self.records_written = 0
+        self.records_dropped = 0
+        self.trace_file = open(filename, "a", buffering=buffer_size)
+        self.thread = threading.Thread(target=self._write_records)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, record):
+        """Queue a record to be written
+
+        :param record: the record, which must be serializable as JSON
+        :type record: dict
+        :return: whether the record was queued, rather than dropped
+        :rtype: bool
+        """
+        try:
+            self.records.put_nowait(record)
+            return True
+        except queue.Full:
+            self.records_dropped += 1
+            return False
+
+    def close(self):
+        """Write every queued record, then close the file
+
+        :return: None
+        """
+        if self.thread is None:
+            return
+        # Unlike records, the signal to stop is never dropped
+        self.records.put(None)
+        self.thread.join()
+        self.thread = None
+        self.trace_file.close()
+
+    def _write_records(self):
+        last_flush_time = time.monotonic()
+        while True:
+            try:
+                record = self.records.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = False
+            if record is None:
+                break
+            if record is not False:
+                self.trace_file.write(json.dumps(record) + "\n")
+                self.records_written += 1
+                if 0 < self.max_bytes <= self.trace_file.tell():
+                    self._rotate()
+            if time.monotonic() - last_flush_time >= self.flush_interval:
+                self.trace_file.flush()
+                last_flush_time = time.monotonic()
+        self.trace_file.flush()
+
+    def _rotate(self):
+        self.trace_file.close()
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = "{}.{}".format(self.filename, index)
+                if os.path.exists(source):
+                    os.replace(source, "{}.{}".format(self.filename, index + 1))
+            os.replace(self.filename, self.filename + ".1")
+        else:
+            os.remove(self.filename)
+        self.trace_file = open(self.filename, "a", buffering=self.buffer_size)
+
+
+class DecisionTracer:
+    """Timed spans of each decision in the Coordinator loop, of which a sample is written as JSON lines
+
+    A decision starts when a message is taken from the input queue and ends when the next one is. Its spans are
+    "receive", the time from sending the previous command to taking this message, "parse", "callback", "execute" and
+    "send". Each record has an ID for the game and for the decision within the game. A fraction of decisions are
+    sampled at random, and decisions slower than the slow threshold, from the message being taken to the last command
+    being sent, are always written when one is set.
+    """
+
+    def __init__(self, writer, sample_rate=0.01, slow_threshold=None, seed=None):
+        """
+        :param writer: the writer for the records
+        :type writer: TraceWriter
+        :param sample_rate: the fraction of decisions to write
+        :type sample_rate: float
+        :param slow_threshold: if given, the duration in seconds above which every decision is written
+        :type slow_threshold: float
+        :param seed: the seed of the random sampling
+        :type seed: int
+        """
+        self.writer = writer
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.random = random.Random(seed)
+        self.game_ids = itertools.count(1)
+        self.game_id = None
+        self.decision_id = 0
+        self.decision = None
+        self.decision_start = None
+        self.last_send_end = None
+        self.sampled = False
+        self.decisions_traced = 0
+        self.decisions_written = 0
+
+    def start_decision(self, start_time):
+        """Finish the current decision, and start timing the next one
+
+        :param start_time: the time the message was taken from the input queue, from time.perf_counter
+        :type start_time: float
+        :return: None
+        """
+        self.finish_decision()
+        self.sampled = self.random.random() < self.sample_rate
+        self.decision_id += 1
+        if not self.sampled and self.slow_threshold is None:
+            self.last_send_end = None
+            return
+        self.decision = {
+            "game_id": self.game_id,
+            "decision_id": self.decision_id,
+            "time": time.time(),
+            "spans": []
+        }
+        self.decision_start = start_time
+        if self.last_send_end is not None:
+            self.add_span("receive", self.last_send_end, start_time)
+        self.last_send_end = None
+
+    def add_span(self, name, start_time, end_time):
+        """Add a span to the current decision, if it is being traced
+
+        :param name: the name of the span
+        :type name: str
+        :param start_time: the start of the span, from time.perf_counter
+        :type start_time: float
+        :param end_time: the end of the span, from time.perf_counter
+        :type end_time: float
+        :return: None
+        """
+        if self.decision is not None:
+            self.decision["spans"].append({
+                "name": name,
+                "offset": start_time - self.decision_start,
+                "duration": end_time - start_time
+            })
+        if name == "send":
+            self.last_send_end = end_time
+
+    def set_state(self, in_game, game):
+        """Assign the current decision to a game, starting a new game when one begins
+
+        :param in_game: whether the message was sent in game
+        :type in_game: bool
+        :param game: the game state after the message
+        :type game: Game
+        :return: None
+        """
+        if not in_game:
+            self.game_id = None
+        elif self.game_id is None:
+            self.game_id = next(self.game_ids)
+            self.decision_id = 1
+        if self.decision is not None:
+            self.decision["game_id"] = self.game_id
+            self.decision["decision_id"] = self.decision_id
+            if in_game:
+                self.decision["screen_type"] = game.screen_type.name
+                self.decision["floor"] = game.floor
+
+    def finish_decision(self):
+        """Write the current decision if it was sampled or slow
+
+        :return: None
+        """
+        decision = self.decision
+        if decision is None:
+            return
+        self.decision = None
+        self.decisions_traced += 1
+        if self.last_send_end is None:
+            duration = max(span["offset"] + span["duration"] for span in decision["spans"]) if decision["spans"] else 0.0
+        else:
+            duration = self.last_send_end - self.decision_start
+        decision["duration"] = duration
+        if self.sampled or duration > self.slow_threshold:
+            decision["sampled"] = self.sampled
+            self.decisions_written += 1
+            self.writer.write(decision)
+
+    def close(self):
+        """Write the current decision if it was sampled or slow, then close the writer
+
+        :return: None
+        """
+        self.finish_decision()
+        self.writer.close()
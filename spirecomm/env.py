@@ -0,0 +1,334 @@
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from spirecomm.ai.encoding import GameEncoder
+from spirecomm.communication.action import ProceedAction, StartGameAction
+from spirecomm.communication.action_space import DEFAULT_ACTION_SPACE
+from spirecomm.spire.character import PlayerClass
+from spirecomm.spire.screen import ScreenType
+
+
+class GameReward:
+    """A reward for progress: floors climbed, HP gained or lost, and the outcome of the game"""
+
+    def __init__(self, floor_weight=1.0, hp_weight=1.0, victory_reward=10.0, defeat_reward=-1.0):
+        self.floor_weight = floor_weight
+        self.hp_weight = hp_weight
+        self.victory_reward = victory_reward
+        self.defeat_reward = defeat_reward
+
+    def __call__(self, previous_game, game):
+        """
+        :param previous_game: the game state before the step
+        :type previous_game: Game
+        :param game: the game state after the step
+        :type game: Game
+        :return: the reward for the step
+        :rtype: float
+        """
+        reward = self.floor_weight * ((game.floor or 0) - (previous_game.floor or 0))
+        max_hp = game.max_hp or 1
+        reward += self.hp_weight * ((game.current_hp or 0) - (previous_game.current_hp or 0)) / max_hp
+        if game.screen_type == ScreenType.GAME_OVER and previous_game.screen_type != ScreenType.GAME_OVER:
+            reward += self.victory_reward if game.screen.victory else self.defeat_reward
+        return reward
+
+
+class SpireEnv:
+    """A Gym-style environment over a Coordinator, with encoded observations and indices into an ActionSpace
+
+    step and reset return observations from the GameEncoder. Actions are indices into the action space, and the legal
+    ones are given by action_mask(). An episode is one game; if reset is called in the middle of a game, that game
+    continues, since Communication Mod can not abandon a run.
+    """
+
+    def __init__(self, coordinator_factory, player_class=PlayerClass.IRONCLAD, ascension_level=0, seed=None,
+                 encoder=None, action_space=DEFAULT_ACTION_SPACE, reward_function=None, illegal_action_reward=-0.1,
+                 max_steps=None):
+        """
+        :param coordinator_factory: creates a Coordinator connected to a game, or a stand-in for one
+        :type coordinator_factory: function() -> Coordinator
+        :param encoder: the observation encoder
+        :type encoder: GameEncoder
+        :param action_space: the action layout
+        :type action_space: ActionSpace
+        :param reward_function: computes the reward of each step from the game states before and after it
+        :type reward_function: function(previous_game: Game, game: Game) -> float
+        :param illegal_action_reward: the reward for choosing an illegal action, which is not sent to the game
+        :type illegal_action_reward: float
+        :param max_steps: the most steps in an episode before it is cut off, if any
+        :type max_steps: int
+        """
+        self.coordinator_factory = coordinator_factory
+        self.player_class = player_class
+        self.ascension_level = ascension_level
+        self.seed = seed
+        self.encoder = encoder if encoder is not None else GameEncoder()
+        self.action_space = action_space
+        self.reward_function = reward_function if reward_function is not None else GameReward()
+        self.illegal_action_reward = illegal_action_reward
+        self.max_steps = max_steps
+        self.observation_size = self.encoder.size
+        self.coordinator = None
+        self.game = None
+        self.legal_actions = None
+        self.steps = 0
+        # Buffers to write observations and masks into, e.g. rows of shared memory
+        self.observation_out = None
+        self.mask_out = None
+
+    def reset(self):
+        """Start a new game, or continue the current one
+
+        :return: the first observation
+        :rtype: numpy.ndarray
+        """
+        if self.coordinator is None:
+            self.coordinator = self.coordinator_factory()
+            self.coordinator.signal_ready()
+        coordinator = self.coordinator
+        coordinator.clear_actions()
+        self._wait_until_ready()
+        while coordinator.in_game and coordinator.last_game_state.screen_type == ScreenType.GAME_OVER:
+            ProceedAction().execute(coordinator)
+            self._wait_until_ready()
+        if not coordinator.in_game:
+            StartGameAction(self.player_class, self.ascension_level, self.seed).execute(coordinator)
+            self._wait_until_ready()
+        self.steps = 0
+        return self._observe()
+
+    def step(self, action_index):
+        """Take an action
+
+        :param action_index: the index of the action in the action space
+        :type action_index: int
+        :return: the observation, the reward, whether the episode is over, and extra information
+        :rtype: tuple(numpy.ndarray, float, bool, dict)
+        """
+        self.steps += 1
+        info = {}
+        previous_game = self.game
+        if not self.legal_actions[action_index]:
+            info["illegal_action"] = True
+            observation = self.observation_out if self.observation_out is not None else self.encoder.encode(previous_game)
+            return observation, self.illegal_action_reward, self._is_truncated(info), info
+        self.legal_actions.get_action(action_index).execute(self.coordinator)
+        self._wait_until_ready()
+        if self.coordinator.last_error is not None:
+            info["error"] = self.coordinator.last_error
+        observation = self._observe()
+        reward = self.reward_function(previous_game, self.game)
+        done = not self.coordinator.in_game or self.game.screen_type == ScreenType.GAME_OVER
+        if not done:
+            done = self._is_truncated(info)
+        return observation, reward, done, info
+
+    def action_mask(self):
+        """Get the legal actions in the current state
+
+        :return: 1 for each legal action index, and 0 otherwise
+        :rtype: numpy.ndarray
+        """
+        return np.frombuffer(self.legal_actions.mask, dtype=np.uint8)
+
+    def close(self):
+        """Close the coordinator, if one was created
+
+        :return: None
+        """
+        if self.coordinator is not None:
+            self.coordinator.close()
+            self.coordinator = None
+
+    def _is_truncated(self, info):
+        if self.max_steps is not None and self.steps >= self.max_steps:
+            info["truncated"] = True
+            return True
+        return False
+
+    def _wait_until_ready(self):
+        # Sending a command clears game_is_ready, so this waits for the response to the last command
+        while not self.coordinator.game_is_ready:
+            self.coordinator.receive_game_state_update(block=True, perform_callbacks=False)
+
+    def _observe(self):
+        self.game = self.coordinator.last_game_state
+        self.legal_actions = self.action_space.legal_actions(self.game, self.mask_out)
+        return self.encoder.encode(self.game, out=self.observation_out)
+
+
+class _SharedBuffers:
+
+    def __init__(self, buffer, num_envs, observation_size, action_size):
+        observations_bytes = num_envs * observation_size * 4
+        rewards_bytes = num_envs * 8
+        masks_bytes = num_envs * action_size
+        self.observations = np.ndarray((num_envs, observation_size), dtype=np.float32, buffer=buffer)
+        self.rewards = np.ndarray((num_envs,), dtype=np.float64, buffer=buffer, offset=observations_bytes)
+        self.masks = np.ndarray((num_envs, action_size), dtype=np.uint8, buffer=buffer, offset=observations_bytes + rewards_bytes)
+        self.dones = np.ndarray((num_envs,), dtype=np.bool_, buffer=buffer, offset=observations_bytes + rewards_bytes + masks_bytes)
+        mask_offset = observations_bytes + rewards_bytes
+        self.mask_views = [buffer[mask_offset + i * action_size:mask_offset + (i + 1) * action_size] for i in range(num_envs)]
+
+    def release(self):
+        self.observations = self.rewards = self.masks = self.dones = None
+        for view in self.mask_views:
+            view.release()
+        self.mask_views = []
+
+    @staticmethod
+    def get_size(num_envs, observation_size, action_size):
+        return num_envs * (observation_size * 4 + 8 + action_size + 1)
+
+
+def _attach_shared_memory(name):
+    # The creating process owns the memory, so the worker's resource tracker must not unlink it when the worker exits
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        memory = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+def _serve_vector_commands(connection, env, buffers, index):
+    while True:
+        command, argument = connection.recv()
+        if command == "step":
+            _, reward, done, info = env.step(argument)
+            buffers.rewards[index] = reward
+            buffers.dones[index] = done
+            if done:
+                # Start the next episode right away, as the vectorized environment's caller never calls reset
+                env.reset()
+            connection.send(info)
+        elif command == "reset":
+            env.reset()
+            connection.send(None)
+        elif command == "close":
+            return
+
+
+def _vector_worker(connection, env_factory, index):
+    env = env_factory()
+    connection.send((env.observation_size, env.action_space.size))
+    name, num_envs = connection.recv()
+    memory = _attach_shared_memory(name)
+    buffers = _SharedBuffers(memory.buf, num_envs, env.observation_size, env.action_space.size)
+    env.observation_out = buffers.observations[index]
+    env.mask_out = buffers.mask_views[index]
+    try:
+        _serve_vector_commands(connection, env, buffers, index)
+    finally:
+        # Every view of the shared memory must be released before it can be closed
+        env.observation_out = env.mask_out = env.legal_actions = None
+        buffers.release()
+        memory.close()
+        connection.close()
+        env.close()
+
+
+class SubprocessVectorEnv:
+    """Steps several SpireEnvs at once, each in its own process
+
+    Observations, rewards, done flags and action masks are written by the workers straight into shared memory, so
+    only the action indices and step information are sent between processes. When a worker's episode ends, it resets
+    its environment, and the next observation it writes is the first of the new episode.
+    """
+
+    def __init__(self, env_factories, context=None):
+        """
+        :param env_factories: one function per environment which creates it, in its worker process. They must be
+            picklable, e.g. module level functions or functools.partial objects.
+        :type env_factories: list(function() -> SpireEnv)
+        :param context: the multiprocessing context or start method to use
+        :type context: str
+        """
+        if context is None or isinstance(context, str):
+            context = multiprocessing.get_context(context)
+        self.num_envs = len(env_factories)
+        self.memory = None
+        self.buffers = None
+        self.closed = False
+        self.connections = []
+        self.processes = []
+        for index, env_factory in enumerate(env_factories):
+            parent_connection, child_connection = context.Pipe()
+            process = context.Process(target=_vector_worker, args=(child_connection, env_factory, index))
+            process.daemon = True
+            process.start()
+            child_connection.close()
+            self.connections.append(parent_connection)
+            self.processes.append(process)
+        sizes = [connection.recv() for connection in self.connections]
+        if len(set(sizes)) != 1:
+            self.close()
+            raise Exception("All environments must have the same observation and action sizes")
+        self.observation_size, self.action_size = sizes[0]
+        self.memory = shared_memory.SharedMemory(create=True, size=_SharedBuffers.get_size(self.num_envs, self.observation_size, self.action_size))
+        self.buffers = _SharedBuffers(self.memory.buf, self.num_envs, self.observation_size, self.action_size)
+        for connection in self.connections:
+            connection.send((self.memory.name, self.num_envs))
+
+    def reset(self):
+        """Reset every environment
+
+        :return: the first observation of each environment
+        :rtype: numpy.ndarray
+        """
+        for connection in self.connections:
+            connection.send(("reset", None))
+        for connection in self.connections:
+            connection.recv()
+        return self.buffers.observations.copy()
+
+    def step(self, action_indices):
+        """Take one action in each environment
+
+        :param action_indices: the action index for each environment
+        :type action_indices: list(int)
+        :return: the observations, rewards, done flags and step information of every environment
+        :rtype: tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray, list(dict))
+        """
+        for connection, action_index in zip(self.connections, action_indices):
+            connection.send(("step", int(action_index)))
+        infos = [connection.recv() for connection in self.connections]
+        return self.buffers.observations.copy(), self.buffers.rewards.copy(), self.buffers.dones.copy(), infos
+
+    def action_masks(self):
+        """Get the legal actions in the current state of each environment
+
+        :return: 1 for each legal action index, and 0 otherwise, with one row per environment
+        :rtype: numpy.ndarray
+        """
+        return self.buffers.masks.copy()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.memory is None:
+            # The workers never attached to shared memory
+            for process in self.processes:
+                process.terminate()
+            return
+        for connection in self.connections:
+            try:
+                connection.send(("close", None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self.processes:
+            process.join()
+        self.buffers.release()
+        self.buffers = None
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
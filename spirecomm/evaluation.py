@@ -0,0 +1,265 @@
+import argparse
+import collections
+import importlib
+import json
+import multiprocessing
+import time
+
+from spirecomm.spire.game import Game
+
+
+class TraceStep:
+    """A game state message from a recorded trace, and the command that was sent in response, if any"""
+
+    def __init__(self, index, message, command=None):
+        self.index = index
+        self.message = message
+        self.command = command
+
+
+def load_trace(filename):
+    """Load a trace recorded with Coordinator.start_recording
+
+    :param filename: the trace file
+    :type filename: str
+    :return: the recorded messages, each with the command that followed it
+    :rtype: list(TraceStep)
+    """
+    steps = []
+    with open(filename) as trace_file:
+        for line in trace_file:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            entry = json.loads(line)
+            if "message" in entry:
+                message = entry["message"]
+                if isinstance(message, str):
+                    message = json.loads(message)
+                steps.append(TraceStep(len(steps), message))
+            elif "command" in entry and len(steps) > 0 and steps[-1].command is None:
+                steps[-1].command = entry["command"]
+    return steps
+
+
+class CommandCapture:
+    """Stands in for a Coordinator, to find the command an action would send without sending it"""
+
+    def __init__(self, game_state):
+        self.last_game_state = game_state
+        self.game_is_ready = True
+        self.action_queue = collections.deque()
+        self.sent_messages = []
+
+    def send_message(self, message):
+        self.sent_messages.append(message)
+        self.game_is_ready = False
+
+    def add_action_to_queue(self, action):
+        self.action_queue.append(action)
+
+    def clear_actions(self):
+        self.action_queue.clear()
+
+    def get_command(self, action):
+        """Get the first command that executing the action would send
+
+        Actions like CardSelectAction only queue other actions, which are then executed against the same state.
+        :param action: the action to execute
+        :type action: Action
+        :return: the command, or None if no command would be sent
+        :rtype: str
+        """
+        action.execute(self)
+        while len(self.sent_messages) == 0 and len(self.action_queue) > 0:
+            self.action_queue.popleft().execute(self)
+        if len(self.sent_messages) == 0:
+            return None
+        return self.sent_messages[0]
+
+
+class TraceReport:
+    """The decisions, timings and differences from replaying an agent over one or more traces"""
+
+    def __init__(self, name=""):
+        self.name = name
+        self.decisions = 0
+        self.matches = 0
+        self.decide_seconds = 0.0
+        self.mismatches = []
+        self.errors = []
+
+    def add(self, other):
+        self.decisions += other.decisions
+        self.matches += other.matches
+        self.decide_seconds += other.decide_seconds
+        self.mismatches.extend(other.mismatches)
+        self.errors.extend(other.errors)
+
+    @property
+    def decisions_per_second(self):
+        if self.decide_seconds <= 0:
+            return 0.0
+        return self.decisions / self.decide_seconds
+
+    @property
+    def mismatch_rate(self):
+        if self.decisions == 0:
+            return 0.0
+        return (self.decisions - self.matches) / self.decisions
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "decisions": self.decisions,
+            "matches": self.matches,
+            "mismatch_rate": self.mismatch_rate,
+            "decide_seconds": self.decide_seconds,
+            "decisions_per_second": self.decisions_per_second,
+            "mismatches": self.mismatches,
+            "errors": self.errors
+        }
+
+
+def evaluate_trace(filename, agent_factory):
+    """Replay an agent over every recorded in-game state of a trace, and compare its commands to the recorded ones
+
+    :param filename: the trace file
+    :type filename: str
+    :param agent_factory: creates a fresh agent, with the same callbacks as SimpleAgent
+    :type agent_factory: function() -> SimpleAgent
+    :return: the report for this trace
+    :rtype: TraceReport
+    """
+    report = TraceReport(filename)
+    agent = agent_factory()
+    previous_game = None
+    for step in load_trace(filename):
+        message = step.message
+        if step.command is None or message.get("error") is not None or not message.get("in_game"):
+            continue
+        if not message.get("ready_for_command"):
+            continue
+        try:
+            game_state = Game.from_json(message.get("game_state"), message.get("available_commands"), previous_game)
+        except Exception as e:
+            report.errors.append({"step": step.index, "error": "parse: {}".format(e)})
+            continue
+        previous_game = game_state
+        if hasattr(agent, "change_class") and getattr(agent, "chosen_class", None) != game_state.character:
+            agent.change_class(game_state.character)
+        start_time = time.perf_counter()
+        try:
+            action = agent.get_next_action_in_game(game_state)
+        except Exception as e:
+            report.errors.append({"step": step.index, "error": "decide: {}".format(e)})
+            continue
+        finally:
+            report.decide_seconds += time.perf_counter() - start_time
+        report.decisions += 1
+        try:
+            command = CommandCapture(game_state).get_command(action) if action is not None else None
+        except Exception as e:
+            command = "<error: {}>".format(e)
+        if command == step.command:
+            report.matches += 1
+        else:
+            report.mismatches.append({
+                "trace": filename,
+                "step": step.index,
+                "screen_type": game_state.screen_type.name,
+                "recorded": step.command,
+                "chosen": command
+            })
+    return report
+
+
+def _evaluate_trace_job(arguments):
+    filename, agent_factory = arguments
+    return evaluate_trace(filename, agent_factory)
+
+
+def evaluate_traces(filenames, agent_factory, processes=None):
+    """Replay an agent over many traces in a process pool
+
+    :param filenames: the trace files
+    :type filenames: list(str)
+    :param agent_factory: creates a fresh agent for each trace. Must be picklable, e.g. a class or module level function.
+    :type agent_factory: function() -> SimpleAgent
+    :param processes: the number of worker processes. If 1, traces are replayed in this process.
+    :type processes: int
+    :return: the combined report, and the report for each trace
+    :rtype: tuple(TraceReport, list(TraceReport))
+    """
+    jobs = [(filename, agent_factory) for filename in filenames]
+    if processes == 1:
+        trace_reports = [_evaluate_trace_job(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            trace_reports = pool.map(_evaluate_trace_job, jobs)
+    total = TraceReport("total")
+    for trace_report in trace_reports:
+        total.add(trace_report)
+    return total, trace_reports
+
+
+def find_regressions(report, baseline, max_mismatch_rate_increase=0.0, max_slowdown=0.2):
+    """Compare a report against a baseline report, as produced by TraceReport.to_dict
+
+    :param report: the new report
+    :type report: dict
+    :param baseline: the baseline report
+    :type baseline: dict
+    :param max_mismatch_rate_increase: the allowed increase in the fraction of decisions that differ from the traces
+    :type max_mismatch_rate_increase: float
+    :param max_slowdown: the allowed fractional decrease in decisions per second
+    :type max_slowdown: float
+    :return: a description of each regression found
+    :rtype: list(str)
+    """
+    regressions = []
+    if report["mismatch_rate"] > baseline["mismatch_rate"] + max_mismatch_rate_increase:
+        regressions.append("Mismatch rate increased from {:.4f} to {:.4f}".format(baseline["mismatch_rate"], report["mismatch_rate"]))
+    if report["decisions_per_second"] < baseline["decisions_per_second"] * (1 - max_slowdown):
+        regressions.append("Decisions per second dropped from {:.1f} to {:.1f}".format(baseline["decisions_per_second"], report["decisions_per_second"]))
+    if len(report["errors"]) > len(baseline["errors"]):
+        regressions.append("Errors increased from {} to {}".format(len(baseline["errors"]), len(report["errors"])))
+    return regressions
+
+
+def load_factory(path):
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an agent over recorded Communication Mod traces")
+    parser.add_argument("traces", nargs="+", help="trace files recorded with Coordinator.start_recording")
+    parser.add_argument("--agent", default="spirecomm.ai.agent:SimpleAgent", help="the agent factory, as module:attribute")
+    parser.add_argument("--processes", type=int, default=None, help="the number of worker processes")
+    parser.add_argument("--output", help="write the report to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON report, and exit with an error on regressions")
+    parser.add_argument("--max-slowdown", type=float, default=0.2, help="the allowed fractional drop in decisions per second")
+    parser.add_argument("--max-mismatch-increase", type=float, default=0.0, help="the allowed increase in mismatch rate")
+    args = parser.parse_args()
+
+    total, trace_reports = evaluate_traces(args.traces, load_factory(args.agent), args.processes)
+    result = total.to_dict()
+    result["traces"] = [dict(trace_report.to_dict(), mismatches=len(trace_report.mismatches)) for trace_report in trace_reports]
+    print("{} decisions, {:.1f} decisions/second, {} mismatches, {} errors".format(
+        total.decisions, total.decisions_per_second, len(total.mismatches), len(total.errors)))
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(result, output_file, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = find_regressions(result, baseline, args.max_mismatch_increase, args.max_slowdown)
+        for regression in regressions:
+            print("REGRESSION: " + regression)
+        if len(regressions) > 0:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
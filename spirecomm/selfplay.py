@@ -0,0 +1,248 @@
+import collections
+import functools
+import itertools
+import math
+import multiprocessing
+import time
+
+from spirecomm.spire.screen import ScreenType
+
+
+class SelfPlayJob:
+    """A game to play: the class, ascension level and seed to start it with"""
+
+    def __init__(self, player_class, ascension_level=0, seed=None):
+        self.player_class = player_class
+        self.ascension_level = ascension_level
+        self.seed = seed
+
+
+class SelfPlayResult:
+    """The outcome of one self-play game, or of a game which failed before it ended"""
+
+    def __init__(self, player_class, ascension_level, seed, floor, victory, score, seconds, error=None):
+        self.player_class = player_class
+        self.ascension_level = ascension_level
+        self.seed = seed
+        self.floor = floor
+        self.victory = victory
+        self.score = score
+        self.seconds = seconds
+        self.error = error
+
+    def to_dict(self):
+        return {
+            "class": self.player_class.name,
+            "ascension_level": self.ascension_level,
+            "seed": self.seed,
+            "floor": self.floor,
+            "victory": self.victory,
+            "score": self.score,
+            "seconds": self.seconds,
+            "error": self.error
+        }
+
+
+def make_jobs(player_classes, ascension_levels=(0,), seeds=(None,)):
+    """Make one job for every combination of class, ascension level and seed
+
+    :return: the jobs
+    :rtype: list(SelfPlayJob)
+    """
+    return [SelfPlayJob(player_class, ascension_level, seed)
+            for player_class, ascension_level, seed in itertools.product(player_classes, ascension_levels, seeds)]
+
+
+def wilson_interval(successes, trials, z=1.96):
+    """Get the Wilson score confidence interval for a binomial proportion
+
+    :return: the lower and upper bounds of the interval
+    :rtype: tuple(float, float)
+    """
+    if trials == 0:
+        return 0.0, 1.0
+    proportion = successes / trials
+    denominator = 1 + z * z / trials
+    centre = (proportion + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(proportion * (1 - proportion) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+class RunningStatistics:
+    """Win and floor statistics over a stream of self-play results"""
+
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        self.floor_total = 0
+        self.floor_squares = 0
+
+    def add(self, result):
+        self.games += 1
+        if result.victory:
+            self.wins += 1
+        self.floor_total += result.floor
+        self.floor_squares += result.floor * result.floor
+
+    def summary(self, z=1.96):
+        win_low, win_high = wilson_interval(self.wins, self.games, z)
+        mean_floor = self.floor_total / self.games if self.games > 0 else 0.0
+        if self.games > 1:
+            variance = (self.floor_squares - self.games * mean_floor * mean_floor) / (self.games - 1)
+            floor_margin = z * math.sqrt(max(variance, 0.0) / self.games)
+        else:
+            floor_margin = math.inf
+        return {
+            "games": self.games,
+            "wins": self.wins,
+            "win_rate": self.wins / self.games if self.games > 0 else 0.0,
+            "win_rate_interval": [win_low, win_high],
+            "mean_floor": mean_floor,
+            "mean_floor_interval": [mean_floor - floor_margin, mean_floor + floor_margin]
+        }
+
+
+class SelfPlayAggregator:
+    """Collects self-play results as they stream in, with throughput and win rates by class and ascension"""
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.overall = RunningStatistics()
+        self.groups = collections.defaultdict(RunningStatistics)
+        self.results = []
+        self.failures = 0
+
+    def add(self, result):
+        self.results.append(result)
+        if result.error is not None:
+            # A failed game says nothing about how well the agent plays
+            self.failures += 1
+            return
+        self.overall.add(result)
+        self.groups[(result.player_class, result.ascension_level)].add(result)
+
+    @property
+    def games_per_hour(self):
+        elapsed = time.perf_counter() - self.start_time
+        if elapsed <= 0:
+            return 0.0
+        return self.overall.games * 3600 / elapsed
+
+    def summary(self):
+        return {
+            "games_per_hour": self.games_per_hour,
+            "failures": self.failures,
+            "overall": self.overall.summary(),
+            "groups": [dict(statistics.summary(), **{"class": player_class.name, "ascension_level": ascension_level})
+                       for (player_class, ascension_level), statistics in sorted(self.groups.items(), key=lambda item: (item[0][0].value, item[0][1]))]
+        }
+
+    def format_report(self):
+        lines = ["{:.1f} games/hour".format(self.games_per_hour)]
+        rows = [("all", self.overall)] + [("{} A{}".format(player_class.name, ascension_level), statistics)
+                                          for (player_class, ascension_level), statistics in sorted(self.groups.items(), key=lambda item: (item[0][0].value, item[0][1]))]
+        for name, statistics in rows:
+            summary = statistics.summary()
+            lines.append("{}: {} games, win rate {:.3f} [{:.3f}, {:.3f}], mean floor {:.1f}".format(
+                name, summary["games"], summary["win_rate"], summary["win_rate_interval"][0],
+                summary["win_rate_interval"][1], summary["mean_floor"]))
+        if self.failures > 0:
+            lines.append("{} failed games".format(self.failures))
+        return "\n".join(lines)
+
+
+_worker_factories = None
+_worker_session = None
+
+
+def _start_session(coordinator_factory, agent_factory):
+    coordinator = coordinator_factory()
+    agent = agent_factory()
+    coordinator.signal_ready()
+    coordinator.register_command_error_callback(agent.handle_error)
+    coordinator.register_state_change_callback(agent.get_next_action_in_game)
+    coordinator.register_out_of_game_callback(agent.get_next_action_out_of_game)
+    return coordinator, agent
+
+
+def _init_worker(coordinator_factory, agent_factory):
+    global _worker_factories
+    _worker_factories = (coordinator_factory, agent_factory)
+
+
+def _play_job(job, session, game_timeout=None):
+    coordinator, agent = session
+    agent.change_class(job.player_class)
+    start_time = time.perf_counter()
+    try:
+        victory = coordinator.play_one_game(job.player_class, job.ascension_level, job.seed, game_timeout)
+    except (TimeoutError, EOFError) as error:
+        game_state = coordinator.last_game_state
+        floor = game_state.floor if game_state is not None else None
+        return SelfPlayResult(job.player_class, job.ascension_level, job.seed, floor, False, None,
+                              time.perf_counter() - start_time, "{}: {}".format(type(error).__name__, error))
+    seconds = time.perf_counter() - start_time
+    game_state = coordinator.last_game_state
+    score = None
+    if game_state.screen_type == ScreenType.GAME_OVER:
+        score = game_state.screen.score
+    return SelfPlayResult(job.player_class, job.ascension_level, job.seed, game_state.floor, victory, score, seconds)
+
+
+def _play_worker_job(job, game_timeout=None):
+    global _worker_session
+    if _worker_session is None:
+        _worker_session = _start_session(*_worker_factories)
+    result = _play_job(job, _worker_session, game_timeout)
+    if result.error is not None:
+        # The session was left partway through a game, or without a game at all, so the next job gets a new one
+        _worker_session[0].close(timeout=0)
+        _worker_session = None
+    return result
+
+
+def run_selfplay(coordinator_factory, agent_factory, jobs, processes=None, on_result=None, game_timeout=None):
+    """Play many games in parallel worker processes, aggregating the results as they arrive
+
+    Each worker process creates one coordinator and one agent, and plays its share of the jobs with them.
+    The factories are called in the worker processes, so they must be picklable, e.g. module level functions.
+    A game which times out, or whose input is closed, is reported as a failed result, with its error, and the worker
+    starts a new coordinator and agent for its next game.
+
+    :param coordinator_factory: creates a Coordinator connected to a game, or a stand-in for one
+    :type coordinator_factory: function() -> Coordinator
+    :param agent_factory: creates an agent, with the same callbacks as SimpleAgent
+    :type agent_factory: function() -> SimpleAgent
+    :param jobs: the games to play
+    :type jobs: list(SelfPlayJob)
+    :param processes: the number of worker processes. If 1, games are played in this process.
+    :type processes: int
+    :param on_result: called after each game with the result and the aggregator
+    :type on_result: function(result: SelfPlayResult, aggregator: SelfPlayAggregator) -> None
+    :param game_timeout: the longest time one game may take, in seconds, or None for no limit
+    :type game_timeout: float
+    :return: the aggregated results
+    :rtype: SelfPlayAggregator
+    """
+    aggregator = SelfPlayAggregator()
+
+    def handle_result(result):
+        aggregator.add(result)
+        if on_result is not None:
+            on_result(result, aggregator)
+
+    if processes == 1:
+        session = None
+        for job in jobs:
+            if session is None:
+                session = _start_session(coordinator_factory, agent_factory)
+            result = _play_job(job, session, game_timeout)
+            if result.error is not None:
+                session[0].close(timeout=0)
+                session = None
+            handle_result(result)
+    else:
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(coordinator_factory, agent_factory)) as pool:
+            for result in pool.imap_unordered(functools.partial(_play_worker_job, game_timeout=game_timeout), jobs):
+                handle_result(result)
+    return aggregator
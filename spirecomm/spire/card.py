@@ -1,3 +1,4 @@
+import sys
 from enum import Enum
 
 
@@ -36,7 +37,7 @@ class Card:
     @classmethod
     def from_json(cls, json_object):
         return cls(
-            card_id=json_object["id"],
+            card_id=sys.intern(json_object["id"]),
             name=json_object["name"],
             card_type=CardType[json_object["type"]],
             rarity=CardRarity[json_object["rarity"]],
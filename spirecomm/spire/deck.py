@@ -0,0 +1,129 @@
+import collections
+
+
+def _card_signature(card):
+    return card.uuid, card.card_id, card.type, card.cost, card.upgrades
+
+
+class DeckSummary:
+    """Counts of the cards in a deck by id, type, cost and upgrade state"""
+
+    # Above this fraction of changed cards, rebuilding from scratch is cheaper than applying the changes
+    MAX_CHANGED_FRACTION = 0.25
+
+    def __init__(self):
+        self.size = 0
+        self.upgraded = 0
+        self.counts_by_id = collections.Counter()
+        self.counts_by_type = collections.Counter()
+        self.counts_by_cost = collections.Counter()
+        self.signatures = {}
+        # The Communication Mod JSON of the cards summarized, if known, which later versions of the deck are diffed with
+        self.cards_json = None
+
+    @classmethod
+    def from_cards(cls, cards, cards_json=None):
+        summary = cls()
+        for card in cards:
+            summary.add_card(card)
+        summary.cards_json = cards_json
+        return summary
+
+    def copy(self):
+        summary = DeckSummary()
+        summary.size = self.size
+        summary.upgraded = self.upgraded
+        summary.counts_by_id = self.counts_by_id.copy()
+        summary.counts_by_type = self.counts_by_type.copy()
+        summary.counts_by_cost = self.counts_by_cost.copy()
+        summary.signatures = self.signatures.copy()
+        summary.cards_json = self.cards_json
+        return summary
+
+    def add_card(self, card):
+        self._add_signature(_card_signature(card))
+
+    def remove_card(self, card):
+        signature = self.signatures.get(card.uuid)
+        if signature is not None:
+            self._remove_signature(signature)
+
+    def _add_signature(self, signature):
+        uuid, card_id, card_type, cost, upgrades = signature
+        if uuid in self.signatures:
+            self._remove_signature(self.signatures[uuid])
+        self.signatures[uuid] = signature
+        self.size += 1
+        self.counts_by_id[card_id] += 1
+        self.counts_by_type[card_type] += 1
+        self.counts_by_cost[cost] += 1
+        if upgrades > 0:
+            self.upgraded += 1
+
+    def _remove_signature(self, signature):
+        uuid, card_id, card_type, cost, upgrades = signature
+        del self.signatures[uuid]
+        self.size -= 1
+        self.counts_by_id[card_id] -= 1
+        if self.counts_by_id[card_id] == 0:
+            del self.counts_by_id[card_id]
+        self.counts_by_type[card_type] -= 1
+        if self.counts_by_type[card_type] == 0:
+            del self.counts_by_type[card_type]
+        self.counts_by_cost[cost] -= 1
+        if self.counts_by_cost[cost] == 0:
+            del self.counts_by_cost[cost]
+        if upgrades > 0:
+            self.upgraded -= 1
+
+    def updated(self, cards, cards_json):
+        """Get the summary of a new version of the deck, applying only the cards which changed
+
+        Cards are only added, removed or changed in a few places at once, so the new deck is compared with the old one
+        as JSON, and only the run of cards between their common start and common end is applied. An unchanged deck is
+        found with a single list comparison, without looking at the cards.
+        :param cards: the cards in the new deck
+        :type cards: list(Card)
+        :param cards_json: the Communication Mod JSON of the same cards
+        :type cards_json: list(dict)
+        :return: the summary of the new deck. This summary is left unchanged.
+        :rtype: DeckSummary
+        """
+        old_json = self.cards_json
+        if old_json is None:
+            return DeckSummary.from_cards(cards, cards_json)
+        if cards_json is old_json or cards_json == old_json:
+            return self
+        common_size = min(len(old_json), len(cards_json))
+        start = 0
+        while start < common_size and old_json[start] == cards_json[start]:
+            start += 1
+        end = 0
+        while end < common_size - start and old_json[-1 - end] == cards_json[-1 - end]:
+            end += 1
+        removed = old_json[start:len(old_json) - end]
+        added = cards[start:len(cards) - end]
+        if len(removed) + len(added) > self.MAX_CHANGED_FRACTION * max(len(cards), 1):
+            return DeckSummary.from_cards(cards, cards_json)
+        summary = self.copy()
+        for json_card in removed:
+            signature = summary.signatures.get(json_card["uuid"])
+            if signature is not None:
+                summary._remove_signature(signature)
+        for card in added:
+            summary.add_card(card)
+        summary.cards_json = cards_json
+        return summary
+
+    def count(self, card_id):
+        return self.counts_by_id.get(card_id, 0)
+
+    def count_type(self, card_type):
+        return self.counts_by_type.get(card_type, 0)
+
+    def count_cost(self, cost):
+        return self.counts_by_cost.get(cost, 0)
+
+    @property
+    def unupgraded(self):
+        return self.size - self.upgraded
@@ -2,6 +2,7 @@ from enum import Enum
 
 import spirecomm.spire.relic
 import spirecomm.spire.card
+import spirecomm.spire.deck
 import spirecomm.spire.character
 import spirecomm.spire.map
 import spirecomm.spire.potion
@@ -32,8 +33,11 @@ class Game:
         self.ascension_level = None
         self.relics = []
         self.deck = []
+        self.deck_json = None
         self.potions = []
         self.map = []
+        self.deck_summary = None
+        self.previous_deck_summary = None
 
         # Combat state
 
@@ -68,7 +72,7 @@ class Game:
         self.cancel_available = False
 
     @classmethod
-    def from_json(cls, json_state, available_commands):
+    def from_json(cls, json_state, available_commands, previous_game=None):
         game = cls()
         game.current_action = json_state.get("current_action", None)
         game.current_hp = json_state.get("current_hp")
@@ -80,10 +84,13 @@ class Game:
         game.character = spirecomm.spire.character.PlayerClass[json_state.get("class")]
         game.ascension_level = json_state.get("ascension_level")
         game.relics = [spirecomm.spire.relic.Relic.from_json(json_relic) for json_relic in json_state.get("relics")]
-        game.deck = [spirecomm.spire.card.Card.from_json(json_card) for json_card in json_state.get("deck")]
+        game.deck_json = json_state.get("deck")
+        game.deck = [spirecomm.spire.card.Card.from_json(json_card) for json_card in game.deck_json]
         game.map = spirecomm.spire.map.Map.from_json(json_state.get("map"))
         game.potions = [spirecomm.spire.potion.Potion.from_json(potion) for potion in json_state.get("potions")]
         game.act_boss = json_state.get("act_boss", None)
+        if previous_game is not None:
+            game.previous_deck_summary = previous_game.deck_summary or previous_game.previous_deck_summary
 
         # Screen State
 
@@ -127,6 +134,15 @@ class Game:
 
         return game
 
+    def get_deck_summary(self):
+        if self.deck_summary is None:
+            if self.previous_deck_summary is not None:
+                self.deck_summary = self.previous_deck_summary.updated(self.deck, self.deck_json)
+            else:
+                self.deck_summary = spirecomm.spire.deck.DeckSummary.from_cards(self.deck, self.deck_json)
+            self.previous_deck_summary = None
+        return self.deck_summary
+
     def are_potions_full(self):
         for potion in self.potions:
             if potion.potion_id == "Potion Slot":
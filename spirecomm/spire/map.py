@@ -1,3 +1,7 @@
+import heapq
+import math
+
+
 class Node:
 
     def __init__(self, x, y, symbol):
@@ -50,3 +54,121 @@ class Map:
                     parent_node.children.append(child_node)
 
         return dungeon_map
+
+
+class MapIndex:
+    """Precomputed routing information for a Map, built once per act
+
+    Nodes are numbered in order of increasing y, then x. Paths are scored by summing a reward per node symbol.
+    """
+
+    def __init__(self, dungeon_map):
+        self.map = dungeon_map
+        self.nodes = [dungeon_map.nodes[y][x] for y in sorted(dungeon_map.nodes) for x in sorted(dungeon_map.nodes[y])]
+        self.node_ids = {(node.x, node.y): i for i, node in enumerate(self.nodes)}
+        self.symbols = [node.symbol for node in self.nodes]
+        self.children = [[self.node_ids[(child.x, child.y)] for child in node.children] for node in self.nodes]
+        self.parents = [[] for _ in self.nodes]
+        for node_id, children in enumerate(self.children):
+            for child_id in children:
+                self.parents[child_id].append(node_id)
+        self.height = max(dungeon_map.nodes.keys()) + 1 if len(dungeon_map.nodes) > 0 else 0
+        self.roots = [node_id for node_id, node in enumerate(self.nodes) if node.y == 0]
+
+        # Nodes reachable from each node, including itself
+        self.reachable = [None] * len(self.nodes)
+        # Number of steps from each node to the nearest reachable node of each symbol
+        self.distances = [None] * len(self.nodes)
+        all_symbols = set(self.symbols)
+        for node_id in reversed(range(len(self.nodes))):
+            reachable = {node_id}
+            distances = {symbol: math.inf for symbol in all_symbols}
+            for child_id in self.children[node_id]:
+                reachable |= self.reachable[child_id]
+                for symbol, distance in self.distances[child_id].items():
+                    if distance + 1 < distances[symbol]:
+                        distances[symbol] = distance + 1
+            distances[self.symbols[node_id]] = 0
+            self.reachable[node_id] = frozenset(reachable)
+            self.distances[node_id] = distances
+
+        self._path_tables = {}
+
+    def get_node_id(self, node):
+        return self.node_ids.get((node.x, node.y))
+
+    def distance_to(self, node, symbol):
+        node_id = self.get_node_id(node)
+        if node_id is None:
+            return math.inf
+        return self.distances[node_id].get(symbol, math.inf)
+
+    def can_reach(self, node, target):
+        node_id = self.get_node_id(node)
+        target_id = self.get_node_id(target)
+        return node_id is not None and target_id in self.reachable[node_id]
+
+    def get_best_paths(self, node_rewards, k=1, start=None, min_counts=None):
+        """Find the highest scoring paths to the top of the map
+
+        :param node_rewards: the reward for visiting a node, by map symbol
+        :type node_rewards: dict(str, float)
+        :param k: the number of paths to return
+        :type k: int
+        :param start: the node to route from, which is not part of the paths. If None, paths start on the first row.
+        :type start: Node
+        :param min_counts: the minimum number of nodes of each symbol that a path must visit, e.g. {'R': 1}
+        :type min_counts: dict(str, int)
+        :return: up to k (score, path) pairs, best first, where each path is a list of nodes
+        :rtype: list(tuple(float, list(Node)))
+        """
+        if start is None:
+            first_ids = self.roots
+        else:
+            start_id = self.get_node_id(start)
+            if start_id is None:
+                return []
+            first_ids = self.children[start_id]
+        required = tuple(sorted((min_counts or {}).items()))
+        table = self._get_path_table(node_rewards, k, required)
+        candidates = []
+        for node_id in first_ids:
+            for counts, entries in table[node_id].items():
+                if all(count >= minimum for count, (symbol, minimum) in zip(counts, required)):
+                    candidates.extend(entries)
+        best = heapq.nlargest(k, candidates, key=lambda entry: entry[0])
+        return [(score, [self.nodes[node_id] for node_id in path]) for score, path in best]
+
+    def get_best_path(self, node_rewards, start=None, min_counts=None):
+        paths = self.get_best_paths(node_rewards, 1, start, min_counts)
+        if len(paths) == 0:
+            return None
+        return paths[0][1]
+
+    def _get_path_table(self, node_rewards, k, required):
+        # For each node, the k best paths from it to the top row, grouped by how many of the required symbols
+        # they visit (capped at the required amount). Tables are cached, so replanning only merges a few entries.
+        cache_key = (tuple(sorted(node_rewards.items())), k, required)
+        table = self._path_tables.get(cache_key)
+        if table is not None:
+            return table
+        table = [None] * len(self.nodes)
+        for node_id in reversed(range(len(self.nodes))):
+            symbol = self.symbols[node_id]
+            reward = node_rewards[symbol]
+            own_counts = tuple(1 if symbol == required_symbol else 0 for required_symbol, _ in required)
+            node_table = {}
+            if self.nodes[node_id].y == self.height - 1:
+                node_table[tuple(min(count, minimum) for count, (_, minimum) in zip(own_counts, required))] = [(reward, (node_id,))]
+            else:
+                for child_id in self.children[node_id]:
+                    for counts, entries in table[child_id].items():
+                        new_counts = tuple(min(count + own, minimum) for count, own, (_, minimum) in zip(counts, own_counts, required))
+                        bucket = node_table.setdefault(new_counts, [])
+                        for score, path in entries:
+                            bucket.append((score + reward, (node_id,) + path))
+                for counts in node_table:
+                    node_table[counts] = heapq.nlargest(k, node_table[counts], key=lambda entry: entry[0])
+            table[node_id] = node_table
+        self._path_tables[cache_key] = table
+        return table
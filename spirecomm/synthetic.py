@@ -0,0 +1,373 @@
+import json
+import random
+
+from spirecomm.spire.screen import ScreenType, SCREEN_CLASSES
+
+
+# (card id, type, cost, has target, rarity)
+CARD_POOL = [
+    ("Strike_R", "ATTACK", 1, True, "BASIC"),
+    ("Defend_R", "SKILL", 1, False, "BASIC"),
+    ("Bash", "ATTACK", 2, True, "BASIC"),
+    ("Anger", "ATTACK", 0, True, "COMMON"),
+    ("Cleave", "ATTACK", 1, False, "COMMON"),
+    ("Pommel Strike", "ATTACK", 1, True, "COMMON"),
+    ("Shrug It Off", "SKILL", 1, False, "COMMON"),
+    ("Inflame", "POWER", 1, False, "UNCOMMON"),
+    ("Carnage", "ATTACK", 2, True, "UNCOMMON"),
+    ("Offering", "SKILL", 0, False, "RARE"),
+    ("Strike_G", "ATTACK", 1, True, "BASIC"),
+    ("Defend_G", "SKILL", 1, False, "BASIC"),
+    ("Neutralize", "ATTACK", 0, True, "BASIC"),
+    ("Survivor", "SKILL", 1, False, "BASIC"),
+    ("Backflip", "SKILL", 1, False, "COMMON"),
+    ("Blade Dance", "SKILL", 1, False, "COMMON"),
+    ("Dagger Spray", "ATTACK", 1, False, "COMMON"),
+    ("Footwork", "POWER", 1, False, "UNCOMMON"),
+    ("Adrenaline", "SKILL", 0, False, "RARE"),
+    ("Strike_B", "ATTACK", 1, True, "BASIC"),
+    ("Defend_B", "SKILL", 1, False, "BASIC"),
+    ("Zap", "SKILL", 1, False, "BASIC"),
+    ("Dualcast", "SKILL", 1, False, "BASIC"),
+    ("Ball Lightning", "ATTACK", 1, True, "COMMON"),
+    ("Coolheaded", "SKILL", 1, False, "COMMON"),
+    ("Defragment", "POWER", 1, False, "UNCOMMON"),
+    ("Glacier", "SKILL", 2, False, "UNCOMMON"),
+    ("Swift Strike", "ATTACK", 0, True, "UNCOMMON"),
+    ("Wound", "STATUS", -2, False, "SPECIAL"),
+    ("Dazed", "STATUS", -2, False, "SPECIAL"),
+    ("Injury", "CURSE", -2, False, "CURSE"),
+]
+
+# (monster name, monster id, max HP)
+MONSTER_POOL = [
+    ("Cultist", "Cultist", 50),
+    ("Jaw Worm", "JawWorm", 44),
+    ("Louse", "FuzzyLouseNormal", 15),
+    ("Acid Slime (M)", "AcidSlime_M", 30),
+    ("Gremlin Nob", "GremlinNob", 85),
+    ("Sentry", "Sentry", 40),
+    ("Byrd", "Byrd", 27),
+    ("Darkling", "Darkling", 52),
+]
+
+POWER_POOL = ["Strength", "Dexterity", "Vulnerable", "Weakened", "Frail", "Ritual", "Metallicize", "Plated Armor",
+              "Artifact", "Curl Up", "Angry", "Thorns", "Intangible", "Buffer"]
+
+RELIC_POOL = ["Burning Blood", "Ring of the Snake", "Cracked Core", "Anchor", "Bag of Marbles", "Vajra", "Lantern",
+              "Akabeko", "Bronze Scales", "Happy Flower", "Pen Nib", "Orichalcum", "Kunai", "Shuriken", "Ornithopter",
+              "Meat on the Bone", "Letter Opener", "Ice Cream", "Runic Pyramid", "Black Star", "Sozu", "Ectoplasm",
+              "Coffee Dripper", "Fusion Hammer", "Philosopher's Stone", "Velvet Choker", "Cursed Key", "Busted Crown"]
+
+# (potion id, requires target)
+POTION_POOL = [("Fire Potion", True), ("Block Potion", False), ("Strength Potion", False), ("Fear Potion", True),
+               ("Swift Potion", False), ("Weak Potion", True), ("Energy Potion", False)]
+
+ORB_POOL = [("Lightning", 8, 3), ("Frost", 5, 2), ("Dark", 6, 6), ("Plasma", 2, 1)]
+
+MAP_SYMBOLS = "MMMM??$RE"
+
+
+class StateGenerator:
+    """Generates valid Communication Mod messages for every screen type, at tunable sizes
+
+    The output only depends on the seed and the sequence of calls. The deck, relics and map are generated once and
+    shared by every message, as in a real run; everything else is generated per message.
+    """
+
+    def __init__(self, seed=0, deck_size=30, hand_size=7, monsters=3, powers=3, relics=10, potions=3, choices=3,
+                 orbs=0, pile_size=None, map_height=15, map_width=7, map_paths=6, act=1):
+        """
+        :param seed: the seed for all random choices
+        :type seed: int
+        :param deck_size: the number of cards in the deck, and in grid select screens
+        :type deck_size: int
+        :param hand_size: the number of cards in hand during combat
+        :type hand_size: int
+        :param monsters: the number of monsters in combat
+        :type monsters: int
+        :param powers: the number of powers on the player and on each monster
+        :type powers: int
+        :param relics: the number of relics the player has
+        :type relics: int
+        :param potions: the number of potion slots
+        :type potions: int
+        :param choices: the number of options on choice screens: events, card rewards, combat rewards, shop items
+        :type choices: int
+        :param orbs: the number of orbs the player has
+        :type orbs: int
+        :param pile_size: the number of cards in each of the draw, discard and exhaust piles; by default, split from the deck
+        :type pile_size: int
+        """
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.deck_size = deck_size
+        self.hand_size = hand_size
+        self.num_monsters = monsters
+        self.num_powers = powers
+        self.num_relics = relics
+        self.num_potions = potions
+        self.num_choices = choices
+        self.num_orbs = orbs
+        self.pile_size = pile_size if pile_size is not None else max(deck_size - hand_size, 0) // 3
+        self.act = act
+        self.floor = 1 + (act - 1) * 17
+        self.deck = [self.make_card() for _ in range(deck_size)]
+        self.relics = [self.make_relic(i) for i in range(relics)]
+        self.map = self.make_map(map_height, map_width, map_paths)
+
+    def make_uuid(self):
+        value = "{:032x}".format(self.random.getrandbits(128))
+        return "-".join([value[:8], value[8:12], value[12:16], value[16:20], value[20:]])
+
+    def make_card(self, price=None, is_playable=None):
+        card_id, card_type, cost, has_target, rarity = self.random.choice(CARD_POOL)
+        upgrades = 1 if card_type in ("ATTACK", "SKILL", "POWER") and self.random.random() < 0.25 else 0
+        card = {
+            "id": card_id,
+            "name": card_id + "+" if upgrades > 0 else card_id,
+            "type": card_type,
+            "rarity": rarity,
+            "upgrades": upgrades,
+            "has_target": has_target,
+            "cost": cost,
+            "uuid": self.make_uuid(),
+            "misc": 0,
+            "is_playable": cost >= 0 if is_playable is None else is_playable,
+            "exhausts": card_id in ("Offering", "Adrenaline", "Swift Strike")
+        }
+        if price is not None:
+            card["price"] = price
+        return card
+
+    def make_relic(self, index=None, price=None):
+        if index is None:
+            relic_id = self.random.choice(RELIC_POOL)
+        else:
+            # Every relic in a collection is different, with numbered copies once the pool runs out
+            relic_id = RELIC_POOL[index % len(RELIC_POOL)]
+            if index >= len(RELIC_POOL):
+                relic_id = "{} {}".format(relic_id, index // len(RELIC_POOL))
+        relic = {"id": relic_id, "name": relic_id, "counter": -1}
+        if price is not None:
+            relic["price"] = price
+        return relic
+
+    def make_potion(self, price=None):
+        potion_id, requires_target = self.random.choice(POTION_POOL)
+        potion = {"id": potion_id, "name": potion_id, "can_use": True, "can_discard": True, "requires_target": requires_target}
+        if price is not None:
+            potion["price"] = price
+        return potion
+
+    def make_potion_slots(self):
+        potions = []
+        for _ in range(self.num_potions):
+            if self.random.random() < 0.6:
+                potions.append(self.make_potion())
+            else:
+                potions.append({"id": "Potion Slot", "name": "Potion Slot", "can_use": False, "can_discard": False,
+                                "requires_target": False})
+        return potions
+
+    def make_powers(self, count):
+        power_ids = self.random.sample(POWER_POOL, min(count, len(POWER_POOL)))
+        return [{"id": power_id, "name": power_id, "amount": self.random.randint(1, 5), "damage": 0, "misc": 0,
+                 "just_applied": False} for power_id in power_ids]
+
+    def make_monster(self):
+        name, monster_id, max_hp = self.random.choice(MONSTER_POOL)
+        attacking = self.random.random() < 0.6
+        base_damage = self.random.randint(5, 15) if attacking else -1
+        return {
+            "name": name,
+            "id": monster_id,
+            "max_hp": max_hp,
+            "current_hp": self.random.randint(1, max_hp),
+            "block": self.random.choice([0, 0, 5, 10]),
+            "intent": self.random.choice(["ATTACK", "ATTACK_BUFF", "ATTACK_DEFEND"]) if attacking
+            else self.random.choice(["BUFF", "DEBUFF", "DEFEND"]),
+            "half_dead": False,
+            "is_gone": False,
+            "move_id": self.random.randint(1, 5),
+            "last_move_id": self.random.randint(1, 5),
+            "second_last_move_id": self.random.randint(1, 5),
+            "move_base_damage": base_damage,
+            "move_adjusted_damage": base_damage,
+            "move_hits": self.random.randint(1, 3) if attacking else 0,
+            "powers": self.make_powers(self.num_powers)
+        }
+
+    def make_map(self, height, width, paths):
+        edges = {}
+        for _ in range(paths):
+            x = self.random.randrange(width)
+            for y in range(height):
+                edges.setdefault((x, y), set())
+                if y < height - 1:
+                    next_x = min(width - 1, max(0, x + self.random.choice((-1, 0, 1))))
+                    edges[(x, y)].add(next_x)
+                    x = next_x
+        nodes = []
+        for (x, y), children in sorted(edges.items(), key=lambda item: (item[0][1], item[0][0])):
+            if y == 0:
+                symbol = "M"
+            elif y == height - 1:
+                symbol = "R"
+            else:
+                symbol = self.random.choice(MAP_SYMBOLS)
+            nodes.append({"x": x, "y": y, "symbol": symbol, "children": [{"x": child_x, "y": y + 1} for child_x in sorted(children)],
+                          "parents": []})
+        return nodes
+
+    def make_combat_state(self, hand=None):
+        piles = [self.random.sample(self.deck, min(self.pile_size, len(self.deck))) for _ in range(3)]
+        if hand is None:
+            hand = [self.make_card() for _ in range(self.hand_size)]
+        orbs = []
+        for _ in range(self.num_orbs):
+            orb_id, evoke_amount, passive_amount = self.random.choice(ORB_POOL)
+            orbs.append({"id": orb_id, "name": orb_id, "evoke_amount": evoke_amount, "passive_amount": passive_amount})
+        return {
+            "player": {"max_hp": 80, "current_hp": self.random.randint(1, 80), "block": self.random.choice([0, 0, 5]),
+                       "energy": self.random.randint(0, 3), "powers": self.make_powers(self.num_powers), "orbs": orbs},
+            "monsters": [self.make_monster() for _ in range(self.num_monsters)],
+            "draw_pile": piles[0],
+            "discard_pile": piles[1],
+            "exhaust_pile": piles[2],
+            "hand": hand,
+            "limbo": [],
+            "turn": self.random.randint(1, 10),
+            "cards_discarded_this_turn": 0
+        }
+
+    def make_screen(self, screen_type):
+        """Make the screen state, choice list, available commands and room phase for a screen type
+
+        :return: the screen state, choice list (or None), available commands, and room phase
+        :rtype: tuple(dict, list(str), list(str), str)
+        """
+        choices = self.num_choices
+        if screen_type == ScreenType.EVENT:
+            options = [{"text": "[Option {}] Something happens.".format(i), "label": "Option {}".format(i),
+                        "disabled": False, "choice_index": i} for i in range(choices)]
+            screen_state = {"event_name": "Synthetic Event", "event_id": "Synthetic Event", "body_text": "", "options": options}
+            return screen_state, [option["label"].lower() for option in options], ["choose"], "EVENT"
+        elif screen_type == ScreenType.CHEST:
+            screen_state = {"chest_type": self.random.choice(["SmallChest", "MediumChest", "LargeChest"]), "chest_open": False}
+            return screen_state, ["open"], ["choose", "proceed"], "COMPLETE"
+        elif screen_type == ScreenType.SHOP_ROOM:
+            return {}, ["shop"], ["choose", "proceed"], "COMPLETE"
+        elif screen_type == ScreenType.REST:
+            rest_options = ["rest", "smith", "lift", "dig", "toke", "recall"][:max(choices, 1)]
+            return {"has_rested": False, "rest_options": rest_options}, list(rest_options), ["choose", "proceed"], "INCOMPLETE"
+        elif screen_type == ScreenType.CARD_REWARD:
+            cards = [self.make_card() for _ in range(choices)]
+            screen_state = {"cards": cards, "bowl_available": False, "skip_available": True}
+            return screen_state, [card["name"].lower() for card in cards], ["choose", "skip"], "COMPLETE"
+        elif screen_type == ScreenType.COMBAT_REWARD:
+            rewards = []
+            for i in range(choices):
+                kind = i % 4
+                if kind == 0:
+                    rewards.append({"reward_type": "GOLD", "gold": self.random.randint(10, 30)})
+                elif kind == 1:
+                    rewards.append({"reward_type": "CARD"})
+                elif kind == 2:
+                    rewards.append({"reward_type": "POTION", "potion": self.make_potion()})
+                else:
+                    rewards.append({"reward_type": "RELIC", "relic": self.make_relic()})
+            return {"rewards": rewards}, [reward["reward_type"].lower() for reward in rewards], ["choose", "proceed"], "COMPLETE"
+        elif screen_type == ScreenType.MAP:
+            next_nodes = [node for node in self.map if node["y"] == 0]
+            # At the start of an act, the current node sits below the first row
+            screen_state = {"current_node": {"x": 0, "y": -1, "symbol": None}, "next_nodes": [{"x": node["x"], "y": node["y"], "symbol": node["symbol"]} for node in next_nodes],
+                            "boss_available": False, "first_node_chosen": False}
+            return screen_state, ["x={}".format(node["x"]) for node in next_nodes], ["choose"], "COMPLETE"
+        elif screen_type == ScreenType.BOSS_REWARD:
+            relics = [self.make_relic() for _ in range(choices)]
+            return {"relics": relics}, [relic["name"].lower() for relic in relics], ["choose", "skip"], "COMPLETE"
+        elif screen_type == ScreenType.SHOP_SCREEN:
+            cards = [self.make_card(price=self.random.randint(45, 160)) for _ in range(choices)]
+            relics = [self.make_relic(price=self.random.randint(140, 300)) for _ in range(choices)]
+            potions = [self.make_potion(price=self.random.randint(50, 80)) for _ in range(choices)]
+            screen_state = {"cards": cards, "relics": relics, "potions": potions, "purge_available": True, "purge_cost": 75}
+            choice_list = [item["name"].lower() for item in cards + relics + potions] + ["purge"]
+            return screen_state, choice_list, ["choose", "leave"], "COMPLETE"
+        elif screen_type == ScreenType.GRID:
+            screen_state = {"cards": self.deck, "selected_cards": [], "num_cards": min(choices, len(self.deck)), "any_number": False,
+                            "confirm_up": False, "for_upgrade": False, "for_transform": False, "for_purge": True}
+            return screen_state, [card["name"].lower() for card in self.deck], ["choose"], "COMPLETE"
+        elif screen_type == ScreenType.HAND_SELECT:
+            return None, None, ["choose", "confirm"], "COMBAT"
+        elif screen_type == ScreenType.GAME_OVER:
+            return {"score": self.random.randint(0, 1500), "victory": False}, None, ["proceed"], "COMPLETE"
+        elif screen_type == ScreenType.COMPLETE:
+            return {}, None, ["proceed"], "COMPLETE"
+        else:
+            return {}, None, ["play", "end", "potion"], "COMBAT"
+
+    def make_game_state(self, screen_type):
+        """Make a game state on a screen of the given type
+
+        :return: the game state JSON object and the available commands
+        :rtype: tuple(dict, list(str))
+        """
+        screen_state, choice_list, available_commands, room_phase = self.make_screen(screen_type)
+        game_state = {
+            "current_hp": self.random.randint(1, 80),
+            "max_hp": 80,
+            "floor": self.floor,
+            "act": self.act,
+            "gold": self.random.randint(0, 500),
+            "seed": self.seed,
+            "class": self.random.choice(["IRONCLAD", "THE_SILENT", "DEFECT"]),
+            "ascension_level": 0,
+            "relics": self.relics,
+            "deck": self.deck,
+            "map": self.map,
+            "potions": self.make_potion_slots(),
+            "act_boss": "The Guardian",
+            "is_screen_up": screen_type != ScreenType.NONE,
+            "screen_type": screen_type.name,
+            "room_phase": room_phase,
+            "room_type": "MonsterRoom" if room_phase == "COMBAT" else "EventRoom",
+            "action_phase": "WAITING_ON_USER"
+        }
+        if room_phase == "COMBAT":
+            combat_state = self.make_combat_state()
+            game_state["combat_state"] = combat_state
+            if screen_type == ScreenType.HAND_SELECT:
+                hand = combat_state["hand"]
+                screen_state = {"hand": hand, "selected": [], "max_cards": min(self.num_choices, len(hand)), "can_pick_zero": False}
+                choice_list = [card["name"].lower() for card in hand]
+        game_state["screen_state"] = screen_state
+        if choice_list is not None:
+            game_state["choice_list"] = choice_list
+        return game_state, available_commands
+
+    def make_message(self, screen_type=ScreenType.NONE):
+        """Make a full message from Communication Mod, as the Coordinator receives it
+
+        :param screen_type: the screen to generate
+        :type screen_type: ScreenType
+        :return: the message, as a JSON object
+        :rtype: dict
+        """
+        game_state, available_commands = self.make_game_state(screen_type)
+        return {"available_commands": available_commands, "ready_for_command": True, "in_game": True, "game_state": game_state}
+
+    def make_messages(self, count, screen_types=None):
+        """Make messages as JSON strings, cycling through the given screen types
+
+        :param count: the number of messages
+        :type count: int
+        :param screen_types: the screen types to cycle through, by default every one in SCREEN_CLASSES
+        :type screen_types: list(ScreenType)
+        :return: the messages
+        :rtype: iterator(str)
+        """
+        if screen_types is None:
+            screen_types = list(SCREEN_CLASSES)
+        for i in range(count):
+            yield json.dumps(self.make_message(screen_types[i % len(screen_types)]))
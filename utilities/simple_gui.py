@@ -1,5 +1,7 @@
 import os
 import collections
+import json
+import time
 
 import spirecomm.communication.coordinator as coord
 
@@ -9,20 +11,177 @@ from kivy.app import App
 from kivy.uix.textinput import TextInput
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
+from kivy.uix.label import Label
+from kivy.uix.scrollview import ScrollView
+from kivy.uix.togglebutton import ToggleButton
+from kivy.uix.treeview import TreeView, TreeViewLabel
 from kivy.clock import Clock
 from kivy.core.window import Window
 
 
+MAX_VALUE_LENGTH = 80
+
+MAX_DIFF_LINES = 500
+
+
+def format_value(value):
+    text = json.dumps(value)
+    if len(text) > MAX_VALUE_LENGTH:
+        text = text[:MAX_VALUE_LENGTH - 3] + "..."
+    return text
+
+
+def diff_states(old, new, path=""):
+    """Find every value which differs between two JSON states
+
+    :param old: the earlier state
+    :param new: the later state
+    :param path: the path of these states within the whole state
+    :type path: str
+    :return: the path, earlier value and later value of each difference, with None for missing values
+    :rtype: iterator(tuple(str, object, object))
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old.keys() | new.keys():
+            yield from diff_states(old.get(key), new.get(key), "{}.{}".format(path, key) if path else str(key))
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            yield from diff_states(old_item, new_item, "{}[{}]".format(path, index))
+    elif old != new:
+        yield path, old, new
+
+
+def describe_node(key, value):
+    if isinstance(value, dict):
+        return "{}: {{{} keys}}".format(key, len(value))
+    if isinstance(value, list):
+        return "{}: [{} items]".format(key, len(value))
+    return "{}: {}".format(key, format_value(value))
+
+
+class MessageHistory:
+    """Every message received, stored as the raw text and only parsed or formatted when viewed"""
+
+    def __init__(self, parsed_cache_size=4):
+        self.messages = []
+        self.parsed_cache = collections.OrderedDict()
+        self.parsed_cache_size = parsed_cache_size
+
+    def __len__(self):
+        return len(self.messages)
+
+    def append(self, message):
+        self.messages.append(message)
+
+    def get_raw(self, index):
+        return self.messages[index]
+
+    def get_parsed(self, index):
+        parsed = self.parsed_cache.get(index)
+        if parsed is None:
+            parsed = json.loads(self.messages[index])
+            self.parsed_cache[index] = parsed
+            while len(self.parsed_cache) > self.parsed_cache_size:
+                self.parsed_cache.popitem(last=False)
+        else:
+            self.parsed_cache.move_to_end(index)
+        return parsed
+
+    def get_pretty(self, index):
+        return json.dumps(self.get_parsed(index), indent=2, sort_keys=True)
+
+    def get_diff_text(self, index):
+        if index == 0:
+            return "First message: no earlier state to compare with"
+        differences = sorted(diff_states(self.get_parsed(index - 1), self.get_parsed(index)))
+        if len(differences) == 0:
+            return "No changes from the previous message"
+        lines = ["{}: {} -> {}".format(path, format_value(old), format_value(new))
+                 for path, old, new in differences[:MAX_DIFF_LINES]]
+        if len(differences) > MAX_DIFF_LINES:
+            lines.append("... and {} more changes".format(len(differences) - MAX_DIFF_LINES))
+        return "\n".join(lines)
+
+
+class StateTree(TreeView):
+    """A collapsible tree of a JSON state, which only creates the nodes of a branch when it is opened"""
+
+    def __init__(self):
+        super().__init__(hide_root=True, size_hint_y=None)
+        self.bind(minimum_height=self.setter("height"))
+        self.open_paths = {""}
+
+    def show(self, state):
+        for node in list(self.root.nodes):
+            self.remove_node(node)
+        self.add_children(self.root, state, "")
+
+    def add_children(self, parent, value, path):
+        items = value.items() if isinstance(value, dict) else enumerate(value)
+        for key, child in items:
+            child_path = "{}/{}".format(path, key)
+            node = TreeViewLabel(text=describe_node(key, child))
+            node.json_value = child
+            node.json_path = child_path
+            node.is_loaded = False
+            self.add_node(node, parent)
+            if isinstance(child, (dict, list)) and len(child) > 0:
+                node.is_leaf = False
+                # Branches open in the previous state are opened again, so that they can be watched across messages
+                if child_path in self.open_paths:
+                    self.toggle_node(node)
+
+    def on_node_expand(self, node):
+        self.open_paths.add(node.json_path)
+        if not node.is_loaded:
+            node.is_loaded = True
+            self.add_children(node, node.json_value, node.json_path)
+
+    def on_node_collapse(self, node):
+        self.open_paths.discard(node.json_path)
+
+
 class Base(BoxLayout):
 
-    def __init__(self, coordinator):
+    VIEW_MODES = ("Tree", "Diff", "Raw")
+
+    def __init__(self, coordinator, render_interval=0.25):
         super().__init__(orientation='vertical')
         self.coordinator = coordinator
+        self.history = MessageHistory()
+        # Rendering is throttled, and only ever shows one message, however many arrive between renders
+        self.render_interval = render_interval
+        self.last_render_time = 0.0
+        self.messages_waiting = False
+        self.rendered = None
+        self.viewed_index = None
+        self.view_mode = "Tree"
+
+        controls = BoxLayout(size_hint=(1, 1))
+        self.position_label = Label(text="No messages")
+        controls.add_widget(self.position_label)
+        for text, callback in (("<", self.show_previous), (">", self.show_next), ("Latest", self.show_latest)):
+            button = Button(text=text)
+            button.bind(on_press=callback)
+            controls.add_widget(button)
+        for mode in self.VIEW_MODES:
+            button = ToggleButton(text=mode, group="view_mode", state="down" if mode == self.view_mode else "normal",
+                                  allow_no_selection=False)
+            button.bind(on_press=self.change_view_mode)
+            controls.add_widget(button)
+        self.add_widget(controls)
+
+        self.state_tree = StateTree()
+        self.tree_scroll = ScrollView(size_hint=(1, 10))
+        self.tree_scroll.add_widget(self.state_tree)
 
         self.input_text = TextInput(size_hint=(1, 10))
         self.input_text.text = "blank"
         self.input_text.readonly = True
-        self.add_widget(self.input_text)
+
+        self.view_container = BoxLayout(size_hint=(1, 10))
+        self.view_container.add_widget(self.tree_scroll)
+        self.add_widget(self.view_container)
 
         self.history_text = TextInput(size_hint=(1, 2))
         self.add_widget(self.history_text)
@@ -40,10 +199,71 @@ class Base(BoxLayout):
         Window.bind(on_key_up=self.key_callback)
 
     def do_communication(self, dt):
+        # Every waiting message is kept, but only the one being viewed is ever parsed
         message = self.coordinator.get_next_raw_message()
-        if message is not None:
-            self.input_text.text = message
+        while message is not None:
+            self.history.append(message)
+            self.messages_waiting = True
+            message = self.coordinator.get_next_raw_message()
         self.coordinator.execute_next_action_if_ready()
+        if self.messages_waiting and time.monotonic() - self.last_render_time >= self.render_interval:
+            self.messages_waiting = False
+            self.last_render_time = time.monotonic()
+            self.update_position_label()
+            self.render()
+
+    def get_displayed_index(self):
+        if self.viewed_index is not None:
+            return self.viewed_index
+        if len(self.history) == 0:
+            return None
+        return len(self.history) - 1
+
+    def render(self):
+        index = self.get_displayed_index()
+        if index is None or (index, self.view_mode) == self.rendered:
+            return
+        self.rendered = (index, self.view_mode)
+        if self.view_mode == "Tree":
+            self.state_tree.show(self.history.get_parsed(index))
+        elif self.view_mode == "Diff":
+            self.input_text.text = self.history.get_diff_text(index)
+        else:
+            self.input_text.text = self.history.get_pretty(index)
+
+    def update_position_label(self):
+        index = self.get_displayed_index()
+        if index is not None:
+            following = " (following)" if self.viewed_index is None else ""
+            self.position_label.text = "Message {} of {}{}".format(index + 1, len(self.history), following)
+
+    def show_previous(self, instance=None):
+        index = self.get_displayed_index()
+        if index is not None and index > 0:
+            self.viewed_index = index - 1
+            self.update_position_label()
+            self.render()
+
+    def show_next(self, instance=None):
+        index = self.get_displayed_index()
+        if index is not None and index < len(self.history) - 1:
+            self.viewed_index = index + 1
+            self.update_position_label()
+            self.render()
+
+    def show_latest(self, instance=None):
+        self.viewed_index = None
+        self.update_position_label()
+        self.render()
+
+    def change_view_mode(self, instance):
+        self.view_mode = instance.text
+        self.view_container.clear_widgets()
+        if self.view_mode == "Tree":
+            self.view_container.add_widget(self.tree_scroll)
+        else:
+            self.view_container.add_widget(self.input_text)
+        self.render()
 
     def send_output(self, instance=None, text=None):
         if text is None: